@@ -0,0 +1,196 @@
+import argparse
+import numpy as np
+import pandas as pd
+import scipy.stats as stats
+from concurrent.futures import ProcessPoolExecutor
+
+from data_cleaning import DATA_COLUMNS, DATASET_NAME, dataset_version, partition_path
+from data_loader import dataset_partitions
+from tensor_store import natural_key
+
+AGGREGATES_NAME = 'sports_science_aggregates.npz'
+HISTOGRAM_BINS = 50
+KDE_GRID = 200
+
+
+def block_aggregates(values):
+    """
+    Computes the distribution, correlation and box-plot summaries of one activity/subject block.
+
+    Args:
+        values = (rows, channels) array of sensor values
+    Returns:
+        summary = dictionary of per-channel ranges, histogram densities, kde densities, box-plot statistics
+                  and the channel correlation matrix
+    """
+
+    values = values.astype(np.float64)
+    n_channels = values.shape[1]
+
+    low, high = values.min(axis=0), values.max(axis=0)
+    flat = high <= low
+    high = np.where(flat, low + 1.0, high)
+
+    histograms = np.empty((n_channels, HISTOGRAM_BINS))
+    kdes = np.zeros((n_channels, KDE_GRID))
+    for c in range(n_channels):
+        histograms[c] = np.histogram(values[:, c], bins=HISTOGRAM_BINS, range=(low[c], high[c]), density=True)[0]
+        if not flat[c]:
+            kdes[c] = stats.gaussian_kde(values[:, c])(np.linspace(low[c], high[c], KDE_GRID))
+
+    q1, median, q3 = np.percentile(values, [25, 50, 75], axis=0)
+    iqr = q3 - q1
+    # Whiskers reach the most extreme values within 1.5 IQR of the box, as in seaborn/matplotlib boxplots
+    whisker_low = np.where(values >= q1 - 1.5 * iqr, values, np.inf).min(axis=0)
+    whisker_high = np.where(values <= q3 + 1.5 * iqr, values, -np.inf).max(axis=0)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        correlation = np.corrcoef(values, rowvar=False)
+
+    return {
+        'range': np.stack([low, high], axis=1),
+        'histogram': histograms,
+        'kde': kdes,
+        'box': np.stack([whisker_low, q1, median, q3, whisker_high], axis=1),
+        'correlation': correlation,
+        'n_rows': len(values),
+    }
+
+
+def partition_aggregates(task):
+    """
+    Process pool worker that reads one partition and computes its summaries.
+
+    Args:
+        task = tuple of (dataset, activity, subject)
+    Returns:
+        result = tuple of (activity, subject, summary)
+    """
+
+    dataset, activity, subject = task
+    values = pd.read_parquet(partition_path(dataset, activity, subject), columns=DATA_COLUMNS).to_numpy()
+
+    return activity, subject, block_aggregates(values)
+
+
+def build_aggregates(dataset=DATASET_NAME, output=AGGREGATES_NAME, workers=None):
+    """
+    Precomputes the subject x activity x channel summaries behind the distribution, correlation and
+    boxplot panels and saves them as one compressed npz file.
+
+    Args:
+        dataset = root folder of the partitioned dataset
+        output = path of the npz file to write
+        workers = number of worker processes (defaults to the cpu count)
+    Returns:
+        None
+    """
+
+    version = dataset_version(dataset)
+    partitions, codes = dataset_partitions(dataset)
+    activities = sorted({activity for activity, _ in partitions}, key=natural_key)
+    subjects = sorted({subject for _, subject in partitions}, key=natural_key)
+    names = {code: name for name, code in codes.items()}
+
+    shape = (len(activities), len(subjects), len(DATA_COLUMNS))
+    arrays = {
+        'range': np.full(shape + (2,), np.nan, dtype=np.float32),
+        'histogram': np.full(shape + (HISTOGRAM_BINS,), np.nan, dtype=np.float32),
+        'kde': np.full(shape + (KDE_GRID,), np.nan, dtype=np.float32),
+        'box': np.full(shape + (5,), np.nan, dtype=np.float32),
+        'correlation': np.full(shape + (len(DATA_COLUMNS),), np.nan, dtype=np.float32),
+        'n_rows': np.zeros(shape[:2], dtype=np.int64),
+    }
+
+    tasks = [(dataset, activity, subject) for activity, subject in partitions]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for activity, subject, summary in pool.map(partition_aggregates, tasks):
+            print(f"Activity: {activity}, Subject: {subject}, Rows: {summary['n_rows']}")
+            a, s = activities.index(activity), subjects.index(subject)
+            for key, value in summary.items():
+                arrays[key][a, s] = value
+
+    np.savez_compressed(output, activities=activities, activity_names=[names[activity] for activity in activities],
+                        subjects=subjects, columns=DATA_COLUMNS, dataset_version=version, **arrays)
+
+
+class AggregateCube:
+    """
+    Lookup over the summaries written by build_aggregates, indexed by activity name, subject and sensor column.
+    """
+
+    def __init__(self, path=AGGREGATES_NAME):
+
+        with np.load(path) as cube:
+            self.arrays = {key: cube[key] for key in cube.files}
+
+        self.activity_names = list(self.arrays['activity_names'])
+        self.subjects = list(self.arrays['subjects'])
+        self.columns = list(self.arrays['columns'])
+        self.dataset_version = str(self.arrays['dataset_version']) if 'dataset_version' in self.arrays else None
+
+    def position(self, activity_name, subject):
+
+        return self.activity_names.index(activity_name), self.subjects.index(subject)
+
+    def distribution(self, activity_name, subject, column):
+        """
+        Histogram and kde of one channel.
+
+        Returns:
+            bin_edges = histogram bin edges
+            density = histogram density per bin
+            grid = points the kde was evaluated at
+            kde = kde density on the grid
+        """
+
+        a, s = self.position(activity_name, subject)
+        c = self.columns.index(column)
+        low, high = self.arrays['range'][a, s, c]
+
+        return (np.linspace(low, high, HISTOGRAM_BINS + 1), self.arrays['histogram'][a, s, c],
+                np.linspace(low, high, KDE_GRID), self.arrays['kde'][a, s, c])
+
+    def correlation(self, activity_name, subject, columns):
+        """
+        Pearson correlation of every channel against the given columns, shaped like df.corr()[columns].
+        """
+
+        a, s = self.position(activity_name, subject)
+        positions = [self.columns.index(column) for column in columns]
+
+        return pd.DataFrame(self.arrays['correlation'][a, s][:, positions], index=self.columns, columns=columns)
+
+    def box_stats(self, activity_name, subject, column):
+        """
+        Box-plot statistics of one channel in the format expected by matplotlib's Axes.bxp.
+        """
+
+        a, s = self.position(activity_name, subject)
+        whisker_low, q1, median, q3, whisker_high = self.arrays['box'][a, s, self.columns.index(column)]
+
+        return {'whislo': whisker_low, 'q1': q1, 'med': median, 'q3': q3, 'whishi': whisker_high, 'fliers': []}
+
+    def has_block(self, activity_name, subject):
+
+        if activity_name not in self.activity_names or subject not in self.subjects:
+            return False
+
+        return self.arrays['n_rows'][self.position(activity_name, subject)] > 0
+
+
+def parse_args():
+
+    parser = argparse.ArgumentParser(description="Precompute the distribution, correlation and boxplot summaries.")
+    parser.add_argument('--dataset', default=DATASET_NAME, help="Root folder of the partitioned dataset")
+    parser.add_argument('--output', default=AGGREGATES_NAME, help="Path of the npz file to write")
+    parser.add_argument('--workers', type=int, default=None, help="Number of worker processes (defaults to the cpu count)")
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+
+    args = parse_args()
+    build_aggregates(args.dataset, args.output, args.workers)
+    print("Completed!")
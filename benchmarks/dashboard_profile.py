@@ -0,0 +1,104 @@
+import argparse
+import cProfile
+import json
+import os
+import pstats
+import runpy
+import sys
+import time
+from concurrent.futures import Future
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+import streamlit as st
+
+import render_cache
+
+# Dashboard functions whose cumulative time is reported, all defined inside streamlit_app.main
+STAGES = ['load_data', 'subject_activity_data', 'subject_activities_data', 'sensor_linechart', 'sensor_spectrum',
+          'sensor_cadence', 'sensor_3dplot', 'sensor_pearson_correlation', 'sensor_distribution', 'fatigue_chart',
+          'motion_boxplots', 'similar_segments', 'render_figure', 'main']
+
+
+class SynchronousExecutor:
+    """
+    Stand-in for the render thread pool that draws panels on the calling thread, since cProfile only sees the
+    thread it was enabled on.
+    """
+
+    def submit(self, fn, *args, **kwargs):
+
+        future = Future()
+        future.set_result(fn(*args, **kwargs))
+
+        return future
+
+
+def patch_widgets(selections):
+    """
+    Makes st.selectbox return the given option for widgets whose label contains a key of selections, so
+    that the bare-mode script run renders the selected view instead of the defaults.
+    """
+
+    selectbox = st.selectbox
+
+    def patched(label, options, index=0, key=None, **kwargs):
+        for label_part, option in selections.items():
+            if label_part in label:
+                return option
+        return selectbox(label, options, index=index, key=key, **kwargs)
+
+    st.selectbox = patched
+
+
+def profile_reruns(selections, reruns=2):
+    """
+    Runs the dashboard script headlessly several times in one process, so the first run is cold and the
+    following ones hit the dashboard's caches, and reports the cumulative time of each stage per run.
+
+    Args:
+        selections = dictionary of widget label fragment to selected option
+        reruns = number of script runs
+    Returns:
+        runs = list of dictionaries with the wall time and per-stage seconds of each run
+    """
+
+    patch_widgets(selections)
+    render_cache.render_pool = SynchronousExecutor()
+    app = os.path.join(REPO, 'streamlit_app.py')
+
+    runs = []
+    for rerun in range(reruns):
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        profiler.enable()
+        runpy.run_path(app, run_name='__main__')
+        profiler.disable()
+        wall = time.perf_counter() - start
+
+        stages = {}
+        for (filename, _, function), (_, _, _, cumulative, _) in pstats.Stats(profiler).stats.items():
+            if function in STAGES and os.path.basename(filename) in ('streamlit_app.py', 'render_cache.py'):
+                stages[function] = stages.get(function, 0.0) + cumulative
+
+        runs.append({'rerun': rerun, 'wall_seconds': wall, 'stages': stages})
+
+    return runs
+
+
+def parse_args():
+
+    parser = argparse.ArgumentParser(description="Profile one dashboard view headlessly, run from the data folder.")
+    parser.add_argument('--unit', default='Torso', help="Body unit to select")
+    parser.add_argument('--sensor', default='Accelerometers', help="Sensor family to select")
+    parser.add_argument('--reruns', type=int, default=2, help="Script runs in the same process")
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+
+    args = parse_args()
+    selections = {"body unit": args.unit, "Which sensors": args.sensor}
+    print(json.dumps(profile_reruns(selections, args.reruns)))
@@ -0,0 +1,198 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from os.path import join
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+REPO = os.path.dirname(BENCHMARKS)
+sys.path.insert(0, REPO)
+
+from aggregates import AGGREGATES_NAME, build_aggregates
+from data_cleaning import DATASET_NAME, dataset_version, ingest_csv, ingest_parquet
+from fatigue import FATIGUE_NAME, build_fatigue_index
+from features import FEATURES_NAME, build_feature_matrix
+from peaks import PEAK_INDEX_NAME, build_peak_index
+from segment_search import EMBEDDING_DIMENSIONS, SEGMENT_INDEX_NAME, build_segment_index
+from shared_data import SHARED_DATASET_NAME, build_shared_dataset, iter_partition_blocks
+from spectra import SPECTRA_NAME, build_spectra
+from synthetic_data import N_SEGMENTS, generate
+from tensor_store import TENSOR_STORE_NAME, build_tensor_store
+
+UNITS = ['Torso', 'Arms', 'Legs']
+REGRESSION_THRESHOLD = 1.10
+
+
+def timed(function, *args):
+    """
+    Runs a function once and returns its wall time in seconds.
+    """
+
+    start = time.perf_counter()
+    function(*args)
+
+    return time.perf_counter() - start
+
+
+def git_commit():
+
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def profile_dashboard(folder, unit, reruns):
+    """
+    Profiles one dashboard view in a fresh process whose working directory is the given data folder, so
+    that the dashboard picks up exactly the artifacts in that folder.
+    """
+
+    env = dict(os.environ, MPLBACKEND='Agg', PYTHONPATH=REPO)
+    result = subprocess.run([sys.executable, join(BENCHMARKS, 'dashboard_profile.py'), '--unit', unit, '--reruns', str(reruns)],
+                            cwd=folder, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Dashboard profile failed for {unit} in {folder}:\n{result.stderr}")
+
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def run_benchmarks(workdir, scale, workers=None, reruns=2, n_segments=N_SEGMENTS):
+    """
+    Generates synthetic data at the given scale, times each ingestion and precomputation stage, and profiles
+    the Torso, Arms and Legs dashboard views against the csv, the parquet dataset and the fully precomputed
+    artifacts.
+
+    Args:
+        workdir = folder for the synthetic data and outputs
+        scale = multiple of the original 8 subjects
+        n_segments = segment files per activity and subject
+        workers = worker processes for the ingestion stages
+        reruns = dashboard script runs per view (the first is cold)
+    Returns:
+        results = dictionary ready to be saved as json
+    """
+
+    data = join(workdir, 'data')
+    csv_folder = join(workdir, 'csv')
+    parquet_folder = join(workdir, 'parquet')
+    os.makedirs(csv_folder, exist_ok=True)
+    os.makedirs(parquet_folder, exist_ok=True)
+
+    stages = {}
+    stages['generate'] = timed(generate, data, scale, n_segments)
+    print(f"Generated scale {scale} data in {stages['generate']:.1f}s")
+
+    dataset = join(parquet_folder, DATASET_NAME)
+    stages['ingest_parquet'] = timed(ingest_parquet, data, dataset, workers, False, True)
+    stages['ingest_parquet_unchanged'] = timed(ingest_parquet, data, dataset, workers)
+    stages['ingest_csv'] = timed(ingest_csv, data, join(csv_folder, f'{DATASET_NAME}.csv'), workers)
+
+    dashboard = {'csv': {}, 'parquet': {}, 'precomputed': {}}
+    for unit in UNITS:
+        dashboard['csv'][unit] = profile_dashboard(csv_folder, unit, reruns)
+        dashboard['parquet'][unit] = profile_dashboard(parquet_folder, unit, reruns)
+
+    stages['build_tensor_store'] = timed(build_tensor_store, dataset, join(parquet_folder, TENSOR_STORE_NAME))
+    stages['build_aggregates'] = timed(build_aggregates, dataset, join(parquet_folder, AGGREGATES_NAME), workers)
+    stages['build_peak_index'] = timed(build_peak_index, dataset, join(parquet_folder, PEAK_INDEX_NAME), workers)
+    stages['build_feature_matrix'] = timed(build_feature_matrix, dataset, join(parquet_folder, FEATURES_NAME))
+    stages['build_fatigue_index'] = timed(build_fatigue_index, dataset, join(parquet_folder, FATIGUE_NAME), workers)
+    stages['build_segment_index'] = timed(build_segment_index, dataset, join(parquet_folder, SEGMENT_INDEX_NAME), 'features', EMBEDDING_DIMENSIONS, workers)
+    stages['build_spectra'] = timed(build_spectra, dataset, join(parquet_folder, SPECTRA_NAME), workers)
+    stages['build_shared_dataset'] = timed(build_shared_dataset, iter_partition_blocks(dataset), join(parquet_folder, SHARED_DATASET_NAME), 'parquet', dataset_version(dataset))
+
+    for unit in UNITS:
+        dashboard['precomputed'][unit] = profile_dashboard(parquet_folder, unit, reruns)
+
+    return {
+        'commit': git_commit(),
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'scale': scale,
+        'segments': n_segments,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'stages': stages,
+        'dashboard': dashboard,
+    }
+
+
+def flatten(results):
+    """
+    Flattens benchmark results into {name: seconds}, e.g. dashboard/parquet/Arms/cold/sensor_linechart.
+    """
+
+    flat = {f'stages/{name}': seconds for name, seconds in results['stages'].items()}
+    for backend, units in results['dashboard'].items():
+        for unit, runs in units.items():
+            for run in runs:
+                state = 'cold' if run['rerun'] == 0 else f"warm{run['rerun']}"
+                flat[f'dashboard/{backend}/{unit}/{state}/wall'] = run['wall_seconds']
+                for stage, seconds in run['stages'].items():
+                    flat[f'dashboard/{backend}/{unit}/{state}/{stage}'] = seconds
+
+    return flat
+
+
+def compare(baseline, results, threshold=REGRESSION_THRESHOLD):
+    """
+    Prints every timing next to its baseline and flags the ones that got slower than the threshold ratio.
+
+    Returns:
+        regressions = names of the timings that regressed
+    """
+
+    old, new = flatten(baseline), flatten(results)
+    regressions = []
+    print(f"{'timing':<70} {'baseline':>10} {'current':>10} {'ratio':>7}")
+    for name in sorted(set(old) & set(new)):
+        ratio = new[name] / old[name] if old[name] > 0 else float('inf')
+        flag = ''
+        if ratio > threshold and new[name] - old[name] > 0.01:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print(f"{name:<70} {old[name]:>10.3f} {new[name]:>10.3f} {ratio:>7.2f}{flag}")
+
+    return regressions
+
+
+def parse_args():
+
+    parser = argparse.ArgumentParser(description="Benchmark ingestion and the dashboard on synthetic data.")
+    parser.add_argument('--scale', type=int, default=1, help="Multiple of the original 8 subjects (1 to 10)")
+    parser.add_argument('--segments', type=int, default=N_SEGMENTS, help="Segment files per activity and subject")
+    parser.add_argument('--workdir', default=None, help="Folder for the synthetic data and outputs (defaults to a temporary folder)")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes for the ingestion stages")
+    parser.add_argument('--reruns', type=int, default=2, help="Dashboard script runs per view, the first one cold")
+    parser.add_argument('--output', default=None, help="Results json (defaults to benchmarks/results/<commit>_scale<scale>.json)")
+    parser.add_argument('--compare', default=None, help="Baseline results json to compare against")
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+
+    args = parse_args()
+
+    if args.workdir is None:
+        with tempfile.TemporaryDirectory() as workdir:
+            results = run_benchmarks(workdir, args.scale, args.workers, args.reruns, args.segments)
+    else:
+        results = run_benchmarks(args.workdir, args.scale, args.workers, args.reruns, args.segments)
+
+    output = args.output or join(BENCHMARKS, 'results', f"{results['commit'][:10]}_scale{args.scale}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=1)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), results)
+        sys.exit(1 if regressions else 0)
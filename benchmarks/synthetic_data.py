@@ -0,0 +1,87 @@
+import argparse
+import os
+import numpy as np
+from os.path import join
+
+N_ACTIVITIES = 19
+N_SUBJECTS = 8
+N_SEGMENTS = 60
+SAMPLES_PER_SEGMENT = 125
+N_CHANNELS = 45
+SAMPLING_RATE = 25
+
+
+def synthetic_segment(rng, activity, subject, segment):
+    """
+    Generates one 5 second segment of the 45 sensor channels: a per-activity movement frequency with
+    per-subject amplitude, a gravity offset on the accelerometers, a slowly varying magnetic field and noise.
+
+    Args:
+        rng = numpy random generator
+        activity = activity number, starting at 1
+        subject = subject number, starting at 1
+        segment = segment number, starting at 1
+    Returns:
+        values = (125, 45) array
+    """
+
+    t = (np.arange(SAMPLES_PER_SEGMENT) + (segment - 1) * SAMPLES_PER_SEGMENT) / SAMPLING_RATE
+    frequency = 0.1 + 0.2 * activity
+    amplitude = 0.5 + 0.05 * activity * (1 + 0.1 * subject)
+    phases = rng.uniform(0, 2 * np.pi, N_CHANNELS)
+
+    values = amplitude * np.sin(2 * np.pi * frequency * t[:, None] + phases) \
+        + rng.normal(scale=0.2, size=(SAMPLES_PER_SEGMENT, N_CHANNELS))
+
+    for unit in range(5):
+        values[:, unit * 9] += 9.8
+        values[:, unit * 9 + 6:unit * 9 + 9] = 0.1 * values[:, unit * 9 + 6:unit * 9 + 9] \
+            + np.cos(2 * np.pi * 0.02 * t)[:, None] * 0.5
+
+    return values
+
+
+def generate(output, scale=1, n_segments=N_SEGMENTS, seed=0):
+    """
+    Writes a synthetic copy of the UCI Daily and Sports Activities data in its <activity>/<subject>/<segment>.txt
+    layout (a01..a19, p1..pN, s01..s60), with N = 8 x scale subjects and 125 comma-separated rows of 45 values per file.
+
+    Args:
+        output = data folder to write
+        scale = multiple of the original 8 subjects
+        n_segments = segment files per activity and subject
+        seed = random seed
+    Returns:
+        n_files = number of segment files written
+    """
+
+    rng = np.random.default_rng(seed)
+    n_files = 0
+
+    for activity in range(1, N_ACTIVITIES + 1):
+        for subject in range(1, N_SUBJECTS * scale + 1):
+            folder = join(output, f'a{activity:02d}', f'p{subject}')
+            os.makedirs(folder, exist_ok=True)
+            for segment in range(1, n_segments + 1):
+                np.savetxt(join(folder, f's{segment:02d}.txt'), synthetic_segment(rng, activity, subject, segment),
+                           delimiter=',', fmt='%.5f')
+                n_files += 1
+
+    return n_files
+
+
+def parse_args():
+
+    parser = argparse.ArgumentParser(description="Generate synthetic data in the UCI Daily and Sports Activities layout.")
+    parser.add_argument('--output', default='synthetic_data', help="Data folder to write")
+    parser.add_argument('--scale', type=int, default=1, help="Multiple of the original 8 subjects (1 to 10)")
+    parser.add_argument('--segments', type=int, default=N_SEGMENTS, help="Segment files per activity and subject")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed")
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+
+    args = parse_args()
+    print(f"Files written: {generate(args.output, args.scale, args.segments, args.seed)}")
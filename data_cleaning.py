@@ -1,68 +1,489 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
 import pandas as pd
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 from os import listdir
 from os.path import isfile, join
 
-if __name__ == "__main__":
+UNITS_CODES = ['T', 'RA', 'LA', 'RL', 'LL']
+SENSORS_CODES = ['xacc', 'yacc', 'zacc', 'xgyro', 'ygyro', 'zgyro', 'xmag', 'ymag', 'zmag']
+DATA_COLUMNS = [unit + '_' + sensor for unit in UNITS_CODES for sensor in SENSORS_CODES]
+
+ACTIVITIES_CODES = ['Sitting', 'Standing', 'Lying on Back', 'Lying on Right Side', 'Ascending Stairs',
+                    'Descending Stairs', 'Standing in an Elevator', 'Moving in an Elevator', 'Walking in a Parking Lot',
+                    'Walking on a Treadmill', 'Walking on a Treadmill with an Incline', 'Running on a Treadmill', 'Exercising on a Stepper',
+                    'Exercising on a Cross Trainer', 'Cycling on an Exercise Bike in a Horizontal Position', 'Cycling on an Exercise Bike in a Vertical Position',
+                    'Rowing', 'Jumping', 'Playing Basketball']
+
+DATASET_NAME = 'sports_science_dataset'
+PARTITION_FILE = 'part-0.parquet'
+MANIFEST_FILE = '_manifest.json'
+
+
+def list_folders(path):
+    """
+    Lists the sub folders of a directory in sorted order.
+
+    Args:
+        path = directory to list
+    Returns:
+        folders = sorted names of the folders inside path
+    """
+
+    return sorted(f for f in listdir(path) if not isfile(join(path, f)))
+
+
+def activities_mapping(activity_folders):
+    """
+    Maps the UCI activity folder codes (a01...a19) to readable activity names by their number, so that a
+    data folder holding only some of the activities (e.g. a subset) still gets the right names.
+
+    Args:
+        activity_folders = activity folder names found in the data folder
+    Returns:
+        mapping = dictionary of activity folder code to activity name
+    """
+
+    return {folder: ACTIVITIES_CODES[int(folder[1:]) - 1] for folder in activity_folders}
+
+
+def partition_path(output, activity, subject):
+    """
+    Builds the path of the columnar file holding one activity/subject block.
+
+    Args:
+        output = root folder of the partitioned dataset
+        activity = activity folder code, e.g. a01
+        subject = subject folder code, e.g. p1
+    Returns:
+        path = path of the partition file
+    """
+
+    return join(output, f'activity={activity}', f'subject={subject}', PARTITION_FILE)
+
+
+def list_segment_files(path, activity, subject):
+    """
+    Lists the segment files of one activity/subject block in sorted order.
+
+    Args:
+        path = root of the downloaded data folder
+        activity = activity folder code
+        subject = subject folder code
+    Returns:
+        segment_files = sorted segment file names, e.g. s01.txt
+    """
+
+    block_path = join(path, activity, subject)
+
+    return sorted(f for f in listdir(block_path) if isfile(join(block_path, f)))
+
+
+def read_block(path, activity, subject, segment_files=None):
+    """
+    Reads the segment files of one activity/subject block and compiles them with a single concatenation.
+
+    Args:
+        path = root of the downloaded data folder
+        activity = activity folder code
+        subject = subject folder code
+        segment_files = segment file names to read (defaults to every file in the block)
+    Returns:
+        block = dataframe of float32 sensor columns plus a categorical segment column
+    """
+
+    block_path = join(path, activity, subject)
+    if segment_files is None:
+        segment_files = list_segment_files(path, activity, subject)
+
+    segments = [pd.read_csv(join(block_path, segment), names=DATA_COLUMNS, header=None, dtype=np.float32)
+                for segment in segment_files]
+    if not segments:
+        return pd.DataFrame({column: pd.Series(dtype=np.float32) for column in DATA_COLUMNS}).assign(
+            segment=pd.Categorical([]))
+    block = pd.concat(segments, ignore_index=True)
+
+    segment_names = [segment[:-4] for segment in segment_files]
+    segment_codes = np.repeat(np.arange(len(segments)), [len(segment) for segment in segments])
+    block['segment'] = pd.Categorical.from_codes(segment_codes, categories=segment_names)
+
+    return block
+
+
+def read_samples(lines, n_channels=len(DATA_COLUMNS), errors=sys.stderr):
+    """
+    Parses a live stream of samples in the layout of the segment files, one line of 45 comma-separated
+    channel values per sample, skipping blank lines. Lines with the wrong number of values or a value that is
+    not a number, e.g. a line cut short by a dropped connection, are reported and skipped instead of stopping
+    the stream.
+
+    Args:
+        lines = iterable of text lines
+        n_channels = number of values expected per line
+        errors = stream the skipped lines are reported to
+    Returns:
+        samples = generator of (n_channels,) float64 arrays
+    """
+
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+
+        try:
+            sample = np.array(line.split(','), dtype=np.float64)
+        except ValueError:
+            sample = None
+
+        if sample is None or sample.shape != (n_channels,):
+            print(f"Skipping line {number}: expected {n_channels} comma-separated numbers", file=errors)
+            continue
+
+        yield sample
+
+
+def ingest_block(task):
+    """
+    Process pool worker that reads one activity/subject block and writes it as a compressed parquet partition.
+    When only some segment files changed, the untouched segments are kept from the existing partition and
+    only the changed files are parsed.
+
+    Args:
+        task = tuple of (path, output, activity, subject, activity_name, segment_files, changed_files),
+               where changed_files is None to parse every segment file of the block
+    Returns:
+        summary = tuple of (activity, subject, number of rows written, number of files parsed)
+    """
+
+    path, output, activity, subject, activity_name, segment_files, changed_files = task
+    file_path = partition_path(output, activity, subject)
+
+    if changed_files is None or not isfile(file_path):
+        changed_files = segment_files
+        block = read_block(path, activity, subject, segment_files)
+    else:
+        segment_names = [segment[:-4] for segment in segment_files]
+        changed_names = [segment[:-4] for segment in changed_files]
+        existing = pd.read_parquet(file_path, columns=DATA_COLUMNS + ['segment'])
+        existing = existing[existing['segment'].isin(segment_names) & ~existing['segment'].isin(changed_names)]
+
+        block = pd.concat([existing.astype({'segment': str}),
+                           read_block(path, activity, subject, changed_files).astype({'segment': str})],
+                          ignore_index=True)
+        block['segment'] = pd.Categorical(block['segment'], categories=segment_names)
+        block = block.sort_values('segment', kind='stable', ignore_index=True)
+
+    block['activity_name'] = pd.Categorical([activity_name] * len(block), categories=ACTIVITIES_CODES)
+
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    block.to_parquet(file_path, engine='pyarrow', compression='zstd', index=False)
+
+    return activity, subject, len(block), len(changed_files)
+
+
+def file_signature(file_path, previous=None, use_hash=False):
+    """
+    Builds the manifest entry of a segment file from its size and mtime, and optionally a content hash.
+    The hash is only recomputed when size or mtime differ from the previous entry.
+
+    Args:
+        file_path = path of the segment file
+        previous = manifest entry from the last run, if any
+        use_hash = whether to key the entry on a sha1 of the file content
+    Returns:
+        signature = dictionary with size, mtime_ns and optionally sha1
+    """
+
+    stat = os.stat(file_path)
+    signature = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+    if use_hash:
+        if previous and 'sha1' in previous and previous['size'] == signature['size'] \
+                and previous['mtime_ns'] == signature['mtime_ns']:
+            signature['sha1'] = previous['sha1']
+        else:
+            with open(file_path, 'rb') as f:
+                signature['sha1'] = hashlib.sha1(f.read()).hexdigest()
+
+    return signature
+
+
+def is_unchanged(previous, signature):
+    """
+    Compares a segment file's manifest entry from the last run with its current one.
+
+    Args:
+        previous = manifest entry from the last run, or None for a new file
+        signature = current manifest entry
+    Returns:
+        unchanged = True if the file does not need to be parsed again
+    """
+
+    if previous is None or previous['size'] != signature['size']:
+        return False
+    if 'sha1' in previous and 'sha1' in signature:
+        return previous['sha1'] == signature['sha1']
+
+    return previous['mtime_ns'] == signature['mtime_ns']
+
+
+def load_manifest(output):
+    """
+    Loads the manifest of segment files ingested into a partitioned dataset.
+
+    Args:
+        output = root folder of the partitioned dataset
+    Returns:
+        manifest = dictionary of segment file path (relative to the data folder) to its signature
+    """
+
+    manifest_path = join(output, MANIFEST_FILE)
+    if not isfile(manifest_path):
+        return {}
+
+    with open(manifest_path) as f:
+        return json.load(f)['files']
+
+
+def save_manifest(output, manifest):
+    """
+    Atomically writes the manifest of ingested segment files next to the partitioned dataset.
+
+    Args:
+        output = root folder of the partitioned dataset
+        manifest = dictionary of segment file path to its signature
+    Returns:
+        None
+    """
+
+    os.makedirs(output, exist_ok=True)
+    manifest_path = join(output, MANIFEST_FILE)
+
+    with open(manifest_path + '.tmp', 'w') as f:
+        json.dump({'files': manifest}, f, indent=1, sort_keys=True)
+    os.replace(manifest_path + '.tmp', manifest_path)
+
+
+def dataset_version(path):
+    """
+    Fingerprint of an ingested dataset, written into every precomputed artifact so that artifacts built from
+    an earlier ingest can be detected. A partitioned dataset is fingerprinted by its manifest, which every
+    ingest rewrites, and a csv file (or a dataset without a manifest) by the sizes and mtimes of its files.
+
+    Args:
+        path = root folder of the partitioned dataset, or path of the csv file
+    Returns:
+        version = short hex digest, or None if there is no dataset at path
+    """
+
+    digest = hashlib.sha1()
+    manifest_path = join(path, MANIFEST_FILE)
+
+    if isfile(manifest_path):
+        with open(manifest_path, 'rb') as f:
+            digest.update(f.read())
+    elif isfile(path):
+        stat = os.stat(path)
+        digest.update(f'{stat.st_size}/{stat.st_mtime_ns}'.encode())
+    elif os.path.isdir(path):
+        for root, folders, files in os.walk(path):
+            folders.sort()
+            for name in sorted(files):
+                stat = os.stat(join(root, name))
+                digest.update(f'{os.path.relpath(join(root, name), path)}/{stat.st_size}/{stat.st_mtime_ns}'.encode())
+    else:
+        return None
+
+    return digest.hexdigest()[:16]
+
+
+def is_current(artifact_version, version):
+    """
+    Whether a precomputed artifact was built from the current ingest of the dataset. Artifacts are trusted
+    when there is no dataset to compare them with, e.g. a deployment that only ships the artifacts.
+
+    Args:
+        artifact_version = dataset_version recorded in the artifact, or None if it recorded none
+        version = dataset_version of the dataset as it is now
+    Returns:
+        current = boolean
+    """
+
+    return version is None or artifact_version == version
+
+
+def list_tasks(path, output):
+    """
+    Lists every activity/subject block in the data folder as a worker task.
+
+    Args:
+        path = root of the downloaded data folder
+        output = root folder of the partitioned dataset
+    Returns:
+        tasks = list of (path, output, activity, subject, activity_name, segment_files, None) tuples
+    """
+
+    activity_folders = list_folders(path)
+    mapping = activities_mapping(activity_folders)
+
+    return [(path, output, activity, subject, mapping[activity], list_segment_files(path, activity, subject), None)
+            for activity in activity_folders
+            for subject in list_folders(join(path, activity))]
+
+
+def plan_tasks(path, output, manifest, use_hash=False, full=False):
+    """
+    Compares the data folder against the manifest of the last run and keeps only the blocks with new,
+    changed or removed segment files, or whose partition is missing.
+
+    Args:
+        path = root of the downloaded data folder
+        output = root folder of the partitioned dataset
+        manifest = manifest from the last run
+        use_hash = whether to key files on a content hash instead of mtime
+        full = whether to rewrite every block regardless of the manifest
+    Returns:
+        tasks = list of worker tasks for the affected blocks
+        signatures = dictionary of (activity, subject) to the manifest entries of that block's files
+        removed_blocks = list of (activity, subject) partitions whose folder no longer exists
+    """
+
+    tasks = []
+    signatures = {}
+
+    for task in list_tasks(path, output):
+        _, _, activity, subject, activity_name, segment_files, _ = task
+
+        block_signatures = {}
+        changed_files = []
+        for segment in segment_files:
+            key = f'{activity}/{subject}/{segment}'
+            previous = manifest.get(key)
+            block_signatures[key] = file_signature(join(path, activity, subject, segment), previous, use_hash)
+            if not is_unchanged(previous, block_signatures[key]):
+                changed_files.append(segment)
+        signatures[(activity, subject)] = block_signatures
+
+        previous_keys = {key for key in manifest if key.startswith(f'{activity}/{subject}/')}
+        removed_files = previous_keys - set(block_signatures)
+
+        if full or not previous_keys or not isfile(partition_path(output, activity, subject)):
+            tasks.append(task)
+        elif changed_files or removed_files:
+            tasks.append(task[:-1] + (changed_files,))
+
+    removed_blocks = sorted({tuple(key.split('/')[:2]) for key in manifest} - set(signatures))
+
+    return tasks, signatures, removed_blocks
+
+
+def ingest_parquet(path, output, workers=None, use_hash=False, full=False):
+    """
+    Reads the new or changed activity/subject blocks in parallel and writes them as a partitioned parquet
+    dataset laid out as output/activity=<code>/subject=<code>/part-0.parquet. A manifest of the ingested
+    segment files is kept in output/_manifest.json so that re-runs only parse what changed.
+
+    Args:
+        path = root of the downloaded data folder
+        output = root folder of the partitioned dataset
+        workers = number of worker processes (defaults to the cpu count)
+        use_hash = whether to key files on a content hash instead of mtime
+        full = whether to rewrite every block regardless of the manifest
+    Returns:
+        None
+    """
+
+    # Read even with full, so that the partitions of blocks removed from the data folder are deleted too
+    manifest = load_manifest(output)
+    tasks, signatures, removed_blocks = plan_tasks(path, output, manifest, use_hash, full)
+
+    for activity, subject in removed_blocks:
+        print(f"Activity: {activity}, Subject: {subject}, removed")
+        shutil.rmtree(os.path.dirname(partition_path(output, activity, subject)), ignore_errors=True)
+        manifest = {key: value for key, value in manifest.items() if not key.startswith(f'{activity}/{subject}/')}
+
+    print(f"{len(tasks)} of {len(signatures)} activity/subject blocks to ingest")
+
+    pending = {(task[2], task[3]) for task in tasks}
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for activity, subject, n_rows, n_files in pool.map(ingest_block, tasks):
+                print(f"Activity: {activity}, Subject: {subject}, Files parsed: {n_files}, Rows: {n_rows}")
+                pending.discard((activity, subject))
+    finally:
+        # Blocks that failed keep their old entries so that the next run picks them up again
+        for (activity, subject), block_signatures in signatures.items():
+            if (activity, subject) not in pending:
+                prefix = f'{activity}/{subject}/'
+                manifest = {key: value for key, value in manifest.items() if not key.startswith(prefix)}
+                manifest.update(block_signatures)
+        save_manifest(output, manifest)
+
+
+def ingest_csv(path, output, workers=None):
+    """
+    Reads all activity/subject blocks in parallel and writes them as the original single csv file.
+
+    Args:
+        path = root of the downloaded data folder
+        output = path of the csv file to write
+        workers = number of worker processes (defaults to the cpu count)
+    Returns:
+        None
+    """
+
+    tasks = list_tasks(path, output)
+    paths, activities, subjects, segment_files = zip(*[(task[0], task[2], task[3], task[5]) for task in tasks])
+    mapping = activities_mapping(set(activities))
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        blocks = list(pool.map(read_block, paths, activities, subjects, segment_files))
+
+    for block, activity, subject in zip(blocks, activities, subjects):
+        block['segment'] = block['segment'].astype(str)
+        block['subject'] = subject
+        block['activity'] = activity
 
-    units_codes = ['T', 'RA', 'LA', 'RL', 'LL']
-    sensors_codes = ['xacc', 'yacc', 'zacc', 'xgyro', 'ygyro', 'zgyro', 'xmag', 'ymag', 'zmag']
-
-    data_columns = []
-
-    for unit in units_codes:
-        for sensor in sensors_codes:
-            data_columns.append(unit + '_' + sensor)
-
-    path = 'C:/Users/anima/Documents/Daily Activities and Sports Biomechanics Analysis/data'
-
-    # Getting all folders with data files in directory
-    activity_folders = [f for f in listdir(path) if not isfile(join(path, f))]
-    activities_codes = ['Sitting', 'Standing', 'Lying on Back', 'Lying on Right Side', 'Ascending Stairs',
-                        'Descending Stairs', 'Standing in an Elevator', 'Moving in an Elevator', 'Walking in a Parking Lot',
-                        'Walking on a Treadmill', 'Walking on a Treadmill with an Incline', 'Running on a Treadmill', 'Exercising on a Stepper',
-                        'Exercising on a Cross Trainer', 'Cycling on an Exercise Bike in a Horizontal Position', 'Cycling on an Exercise Bike in a Vertical Position',
-                        'Rowing', 'Jumping', 'Playing Basketball']
-    activities_mapping = dict(zip(activity_folders, activities_codes))
-
-    # Looping through folders to read in each respective file and creating dataframes for each activity
-    activities = {}
-    for activity in activity_folders:
-        print(f"Activity: {activity}")
-        # Getting all folders with data files in activity directory
-        subject_folders = [f for f in listdir(f'{path}/{activity}') if not isfile(join(path, f))]
-        
-        # Looping through folders to read in each respective file and creating dataframes for each subject
-        subjects = {}
-        for subject in subject_folders:
-            print(f"Activity: {activity}, Subject: {subject}")
-            # Getting all data files in subject directory
-            segment_files = [f for f in listdir(f'{path}/{activity}/{subject}')]
-            
-            # Looping through files to read in each respective file and creating dataframes for each segment
-            segments = {}
-            for segment in segment_files:
-                print(f"Activity: {activity}, Subject: {subject}, Segment: {segment}...")
-                segment_data = pd.read_csv(f'{path}/{activity}/{subject}/{segment}', names=data_columns)            
-
-                segment_data['segment'] = segment[:-4]
-                segments[segment] = segment_data
-
-            # Compiling the segments together for each subject
-            all_segments = pd.concat(segments.values(), ignore_index=True)
-            all_segments['subject'] = subject
-            subjects[subject] = all_segments
-        
-        # Compiling the subjects together for each activity
-        all_subjects = pd.concat(subjects.values(), ignore_index=True)
-        all_subjects['activity'] = activity
-        activities[activity] = all_subjects
-        
     # Compiling all the data together to one dataframe
-    complete_dataset = pd.concat(activities.values(), ignore_index=True)
-    complete_dataset['activity_name']= complete_dataset['activity'].map(activities_mapping)
+    complete_dataset = pd.concat(blocks, ignore_index=True)
+    complete_dataset['activity_name'] = complete_dataset['activity'].map(mapping)
 
     # Writing file to disk
     print("Writing complete dataset to file...")
-    complete_dataset.to_csv('sports_science_dataset.csv', index=False)
-    print("Completed!")
\ No newline at end of file
+    complete_dataset.to_csv(output, index=False)
+
+
+def parse_args():
+
+    parser = argparse.ArgumentParser(description="Combine the UCI Daily and Sports Activities segment files into one dataset.")
+    parser.add_argument('--path', default=os.environ.get('SPORTS_SCIENCE_DATA', 'data'),
+                        help="Root of the downloaded data folder (defaults to $SPORTS_SCIENCE_DATA or ./data)")
+    parser.add_argument('--format', choices=['parquet', 'csv'], default='csv',
+                        help="parquet writes a typed, partitioned dataset; csv writes the original single text file")
+    parser.add_argument('--output', default=None,
+                        help=f"Output location (defaults to {DATASET_NAME} or {DATASET_NAME}.csv)")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Number of worker processes (defaults to the cpu count)")
+    parser.add_argument('--hash', action='store_true',
+                        help="Detect changed segment files by content hash instead of size and mtime")
+    parser.add_argument('--full', action='store_true',
+                        help="Ignore the manifest and re-ingest every segment file")
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+
+    args = parse_args()
+
+    if args.format == 'parquet':
+        ingest_parquet(args.path, args.output or DATASET_NAME, args.workers, args.hash, args.full)
+    else:
+        ingest_csv(args.path, args.output or f'{DATASET_NAME}.csv', args.workers)
+
+    print("Completed!")
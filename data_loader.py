@@ -0,0 +1,128 @@
+import os
+import functools
+import pandas as pd
+from os.path import join
+
+from data_cleaning import ACTIVITIES_CODES, DATA_COLUMNS, DATASET_NAME, MANIFEST_FILE, activities_mapping, partition_path
+from render_cache import RenderCache
+from tensor_store import list_partitions
+
+PARTITION_CACHE_BYTES = 512 * 1024 ** 2
+
+
+def manifest_mtime(dataset):
+    """
+    Modification time of the ingest manifest, which data_cleaning.py rewrites after every (incremental) ingest,
+    or of the dataset folder for datasets written without one. None if the dataset does not exist.
+    """
+
+    for path in [join(dataset, MANIFEST_FILE), dataset]:
+        if os.path.exists(path):
+            return os.path.getmtime(path)
+
+    return None
+
+
+@functools.lru_cache(maxsize=8)
+def list_dataset_partitions(dataset, mtime):
+    """
+    Lists the partitions once per dataset and ingest, keyed on the manifest mtime so that partitions added by a
+    later ingest are picked up.
+    """
+
+    partitions = tuple(list_partitions(dataset))
+    mapping = activities_mapping({activity for activity, _ in partitions})
+
+    return partitions, {name: code for code, name in mapping.items()}
+
+
+def dataset_partitions(dataset=DATASET_NAME):
+    """
+    Lists the partitions of the dataset together with the activity code/name mapping.
+
+    Args:
+        dataset = root folder of the partitioned dataset
+    Returns:
+        partitions = tuple of (activity, subject) tuples
+        codes = dictionary of activity name to activity folder code
+    """
+
+    return list_dataset_partitions(dataset, manifest_mtime(dataset))
+
+
+def has_partitioned_dataset(dataset=DATASET_NAME):
+    """
+    Whether data_cleaning.py has written a partitioned parquet dataset at this location.
+    """
+
+    return os.path.isdir(dataset) and len(dataset_partitions(dataset)[0]) > 0
+
+
+def dataset_activity_names(dataset=DATASET_NAME):
+    """
+    Activity names present in the dataset, in activity code order.
+    """
+
+    _, codes = dataset_partitions(dataset)
+
+    return [name for name in ACTIVITIES_CODES if name in codes]
+
+
+partition_cache = RenderCache(PARTITION_CACHE_BYTES)
+
+
+def load_partition(dataset, activity, subject, columns):
+    """
+    Reads only the requested sensor columns of one activity/subject partition. Results are kept in an LRU
+    bounded by their memory, since partitions range from a few hundred kB to tens of MB, and keyed on the
+    manifest mtime so that a re-ingested partition is read again. The returned dataframe is shared between
+    callers and must not be modified in place.
+
+    Args:
+        dataset = root folder of the partitioned dataset
+        activity = activity folder code
+        subject = subject code
+        columns = tuple of sensor column names
+    Returns:
+        df = dataframe of float32 sensor columns plus categorical segment and activity_name
+    """
+
+    key = (dataset, activity, subject, columns, manifest_mtime(dataset))
+    df = partition_cache.get(key)
+    if df is None:
+        df = pd.read_parquet(partition_path(dataset, activity, subject), columns=list(columns) + ['segment', 'activity_name'])
+        partition_cache.put(key, df, int(df.memory_usage(deep=True).sum()))
+
+    return df
+
+
+def load_selection(subject, activity_names, columns=None, dataset=DATASET_NAME):
+    """
+    Lazily loads one subject's rows for the given activities, reading only the matching partitions and
+    the requested sensor columns.
+
+    Args:
+        subject = subject code, e.g. p1
+        activity_names = activity name or list of activity names
+        columns = sensor column names, or None for all 45
+        dataset = root folder of the partitioned dataset
+    Returns:
+        df = dataframe of the selected sensor columns plus segment, subject, activity and activity_name
+    """
+
+    if isinstance(activity_names, str):
+        activity_names = [activity_names]
+    columns = tuple(DATA_COLUMNS if columns is None else columns)
+
+    partitions, codes = dataset_partitions(dataset)
+    frames = []
+    for name in activity_names:
+        if (codes.get(name), subject) in partitions:
+            frames.append(load_partition(dataset, codes[name], subject, columns).assign(subject=subject, activity=codes[name]))
+
+    if not frames:
+        return pd.DataFrame(columns=list(columns) + ['segment', 'subject', 'activity', 'activity_name'])
+
+    df = pd.concat(frames, ignore_index=True)
+
+    return df[list(columns) + ['segment', 'subject', 'activity', 'activity_name']]
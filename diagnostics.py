@@ -0,0 +1,222 @@
+import datetime
+import json
+import os
+import threading
+import time
+import tracemalloc
+import weakref
+from contextlib import contextmanager
+
+DIAGNOSTICS_ENV = 'SPORTS_SCIENCE_DIAGNOSTICS'
+DIAGNOSTICS_LOG = 'dashboard_diagnostics.jsonl'
+
+log_lock = threading.Lock()
+
+# The tracer is shared by every recorder of the process, e.g. the sessions of one streamlit server. It runs
+# while at least one recorder is recording, and every open stage of every recorder is registered here so that
+# resetting its peak never loses the peak of another recorder's stage.
+tracer_lock = threading.Lock()
+open_stages = {}
+active_recorders = 0
+owns_tracer = False
+
+
+def start_tracing():
+    """
+    Registers a recording recorder, starting the tracer if it is the first one and nobody else traces already.
+    """
+
+    global active_recorders, owns_tracer
+
+    with tracer_lock:
+        if active_recorders == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            owns_tracer = True
+        active_recorders += 1
+
+
+def stop_tracing(stage_keys):
+    """
+    Unregisters a recorder and its open stages, stopping the tracer once the last recorder is done so that later
+    reruns without diagnostics do not pay for tracing.
+
+    Args:
+        stage_keys = keys of the recorder's stages in open_stages
+    Returns:
+        None
+    """
+
+    global active_recorders, owns_tracer
+
+    with tracer_lock:
+        for key in stage_keys:
+            open_stages.pop(key, None)
+        stage_keys.clear()
+
+        active_recorders -= 1
+        if active_recorders == 0 and owns_tracer:
+            tracemalloc.stop()
+            owns_tracer = False
+
+
+def fold_peak():
+    """
+    Carries the tracer's peak since the last reset into every open stage and resets it, so that each open stage
+    keeps its own peak even though nested and concurrent stages reset the shared tracer. Called with
+    tracer_lock held.
+
+    Returns:
+        current = memory currently traced, in bytes
+    """
+
+    current, peak = tracemalloc.get_traced_memory()
+    for stage in open_stages.values():
+        stage['peak'] = max(stage['peak'], peak)
+    if hasattr(tracemalloc, 'reset_peak'):
+        tracemalloc.reset_peak()
+
+    return current
+
+
+class StageRecorder:
+    """
+    Records the wall time, peak traced memory and row count of named dashboard stages during one rerun.
+    Disabled recorders do no timing or tracing at all, so the stages can stay wrapped in normal use.
+
+    Peak memory comes from tracemalloc and is the peak above the memory in use when the stage started. Nested
+    stages are folded into their parents. Stages running concurrently on the render threads or in other
+    sessions share the same tracer, so a stage's peak includes what they allocate at the same time. Tracing
+    stops when the last recording recorder finishes, or is garbage collected after an interrupted rerun.
+    """
+
+    def __init__(self, enabled=False, session=None, rerun=0):
+
+        self.enabled = enabled
+        self.session = session
+        self.rerun = rerun
+        self.records = []
+        self.stage_keys = set()
+        self.lock = threading.Lock()
+        self.start = time.perf_counter()
+
+        # The whole rerun is tracked as an open stage too, so its peak covers every stage
+        self.root = {'peak': 0}
+        if enabled:
+            start_tracing()
+            # Streamlit interrupts a rerun when a widget changes, in which case finish is never called
+            self.stop = weakref.finalize(self, stop_tracing, self.stage_keys)
+            self.open_stage(self.root)
+
+    def open_stage(self, stage):
+        """
+        Registers a stage with the shared tracer and returns the memory in use when it opened.
+        """
+
+        with tracer_lock:
+            stage['start'] = stage['peak'] = fold_peak()
+            open_stages[id(stage)] = stage
+            self.stage_keys.add(id(stage))
+
+        return stage['start']
+
+    def close_stage(self, stage):
+        """
+        Folds the peak into a stage and unregisters it from the shared tracer.
+        """
+
+        with tracer_lock:
+            fold_peak()
+            open_stages.pop(id(stage), None)
+            self.stage_keys.discard(id(stage))
+
+    @contextmanager
+    def stage(self, name, detail=None, rows=None):
+        """
+        Times the wrapped block as one stage. The yielded record can be updated inside the block, e.g. with
+        the number of rows the stage produced.
+
+        Args:
+            name = stage name, e.g. find_peaks
+            detail = optional extra label, e.g. the sensor column
+            rows = optional number of rows the stage works on
+        Returns:
+            record = dictionary of the stage's measurements
+        """
+
+        record = {'stage': name, 'detail': detail, 'rows': rows}
+        if not self.enabled:
+            yield record
+            return
+
+        open_stage = {}
+        start_memory = self.open_stage(open_stage)
+        start = time.perf_counter()
+
+        try:
+            yield record
+        finally:
+            seconds = time.perf_counter() - start
+            self.close_stage(open_stage)
+            with self.lock:
+                record.update({
+                    'seconds': seconds,
+                    'peak_mb': (open_stage['peak'] - start_memory) / 1024 ** 2,
+                    'thread': threading.current_thread().name,
+                })
+                self.records.append(record)
+
+    def finish(self):
+        """
+        Adds a record for the whole rerun, with the peak traced memory since the recorder was created, and stops
+        tracing if no other recorder is recording.
+
+        Returns:
+            records = list of stage records of this rerun, stamped with the session and rerun number
+        """
+
+        if not self.enabled:
+            return []
+
+        self.close_stage(self.root)
+        self.stop()
+
+        with self.lock:
+            self.records.append({
+                'stage': 'rerun', 'detail': None, 'rows': None,
+                'seconds': time.perf_counter() - self.start,
+                'peak_mb': (self.root['peak'] - self.root['start']) / 1024 ** 2,
+                'thread': threading.current_thread().name,
+            })
+            timestamp = datetime.datetime.now().isoformat(timespec='seconds')
+            for record in self.records:
+                record.update({'session': self.session, 'rerun': self.rerun, 'time': timestamp})
+
+            return list(self.records)
+
+
+def diagnostics_enabled_by_default():
+    """
+    Whether the SPORTS_SCIENCE_DIAGNOSTICS environment variable turns diagnostics on.
+    """
+
+    return os.environ.get(DIAGNOSTICS_ENV, '').lower() in ('1', 'true', 'yes')
+
+
+def append_log(records, path=DIAGNOSTICS_LOG):
+    """
+    Appends stage records to a JSON lines log, one record per line, so that sessions can be aggregated later,
+    e.g. with pd.read_json(path, lines=True).
+
+    Args:
+        records = list of stage record dictionaries
+        path = path of the log file
+    Returns:
+        None
+    """
+
+    if not records:
+        return
+
+    lines = ''.join(json.dumps(record) + '\n' for record in records)
+    with log_lock, open(path, 'a') as f:
+        f.write(lines)
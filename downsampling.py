@@ -0,0 +1,81 @@
+import numpy as np
+
+from peaks import SignalCache, strongest_peaks
+
+LINECHART_POINT_BUDGET = 2000
+SCATTER3D_POINT_BUDGET = 6000
+
+
+class MinMaxPyramid:
+    """
+    Multi-resolution min/max downsampling of a signal. Level k keeps the positions of the minimum and maximum
+    of every bucket of factor**(k + 1) samples, and each level is built from the one below it, so the whole
+    pyramid costs O(n) to precompute. Picking a level for a point budget is then just a lookup, and because
+    every bucket keeps its extremes the peaks of the signal survive downsampling.
+    """
+
+    def __init__(self, x, factor=2):
+
+        x = np.asarray(x, dtype=np.float64)
+        self.n = len(x)
+        self.levels = []
+
+        lows = highs = np.arange(self.n)
+        while len(lows) > 1:
+            pad = (-len(lows)) % factor
+            lows = np.concatenate([lows, np.repeat(lows[-1:], pad)]).reshape(-1, factor)
+            highs = np.concatenate([highs, np.repeat(highs[-1:], pad)]).reshape(-1, factor)
+
+            rows = np.arange(len(lows))
+            lows = lows[rows, np.argmin(np.where(np.isnan(x[lows]), np.inf, x[lows]), axis=1)]
+            highs = highs[rows, np.argmax(np.where(np.isnan(x[highs]), -np.inf, x[highs]), axis=1)]
+            self.levels.append((lows, highs))
+
+    def indices(self, budget):
+        """
+        Sorted sample positions of the finest level that fits in the point budget.
+
+        Args:
+            budget = maximum number of points to keep
+        Returns:
+            indices = sorted sample positions, always including the first and last sample
+        """
+
+        if self.n <= budget:
+            return np.arange(self.n)
+
+        for lows, highs in self.levels:
+            if 2 * len(lows) + 2 <= budget:
+                break
+
+        return np.unique(np.concatenate([lows, highs, [0, self.n - 1]]))
+
+
+pyramid_cache = SignalCache(MinMaxPyramid)
+
+
+def downsample_indices(pyramids, budget, keep=None, priority=None):
+    """
+    Combines the pyramids of several channels into one set of rows, so that every channel keeps its extremes,
+    and adds rows that must always be drawn, such as the peaks marked on a chart. The kept rows count against
+    the budget and take at most half of it, the ones of highest priority (e.g. prominence) if there are more.
+
+    Args:
+        pyramids = list of MinMaxPyramid over the same rows
+        budget = maximum number of rows to keep, shared between the channels and the kept rows
+        keep = optional sample positions to keep, up to half the budget
+        priority = optional priority of each kept position, evenly spaced positions are kept without one
+    Returns:
+        indices = sorted row positions
+    """
+
+    keep = np.zeros(0, dtype=np.int64) if keep is None else np.asarray(keep, dtype=np.int64)
+    if len(keep) > budget // 2 and priority is not None:
+        keep = strongest_peaks(keep, priority, budget // 2)
+    elif len(keep) > budget // 2:
+        keep = keep[np.linspace(0, len(keep) - 1, budget // 2).astype(np.int64)]
+
+    indices = [pyramid.indices(max((budget - len(keep)) // len(pyramids), 4)) for pyramid in pyramids]
+    indices.append(keep)
+
+    return np.unique(np.concatenate(indices))
@@ -0,0 +1,334 @@
+import argparse
+import sys
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+from data_cleaning import DATA_COLUMNS, DATASET_NAME, dataset_version, partition_path, read_samples
+from data_loader import dataset_partitions
+from tensor_store import natural_key
+
+FATIGUE_NAME = 'sports_science_fatigue.npz'
+SAMPLING_RATE = 25
+LIMB_UNITS = ['LA_', 'RA_', 'LL_', 'RL_']
+LIMB_COLUMNS = [unit + sensor for unit in LIMB_UNITS for sensor in ['xacc', 'yacc', 'zacc', 'xgyro', 'ygyro', 'zgyro']]
+FATIGUE_METRICS = ['peak_amplitude', 'peak_interval', 'variability', 'fatigue_index']
+WINDOW_SECONDS = 30
+PEAK_HISTORY = 20
+MIN_PEAK_DISTANCE = SAMPLING_RATE // 5
+
+
+class FatigueEngine:
+    """
+    Rolling fatigue metrics of several limbs, updated in O(1) per sample so the same engine serves batch
+    precomputation and live streams. Per limb it tracks:
+
+        peak_amplitude = mean height above the rolling mean of the last peaks of the acceleration magnitude
+        peak_interval = mean time in seconds between those peaks
+        variability = coefficient of variation of the angular speed over the rolling window
+
+    The metrics of the first full window are the subject's baseline, and fatigue_index averages the relative
+    amplitude decline, interval lengthening and variability rise against it, so it is 0 when fresh and grows
+    as the movement gets weaker, slower and less consistent.
+    """
+
+    def __init__(self, n_limbs=len(LIMB_UNITS), window=WINDOW_SECONDS * SAMPLING_RATE, peak_history=PEAK_HISTORY,
+                 min_peak_distance=MIN_PEAK_DISTANCE):
+
+        self.window = window
+        self.min_peak_distance = min_peak_distance
+        self.count = 0
+        self.limbs = np.arange(n_limbs)
+
+        # Rolling window of both magnitudes, with running sums for the mean and variance
+        self.acc_buffer = np.zeros((window, n_limbs))
+        self.gyro_buffer = np.zeros((window, n_limbs))
+        self.acc_sum = np.zeros(n_limbs)
+        self.acc_sum_squares = np.zeros(n_limbs)
+        self.gyro_sum = np.zeros(n_limbs)
+        self.gyro_sum_squares = np.zeros(n_limbs)
+
+        # Last two samples for the one-sample-delayed local maximum test
+        self.previous = np.full(n_limbs, -np.inf)
+        self.before_previous = np.full(n_limbs, -np.inf)
+        self.last_peak = np.full(n_limbs, -1)
+
+        # Rings of the last peak amplitudes and inter-peak intervals, with running sums
+        self.amplitudes = np.zeros((peak_history, n_limbs))
+        self.intervals = np.zeros((peak_history, n_limbs))
+        self.amplitude_sum = np.zeros(n_limbs)
+        self.interval_sum = np.zeros(n_limbs)
+        self.n_amplitudes = np.zeros(n_limbs, dtype=np.int64)
+        self.n_intervals = np.zeros(n_limbs, dtype=np.int64)
+
+        self.baseline = None
+
+    def push(self, acc_magnitude, gyro_magnitude):
+        """
+        Adds one sample of every limb.
+
+        Args:
+            acc_magnitude = (limbs,) acceleration magnitudes
+            gyro_magnitude = (limbs,) angular speeds
+        Returns:
+            None
+        """
+
+        position = self.count % self.window
+        n = min(self.count, self.window)
+        acc_mean = self.acc_sum / n if n else acc_magnitude
+        acc_std = np.sqrt(np.maximum(self.acc_sum_squares / n - acc_mean ** 2, 0)) if n else np.zeros_like(acc_magnitude)
+
+        # The previous sample is a peak if it is a local maximum clearly above the rolling mean
+        is_peak = (self.previous > self.before_previous) & (self.previous >= acc_magnitude) \
+            & (self.previous > acc_mean + 0.5 * acc_std) \
+            & ((self.last_peak < 0) | (self.count - 1 - self.last_peak >= self.min_peak_distance))
+        if is_peak.any():
+            self.add_peaks(self.limbs[is_peak], self.previous[is_peak] - acc_mean[is_peak])
+
+        evicted_acc, evicted_gyro = self.acc_buffer[position].copy(), self.gyro_buffer[position].copy()
+        self.acc_sum += acc_magnitude - evicted_acc
+        self.acc_sum_squares += acc_magnitude ** 2 - evicted_acc ** 2
+        self.gyro_sum += gyro_magnitude - evicted_gyro
+        self.gyro_sum_squares += gyro_magnitude ** 2 - evicted_gyro ** 2
+        self.acc_buffer[position] = acc_magnitude
+        self.gyro_buffer[position] = gyro_magnitude
+
+        self.before_previous, self.previous = self.previous, np.asarray(acc_magnitude, dtype=np.float64)
+        self.count += 1
+
+        if self.count % self.window == 0:
+            # Recompute the running sums once per window so that floating point drift stays bounded
+            self.acc_sum, self.acc_sum_squares = self.acc_buffer.sum(axis=0), (self.acc_buffer ** 2).sum(axis=0)
+            self.gyro_sum, self.gyro_sum_squares = self.gyro_buffer.sum(axis=0), (self.gyro_buffer ** 2).sum(axis=0)
+            if self.baseline is None:
+                self.baseline = self.current()
+
+    def add_peaks(self, limbs, amplitudes):
+
+        peak_time = self.count - 1
+        history = len(self.amplitudes)
+
+        slots = self.n_amplitudes[limbs] % history
+        self.amplitude_sum[limbs] += amplitudes - self.amplitudes[slots, limbs]
+        self.amplitudes[slots, limbs] = amplitudes
+        self.n_amplitudes[limbs] += 1
+
+        followed = limbs[self.last_peak[limbs] >= 0]
+        intervals = (peak_time - self.last_peak[followed]) / SAMPLING_RATE
+        slots = self.n_intervals[followed] % history
+        self.interval_sum[followed] += intervals - self.intervals[slots, followed]
+        self.intervals[slots, followed] = intervals
+        self.n_intervals[followed] += 1
+
+        self.last_peak[limbs] = peak_time
+
+    def current(self):
+        """
+        Peak amplitude, peak interval and variability of every limb, NaN where there are no peaks yet.
+        """
+
+        history = len(self.amplitudes)
+        n = max(min(self.count, self.window), 1)
+        gyro_mean = self.gyro_sum / n
+        gyro_std = np.sqrt(np.maximum(self.gyro_sum_squares / n - gyro_mean ** 2, 0))
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            amplitude = self.amplitude_sum / np.minimum(self.n_amplitudes, history)
+            interval = self.interval_sum / np.minimum(self.n_intervals, history)
+            variability = np.where(gyro_mean > 0, gyro_std / gyro_mean, np.nan)
+
+        return np.stack([amplitude, interval, variability], axis=1)
+
+    def metrics(self):
+        """
+        Current fatigue metrics of every limb.
+
+        Returns:
+            metrics = (limbs, 4) array ordered as FATIGUE_METRICS, with a NaN fatigue_index until the baseline
+                      window is complete
+        """
+
+        current = self.current()
+        if self.baseline is None:
+            fatigue_index = np.full(len(current), np.nan)
+        else:
+            with np.errstate(invalid='ignore', divide='ignore'):
+                changes = np.stack([1 - current[:, 0] / self.baseline[:, 0],
+                                    current[:, 1] / self.baseline[:, 1] - 1,
+                                    current[:, 2] / self.baseline[:, 2] - 1], axis=1)
+            changes[~np.isfinite(changes)] = np.nan
+            fatigue_index = np.array([np.nanmean(row) if np.isfinite(row).any() else np.nan for row in changes])
+
+        return np.column_stack([current, fatigue_index])
+
+
+def limb_magnitudes(values):
+    """
+    Acceleration magnitude and angular speed of every limb.
+
+    Args:
+        values = (samples, 24) array of the LIMB_COLUMNS
+    Returns:
+        acc_magnitude = (samples, limbs) array
+        gyro_magnitude = (samples, limbs) array
+    """
+
+    values = np.asarray(values, dtype=np.float64).reshape(len(values), len(LIMB_UNITS), 2, 3)
+    magnitudes = np.sqrt((values ** 2).sum(axis=3))
+
+    return magnitudes[:, :, 0], magnitudes[:, :, 1]
+
+
+def fatigue_series(values, hop=SAMPLING_RATE):
+    """
+    Runs the fatigue engine over a session and reports the metrics every hop samples.
+
+    Args:
+        values = (samples, 24) array of the LIMB_COLUMNS, in time order
+        hop = samples between reports
+    Returns:
+        times = (reports,) report times in seconds
+        metrics = (reports, limbs, 4) float32 array ordered as FATIGUE_METRICS
+    """
+
+    acc_magnitude, gyro_magnitude = limb_magnitudes(values)
+    engine = FatigueEngine()
+    times, metrics = [], []
+
+    for t in range(len(acc_magnitude)):
+        engine.push(acc_magnitude[t], gyro_magnitude[t])
+        if (t + 1) % hop == 0:
+            times.append((t + 1) / SAMPLING_RATE)
+            metrics.append(engine.metrics())
+
+    return np.array(times, dtype=np.float32), np.array(metrics, dtype=np.float32).reshape(len(times), len(LIMB_UNITS), len(FATIGUE_METRICS))
+
+
+def partition_fatigue(task):
+    """
+    Process pool worker that reads the limb channels of one partition and computes its fatigue series.
+
+    Args:
+        task = tuple of (dataset, activity, subject)
+    Returns:
+        result = tuple of (activity, subject, times, metrics)
+    """
+
+    dataset, activity, subject = task
+    values = pd.read_parquet(partition_path(dataset, activity, subject), columns=LIMB_COLUMNS).to_numpy()
+
+    return (activity, subject) + fatigue_series(values)
+
+
+def build_fatigue_index(dataset=DATASET_NAME, output=FATIGUE_NAME, workers=None):
+    """
+    Precomputes the fatigue series of every subject x activity and saves them as one NaN-padded array.
+
+    Args:
+        dataset = root folder of the partitioned dataset
+        output = path of the npz file to write
+        workers = number of worker processes (defaults to the cpu count)
+    Returns:
+        None
+    """
+
+    version = dataset_version(dataset)
+    partitions, codes = dataset_partitions(dataset)
+    activities = sorted({activity for activity, _ in partitions}, key=natural_key)
+    subjects = sorted({subject for _, subject in partitions}, key=natural_key)
+    names = {code: name for name, code in codes.items()}
+
+    tasks = [(dataset, activity, subject) for activity, subject in partitions]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(partition_fatigue, tasks))
+
+    n_reports = max([len(times) for _, _, times, _ in results], default=0)
+    metrics = np.full((len(activities), len(subjects), n_reports, len(LIMB_UNITS), len(FATIGUE_METRICS)), np.nan, dtype=np.float32)
+    n_rows = np.zeros((len(activities), len(subjects)), dtype=np.int64)
+
+    for activity, subject, times, block_metrics in results:
+        a, s = activities.index(activity), subjects.index(subject)
+        metrics[a, s, :len(times)] = block_metrics
+        n_rows[a, s] = len(times)
+
+    np.savez_compressed(output, activities=activities, activity_names=[names[activity] for activity in activities],
+                        subjects=subjects, limbs=LIMB_UNITS, metric_names=FATIGUE_METRICS, metrics=metrics,
+                        n_rows=n_rows, dataset_version=version, times=np.arange(1, n_reports + 1, dtype=np.float32))
+
+
+class FatigueIndex:
+    """
+    Lookup over the fatigue series written by build_fatigue_index, indexed by activity name and subject.
+    """
+
+    def __init__(self, path=FATIGUE_NAME):
+
+        with np.load(path) as index:
+            self.arrays = {key: index[key] for key in index.files}
+
+        self.activity_names = list(self.arrays['activity_names'])
+        self.subjects = list(self.arrays['subjects'])
+        self.dataset_version = str(self.arrays['dataset_version']) if 'dataset_version' in self.arrays else None
+
+    def has_block(self, activity_name, subject):
+
+        if activity_name not in self.activity_names or subject not in self.subjects:
+            return False
+
+        return self.arrays['n_rows'][self.activity_names.index(activity_name), self.subjects.index(subject)] > 0
+
+    def series(self, activity_name, subject):
+        """
+        Fatigue series of one subject and activity.
+
+        Returns:
+            times = (reports,) report times in seconds
+            metrics = (reports, limbs, 4) array ordered as FATIGUE_METRICS
+        """
+
+        a, s = self.activity_names.index(activity_name), self.subjects.index(subject)
+        n = self.arrays['n_rows'][a, s]
+
+        return self.arrays['times'][:n], self.arrays['metrics'][a, s, :n]
+
+
+def stream(lines, hop=SAMPLING_RATE, output=sys.stdout, errors=sys.stderr):
+    """
+    Updates the fatigue metrics from a live stream of comma-separated 45-channel samples and writes one line
+    of metrics per limb every hop samples. Malformed lines are reported to errors and skipped, see read_samples.
+    """
+
+    engine = FatigueEngine()
+    limb_positions = [DATA_COLUMNS.index(column) for column in LIMB_COLUMNS]
+
+    for sample in read_samples(lines, errors=errors):
+        acc_magnitude, gyro_magnitude = limb_magnitudes(sample[None, limb_positions])
+        engine.push(acc_magnitude[0], gyro_magnitude[0])
+
+        if engine.count % hop == 0:
+            for unit, limb_metrics in zip(LIMB_UNITS, engine.metrics()):
+                values = " ".join(f"{name}={value:.3f}" for name, value in zip(FATIGUE_METRICS, limb_metrics))
+                print(f"t={engine.count / SAMPLING_RATE:.0f}s limb={unit.rstrip('_')} {values}", file=output, flush=True)
+
+
+def parse_args():
+
+    parser = argparse.ArgumentParser(description="Precompute, or stream, rolling fatigue metrics of the limbs.")
+    parser.add_argument('--dataset', default=DATASET_NAME, help="Root folder of the partitioned dataset")
+    parser.add_argument('--output', default=FATIGUE_NAME, help="Path of the npz file to write")
+    parser.add_argument('--workers', type=int, default=None, help="Number of worker processes (defaults to the cpu count)")
+    parser.add_argument('--stream', action='store_true', help="Read comma-separated 45-channel samples from stdin instead")
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+
+    args = parse_args()
+
+    if args.stream:
+        stream(sys.stdin)
+    else:
+        build_fatigue_index(args.dataset, args.output, args.workers)
+        print("Completed!")
@@ -0,0 +1,172 @@
+import argparse
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from data_cleaning import DATA_COLUMNS, DATASET_NAME, partition_path
+from data_loader import dataset_partitions
+from tensor_store import SAMPLES_PER_SEGMENT
+
+FEATURES_NAME = 'sports_science_features.parquet'
+SAMPLING_RATE = 25
+PERCENTILES = [10, 25, 50, 75, 90]
+# Frequency bands in Hz, up to the 12.5 Hz Nyquist frequency of the 25 Hz sensors
+FFT_BANDS = [(0.0, 0.5), (0.5, 1.5), (1.5, 3.0), (3.0, 5.0), (5.0, 8.0), (8.0, 12.5)]
+LABEL_COLUMNS = ['activity', 'activity_name', 'subject', 'segment']
+
+
+def feature_names(columns=DATA_COLUMNS):
+    """
+    Names of the window features in the order produced by window_features.
+
+    Args:
+        columns = sensor column names
+    Returns:
+        names = list of <column>_<feature> names
+    """
+
+    features = ['mean', 'std', 'min', 'max'] + [f'p{q}' for q in PERCENTILES] + ['zero_crossings'] \
+        + [f'fft_{low:g}_{high:g}hz' for low, high in FFT_BANDS]
+
+    return [f'{column}_{feature}' for feature in features for column in columns]
+
+
+def fft_band_masks(n_samples):
+    """
+    Masks of the rfft bins that fall in each of the FFT_BANDS. Bands are half-open, except the last one which
+    includes the Nyquist frequency.
+
+    Args:
+        n_samples = window length
+    Returns:
+        masks = list of boolean arrays over the rfft bins
+    """
+
+    frequencies = np.fft.rfftfreq(n_samples, d=1 / SAMPLING_RATE)
+
+    return [(frequencies >= low) & ((frequencies < high) if high < FFT_BANDS[-1][1] else (frequencies <= high))
+            for low, high in FFT_BANDS]
+
+
+def window_features(windows):
+    """
+    Computes the features of a batch of windows for every channel at once.
+
+    Args:
+        windows = (windows, samples, channels) array
+    Returns:
+        features = (windows, features) float32 array ordered as feature_names()
+    """
+
+    windows = windows.astype(np.float64)
+    mean = windows.mean(axis=1)
+    centered = windows - mean[:, None, :]
+
+    # Crossings of the window mean, so that the gravity offset of the accelerometers does not hide them
+    signs = np.signbit(centered)
+    zero_crossings = (signs[:, 1:] != signs[:, :-1]).sum(axis=1)
+
+    power = np.abs(np.fft.rfft(centered, axis=1)) ** 2 / windows.shape[1]
+    band_energies = [power[:, in_band].sum(axis=1) for in_band in fft_band_masks(windows.shape[1])]
+
+    features = [mean, windows.std(axis=1), windows.min(axis=1), windows.max(axis=1)] \
+        + list(np.percentile(windows, PERCENTILES, axis=1)) + [zero_crossings] + band_energies
+
+    return np.concatenate(features, axis=1).astype(np.float32)
+
+
+def partition_features(dataset, activity, subject, activity_name=None):
+    """
+    Computes the features of every segment of one activity/subject partition.
+
+    Args:
+        dataset = root folder of the partitioned dataset
+        activity = activity folder code
+        subject = subject code
+        activity_name = activity name (read from the partition if not given)
+    Returns:
+        df = dataframe with one row per segment of label columns and features
+    """
+
+    block = pd.read_parquet(partition_path(dataset, activity, subject), columns=DATA_COLUMNS + ['segment', 'activity_name'])
+    segments = block['segment'].drop_duplicates().astype(str).tolist()
+    windows = block[DATA_COLUMNS].to_numpy().reshape(len(segments), SAMPLES_PER_SEGMENT, len(DATA_COLUMNS))
+
+    if activity_name is None:
+        activity_name = str(block['activity_name'].iloc[0]) if len(block) else activity
+
+    df = pd.DataFrame(window_features(windows), columns=feature_names())
+    df.insert(0, 'segment', segments)
+    df.insert(0, 'subject', subject)
+    df.insert(0, 'activity_name', activity_name)
+    df.insert(0, 'activity', activity)
+
+    return df
+
+
+def iter_feature_chunks(dataset=DATASET_NAME, subjects=None, activity_names=None, chunk_partitions=16):
+    """
+    Streams the segment features of the dataset, reading a few partitions at a time, so that memory stays
+    bounded by the chunk size rather than the dataset size.
+
+    Args:
+        dataset = root folder of the partitioned dataset
+        subjects = subjects to include (defaults to all)
+        activity_names = activity names to include (defaults to all)
+        chunk_partitions = number of activity/subject partitions per yielded chunk
+    Returns:
+        chunks = generator of feature dataframes
+    """
+
+    partitions, codes = dataset_partitions(dataset)
+    names = {code: name for name, code in codes.items()}
+    partitions = [(activity, subject) for activity, subject in partitions
+                  if (subjects is None or subject in subjects)
+                  and (activity_names is None or names[activity] in activity_names)]
+
+    for start in range(0, len(partitions), chunk_partitions):
+        yield pd.concat([partition_features(dataset, activity, subject, names[activity])
+                         for activity, subject in partitions[start:start + chunk_partitions]], ignore_index=True)
+
+
+def build_feature_matrix(dataset=DATASET_NAME, output=FEATURES_NAME, chunk_partitions=16):
+    """
+    Writes the segment features of the whole dataset to one parquet file, chunk by chunk.
+
+    Args:
+        dataset = root folder of the partitioned dataset
+        output = path of the parquet file to write
+        chunk_partitions = number of activity/subject partitions per chunk
+    Returns:
+        None
+    """
+
+    writer = None
+    try:
+        for chunk in iter_feature_chunks(dataset, chunk_partitions=chunk_partitions):
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(output, table.schema, compression='zstd')
+            writer.write_table(table)
+            print(f"Segments written: {len(chunk)}")
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def parse_args():
+
+    parser = argparse.ArgumentParser(description="Compute per-segment window features of every channel for modeling.")
+    parser.add_argument('--dataset', default=DATASET_NAME, help="Root folder of the partitioned dataset")
+    parser.add_argument('--output', default=FEATURES_NAME, help="Path of the parquet file to write")
+    parser.add_argument('--chunk-partitions', type=int, default=16, help="Activity/subject partitions per chunk")
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+
+    args = parse_args()
+    build_feature_matrix(args.dataset, args.output, args.chunk_partitions)
+    print("Completed!")
@@ -0,0 +1,419 @@
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import tempfile
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from os.path import join
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+from mlflow.entities import Metric, Param
+from mlflow.tracking import MlflowClient
+from sklearn.metrics import accuracy_score, f1_score, precision_score, recall_score, roc_auc_score
+from sklearn.model_selection import train_test_split
+from sklearn.preprocessing import LabelEncoder, label_binarize
+
+from data_cleaning import DATA_COLUMNS, DATASET_NAME
+from data_loader import dataset_activity_names, load_selection
+from features import LABEL_COLUMNS
+
+SWEEP_NAME = 'sports_science_sweep'
+RANDOM_SEED = 0
+TEST_SIZE = 0.10
+VALIDATION_SIZE = 0.10
+SPLIT_ARRAYS = ['X_train', 'y_train', 'X_valid', 'y_valid', 'X_test', 'y_test']
+MLFLOW_BATCH_SIZE = 1000
+
+# DMatrices of the shared split, built once per worker process by init_worker
+worker_data = {}
+
+
+def load_sweep_data(subject, activity_names, dataset=DATASET_NAME, features_path=None):
+    """
+    Loads the modeling rows of one subject and its activities, either the raw 25 Hz samples from the partitioned
+    dataset or the per-segment window features written by features.py.
+
+    Args:
+        subject = subject code, e.g. p1
+        activity_names = activity names to classify
+        dataset = root folder of the partitioned dataset
+        features_path = path of the feature matrix parquet file, or None for the raw samples
+    Returns:
+        X = (rows, features) float32 array
+        y = encoded activity labels
+        classes = activity names in label order
+    """
+
+    if features_path is None:
+        df = load_selection(subject, activity_names, dataset=dataset)
+        X = df[DATA_COLUMNS]
+    else:
+        df = pd.read_parquet(features_path)
+        df = df[(df["subject"].astype(str) == subject) & (df["activity_name"].isin(activity_names))]
+        X = df.drop(columns=LABEL_COLUMNS)
+
+    le = LabelEncoder()
+    y = le.fit_transform(df["activity_name"].astype(str))
+
+    return X.to_numpy(np.float32), y, list(le.classes_)
+
+
+def split_once(X, y, output):
+    """
+    Makes the stratified train/validation/test split once for the whole sweep and saves it as .npy files that
+    the workers memory-map. The validation set drives early stopping, so the test set stays untouched.
+
+    Args:
+        X = (rows, features) array
+        y = encoded labels
+        output = sweep folder
+    Returns:
+        split_folder = folder of the split arrays
+        data_hash = hash of the split, so configurations are only resumed on the same data
+    """
+
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=TEST_SIZE, stratify=y, random_state=RANDOM_SEED)
+    X_train, X_valid, y_train, y_valid = train_test_split(X_train, y_train, test_size=VALIDATION_SIZE, stratify=y_train,
+                                                          random_state=RANDOM_SEED)
+
+    split_folder = join(output, 'split')
+    os.makedirs(split_folder, exist_ok=True)
+    digest = hashlib.sha1()
+    for name, values in zip(SPLIT_ARRAYS, [X_train, y_train, X_valid, y_valid, X_test, y_test]):
+        values = np.ascontiguousarray(values)
+        np.save(join(split_folder, f'{name}.npy'), values)
+        digest.update(values.tobytes())
+
+    return split_folder, digest.hexdigest()[:12]
+
+
+def init_worker(split_folder):
+    """
+    Converts the shared split into DMatrices once per worker process, so every configuration the worker trains
+    reuses them instead of converting the data again.
+    """
+
+    arrays = {name: np.load(join(split_folder, f'{name}.npy'), mmap_mode='r') for name in SPLIT_ARRAYS}
+    worker_data['dtrain'] = xgb.DMatrix(arrays['X_train'], label=arrays['y_train'])
+    worker_data['dvalid'] = xgb.DMatrix(arrays['X_valid'], label=arrays['y_valid'])
+    worker_data['dtest'] = xgb.DMatrix(arrays['X_test'])
+    worker_data['y_test'] = np.asarray(arrays['y_test'])
+
+
+def evaluation_metrics(y_test, predictions, n_classes):
+    """
+    Test set metrics, computed the same way as evaluate_model in data_modeling.ipynb so that sweep runs compare
+    with the notebook's runs.
+    """
+
+    labels = list(range(n_classes))
+    predicted_labels = np.unique(predictions)
+
+    return {
+        'accuracy': accuracy_score(y_test, predictions),
+        'f1': f1_score(y_test, predictions, average='weighted', labels=predicted_labels),
+        'precision': precision_score(y_test, predictions, average='weighted', labels=predicted_labels),
+        'recall': recall_score(y_test, predictions, average='weighted', labels=predicted_labels),
+        'roc_auc': roc_auc_score(label_binarize(y_test, classes=labels), label_binarize(predictions, classes=labels),
+                                 average='weighted', multi_class='ovo'),
+    }
+
+
+def train_config(config):
+    """
+    Trains and evaluates one configuration on the worker's DMatrices, with early stopping on the validation set.
+    Errors are returned rather than raised, so one bad configuration does not stop the sweep.
+
+    Args:
+        config = dictionary of config_id, params, threads, num_boost_round, early_stopping_rounds and model_path
+    Returns:
+        result = dictionary of status, test metrics, validation history, or the error traceback
+    """
+
+    try:
+        params = dict(config['params'], nthread=config['threads'])
+        evals_result = {}
+        booster = xgb.train(params, worker_data['dtrain'], num_boost_round=config['num_boost_round'],
+                            evals=[(worker_data['dvalid'], 'validation')], evals_result=evals_result,
+                            early_stopping_rounds=config['early_stopping_rounds'], verbose_eval=False)
+
+        best_iteration = booster.best_iteration
+        probabilities = booster.predict(worker_data['dtest'], iteration_range=(0, best_iteration + 1))
+        metrics = evaluation_metrics(worker_data['y_test'], probabilities.argmax(axis=1), params['num_class'])
+        metrics['best_iteration'] = best_iteration
+        booster.save_model(config['model_path'])
+
+        return {'status': 'FINISHED', 'metrics': metrics, 'history': evals_result['validation']}
+    except Exception:
+        return {'status': 'FAILED', 'error': traceback.format_exc()}
+
+
+def sweep_configs(grid, base_params, data_hash, output, num_boost_round, early_stopping_rounds, run_prefix):
+    """
+    Expands a parameter grid into configurations, each with a stable id derived from its parameters and the data.
+
+    Args:
+        grid = dictionary of parameter name to list of values
+        base_params = XGBoost parameters shared by every configuration
+        data_hash = hash of the split the configurations train on
+        output = sweep folder, where the models are saved
+        num_boost_round = maximum boosting rounds
+        early_stopping_rounds = rounds without validation improvement before stopping
+        run_prefix = prefix of the MLflow run names
+    Returns:
+        configs = list of configuration dictionaries
+    """
+
+    os.makedirs(join(output, 'models'), exist_ok=True)
+    names = sorted(grid)
+    configs = []
+
+    for values in itertools.product(*(grid[name] for name in names)):
+        swept = dict(zip(names, values))
+        params = dict(base_params, **swept)
+        identity = json.dumps([params, data_hash, num_boost_round, early_stopping_rounds], sort_keys=True, default=str)
+        config_id = hashlib.sha1(identity.encode()).hexdigest()[:12]
+        configs.append({
+            'config_id': config_id,
+            'run_name': f"{run_prefix} " + ", ".join(f"{name}: {value}" for name, value in swept.items()),
+            'params': params,
+            'num_boost_round': num_boost_round,
+            'early_stopping_rounds': early_stopping_rounds,
+            'model_path': join(output, 'models', f'{config_id}.json'),
+        })
+
+    return configs
+
+
+def local_tracking_uri(output=SWEEP_NAME):
+    """
+    File-based MLflow store inside the sweep folder.
+    """
+
+    return Path(output, 'mlruns').resolve().as_uri()
+
+
+def experiment_id(client, name):
+
+    experiment = client.get_experiment_by_name(name)
+
+    return experiment.experiment_id if experiment is not None else client.create_experiment(name)
+
+
+def finished_config_ids(client, experiment):
+    """
+    Ids of the configurations that already have a finished run, which a rerun of the sweep skips.
+    """
+
+    runs = client.search_runs([experiment], filter_string="attributes.status = 'FINISHED'", max_results=50000)
+
+    return {run.data.tags.get('config_id') for run in runs}
+
+
+def log_batches(client, run_id, metrics, params):
+    """
+    Logs params and metrics in batches no larger than MLflow accepts per call.
+    """
+
+    client.log_batch(run_id, params=params)
+    for start in range(0, len(metrics), MLFLOW_BATCH_SIZE):
+        client.log_batch(run_id, metrics=metrics[start:start + MLFLOW_BATCH_SIZE])
+
+
+def log_result(client, experiment, config, result, data_hash):
+    """
+    Records one configuration as an MLflow run: its parameters, test metrics, per-round validation loss and
+    saved model, or its error when it failed.
+    """
+
+    run = client.create_run(experiment, tags={'mlflow.runName': config['run_name'], 'config_id': config['config_id'],
+                                              'data_hash': data_hash})
+    run_id = run.info.run_id
+    timestamp = run.info.start_time
+
+    params = dict(config['params'], threads=config['threads'], num_boost_round=config['num_boost_round'],
+                  early_stopping_rounds=config['early_stopping_rounds'])
+    metrics = []
+    if result['status'] == 'FINISHED':
+        metrics = [Metric(key, float(value), timestamp, 0) for key, value in result['metrics'].items()]
+        for key, values in result['history'].items():
+            metrics += [Metric(f'validation_{key}', float(value), timestamp, step) for step, value in enumerate(values)]
+    log_batches(client, run_id, metrics, [Param(key, str(value)) for key, value in params.items()])
+
+    if result['status'] == 'FINISHED':
+        client.log_artifact(run_id, config['model_path'])
+    else:
+        client.set_tag(run_id, 'error', result['error'][-5000:])
+    client.set_terminated(run_id, status=result['status'])
+
+
+def sync_runs(client, experiment, experiment_name, remote_uri):
+    """
+    Copies finished local runs that have not been synced yet to a remote MLflow server, e.g. DagsHub, with their
+    parameters, full metric histories and artifacts. Credentials are read by MLflow from the
+    MLFLOW_TRACKING_USERNAME and MLFLOW_TRACKING_PASSWORD environment variables. Runs that fail to sync are
+    retried on the next sweep.
+
+    Returns:
+        n_synced = number of runs copied
+    """
+
+    remote = MlflowClient(tracking_uri=remote_uri)
+    remote_experiment = experiment_id(remote, experiment_name)
+    n_synced = 0
+
+    for run in client.search_runs([experiment], filter_string="attributes.status = 'FINISHED'", max_results=50000):
+        if 'synced_run_id' in run.data.tags:
+            continue
+
+        try:
+            tags = {key: value for key, value in run.data.tags.items() if not key.startswith('mlflow.') or key == 'mlflow.runName'}
+            remote_run = remote.create_run(remote_experiment, start_time=run.info.start_time, tags=tags)
+            remote_id = remote_run.info.run_id
+
+            metrics = [metric for key in run.data.metrics for metric in client.get_metric_history(run.info.run_id, key)]
+            log_batches(remote, remote_id, metrics, [Param(key, value) for key, value in run.data.params.items()])
+            with tempfile.TemporaryDirectory() as artifacts:
+                remote.log_artifacts(remote_id, client.download_artifacts(run.info.run_id, '', artifacts))
+            remote.set_terminated(remote_id, status='FINISHED', end_time=run.info.end_time)
+
+            client.set_tag(run.info.run_id, 'synced_run_id', remote_id)
+            n_synced += 1
+        except Exception as e:
+            print(f"Could not sync run {run.info.run_id}: {e}")
+
+    return n_synced
+
+
+def run_sweep(X, y, classes, grid, output=SWEEP_NAME, workers=None, threads_per_worker=None, num_boost_round=1000,
+              early_stopping_rounds=20, experiment_name=SWEEP_NAME, remote_uri=None, run_prefix='xgb_clf'):
+    """
+    Runs an XGBoost hyperparameter sweep headlessly. The split and DMatrix conversion happen once, configurations
+    train in parallel on a process pool with a fixed number of XGBoost threads per worker, and every run is
+    tracked in a local file-based MLflow store. Configurations that already finished on the same data are
+    skipped, so rerunning the sweep resumes the skipped and failed ones.
+
+    Args:
+        X = (rows, features) array
+        y = encoded labels
+        classes = label names in label order
+        grid = dictionary of XGBoost parameter name to list of values, e.g. {"eta": [0.2, 0.3]}
+        output = sweep folder for the split, models and MLflow store
+        workers = worker processes (defaults to one per pending configuration, up to the cpu count)
+        threads_per_worker = XGBoost threads per worker (defaults to splitting the cpus between the workers)
+        num_boost_round = maximum boosting rounds
+        early_stopping_rounds = rounds without validation improvement before stopping
+        experiment_name = MLflow experiment name
+        remote_uri = optional MLflow tracking uri the finished runs are synced to
+        run_prefix = prefix of the MLflow run names
+    Returns:
+        results = dataframe of every configuration's status and test metrics, from its latest finished run, or
+                  its latest run if none finished
+    """
+
+    os.makedirs(output, exist_ok=True)
+    split_folder, data_hash = split_once(X, y, output)
+
+    client = MlflowClient(tracking_uri=local_tracking_uri(output))
+    experiment = experiment_id(client, experiment_name)
+    done = finished_config_ids(client, experiment)
+
+    cpu_count = os.cpu_count() or 1
+    base_params = {'objective': 'multi:softprob', 'num_class': len(classes), 'base_score': 1 / len(classes),
+                   'eval_metric': 'mlogloss', 'tree_method': 'hist', 'seed': RANDOM_SEED}
+    configs = sweep_configs(grid, base_params, data_hash, output, num_boost_round, early_stopping_rounds, run_prefix)
+    pending = [config for config in configs if config['config_id'] not in done]
+
+    workers = workers or max(1, min(len(pending), cpu_count))
+    threads_per_worker = threads_per_worker or max(1, cpu_count // workers)
+    print(f"{len(configs) - len(pending)} of {len(configs)} configurations already finished, "
+          f"training {len(pending)} on {workers} workers x {threads_per_worker} threads")
+    pending = [dict(config, threads=threads_per_worker) for config in pending]
+
+    if pending:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(split_folder,)) as pool:
+            futures = {pool.submit(train_config, config): config for config in pending}
+            for future in as_completed(futures):
+                config = futures[future]
+                try:
+                    result = future.result()
+                except Exception:
+                    # A crashed worker breaks the pool, so its configuration and the unfinished ones are retried on resume
+                    result = {'status': 'FAILED', 'error': traceback.format_exc()}
+
+                log_result(client, experiment, config, result, data_hash)
+                print(f"{config['run_name']}: {result['status']}"
+                      + (f", accuracy {result['metrics']['accuracy']:.3f}" if result['status'] == 'FINISHED' else ""))
+
+    if remote_uri is not None:
+        print(f"Synced {sync_runs(client, experiment, experiment_name, remote_uri)} runs to {remote_uri}")
+
+    config_ids = {config['config_id'] for config in configs}
+    runs = client.search_runs([experiment], max_results=50000)
+    results = pd.DataFrame([
+        dict(run_name=run.data.tags.get('mlflow.runName'), config_id=run.data.tags.get('config_id'),
+             status=run.info.status, start_time=run.info.start_time, **run.data.metrics)
+        for run in runs if run.data.tags.get('config_id') in config_ids
+    ])
+    if results.empty:
+        return results
+
+    # A configuration that failed and was retried has several runs, only its latest finished one is reported
+    results = results.assign(finished=results['status'] == 'FINISHED').sort_values(['finished', 'start_time'])
+    results = results.drop_duplicates('config_id', keep='last').drop(columns=['finished', 'start_time'])
+
+    return results.sort_values('run_name').reset_index(drop=True)
+
+
+def parse_grid(values):
+    """
+    Parses --param name=value1,value2 arguments into a parameter grid, reading numbers as numbers.
+    """
+
+    grid = {}
+    for value in values:
+        name, options = value.split('=', 1)
+        grid[name] = []
+        for option in options.split(','):
+            try:
+                grid[name].append(json.loads(option))
+            except ValueError:
+                grid[name].append(option)
+
+    return grid
+
+
+def parse_args():
+
+    parser = argparse.ArgumentParser(description="Headless, parallel and resumable XGBoost hyperparameter sweep.")
+    parser.add_argument('--dataset', default=DATASET_NAME, help="Root folder of the partitioned dataset")
+    parser.add_argument('--features', default=None, help="Train on the feature matrix written by features.py instead of raw samples")
+    parser.add_argument('--subject', default='p1', help="Subject to model")
+    parser.add_argument('--activities', nargs='+', default=None, help="Activity names to classify (default: all)")
+    parser.add_argument('--param', action='append', default=[], help="Swept parameter, e.g. --param eta=0.2,0.3,0.4,0.5")
+    parser.add_argument('--output', default=SWEEP_NAME, help="Sweep folder for the split, models and MLflow store")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes")
+    parser.add_argument('--threads-per-worker', type=int, default=None, help="XGBoost threads per worker")
+    parser.add_argument('--num-boost-round', type=int, default=1000, help="Maximum boosting rounds")
+    parser.add_argument('--early-stopping-rounds', type=int, default=20, help="Rounds without validation improvement before stopping")
+    parser.add_argument('--experiment', default=SWEEP_NAME, help="MLflow experiment name")
+    parser.add_argument('--remote-uri', default=None, help="MLflow tracking uri to sync finished runs to, e.g. https://dagshub.com/<user>/<project>.mlflow")
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+
+    args = parse_args()
+    activities = args.activities or dataset_activity_names(args.dataset)
+    X, y, classes = load_sweep_data(args.subject, activities, args.dataset, args.features)
+
+    results = run_sweep(X, y, classes, parse_grid(args.param) or {'eta': [0.3]}, args.output, args.workers,
+                        args.threads_per_worker, args.num_boost_round, args.early_stopping_rounds, args.experiment,
+                        args.remote_uri)
+    print(results.to_string(index=False))
@@ -0,0 +1,251 @@
+import argparse
+import json
+import pickle
+import socket
+import sys
+import time
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+from sklearn.preprocessing import LabelEncoder
+
+from data_cleaning import DATA_COLUMNS, DATASET_NAME, read_samples
+from data_loader import load_selection
+from features import FEATURES_NAME, LABEL_COLUMNS, PERCENTILES, SAMPLING_RATE, feature_names, fft_band_masks
+from tensor_store import SAMPLES_PER_SEGMENT
+
+MODEL_NAME = 'activity_model.pkl'
+RANDOM_SEED = 0
+
+
+class OnlineFeatures:
+    """
+    Ring buffer of the last window of samples of every channel. Pushing a sample costs O(channels): it
+    overwrites the oldest sample and updates running sums, which give the mean and standard deviation without
+    a pass over the window and are recomputed once per window so that floating point drift stays bounded.
+    The order statistics (min, max, percentiles), mean crossings and FFT band energies depend on the whole
+    window, so features() computes them from the buffer: one rfft and one O(window) partition per channel,
+    about the cost of features.window_features on a single window. Predictions are made once per hop, so a
+    single rfft per prediction is cheaper than keeping a sliding DFT up to date on every sample for any hop
+    longer than a few samples. Produces the same features, in the same order, as features.window_features.
+    """
+
+    def __init__(self, n_channels=len(DATA_COLUMNS), window=SAMPLES_PER_SEGMENT):
+
+        self.window = window
+        self.buffer = np.zeros((window, n_channels))
+        self.position = 0
+        self.count = 0
+
+        self.sum = np.zeros(n_channels)
+        self.sum_squares = np.zeros(n_channels)
+        self.band_masks = fft_band_masks(window)
+
+    def push(self, sample):
+        """
+        Adds one sample of every channel, evicting the oldest one.
+
+        Args:
+            sample = (channels,) array
+        Returns:
+            None
+        """
+
+        self.sum += sample - self.buffer[self.position]
+        self.sum_squares += sample ** 2 - self.buffer[self.position] ** 2
+
+        self.buffer[self.position] = sample
+        self.position = (self.position + 1) % self.window
+        self.count += 1
+
+        if self.position == 0:
+            self.sum = self.buffer.sum(axis=0)
+            self.sum_squares = (self.buffer ** 2).sum(axis=0)
+
+    def ordered(self):
+        """
+        The buffered window from oldest to newest sample.
+        """
+
+        return np.concatenate([self.buffer[self.position:], self.buffer[:self.position]])
+
+    def ready(self):
+
+        return self.count >= self.window
+
+    def features(self):
+        """
+        Features of the current window.
+
+        Returns:
+            features = (features,) float32 array ordered as features.feature_names()
+        """
+
+        ordered = self.ordered()
+        mean = self.sum / self.window
+        std = np.sqrt(np.maximum(self.sum_squares / self.window - mean ** 2, 0))
+        centered = ordered - mean
+
+        signs = np.signbit(centered)
+        zero_crossings = (signs[1:] != signs[:-1]).sum(axis=0)
+
+        power = np.abs(np.fft.rfft(centered, axis=0)) ** 2 / self.window
+        band_energies = [power[in_band].sum(axis=0) for in_band in self.band_masks]
+
+        features = [mean, std, ordered.min(axis=0), ordered.max(axis=0)] \
+            + list(np.percentile(ordered, PERCENTILES, axis=0)) + [zero_crossings] + band_energies
+
+        return np.concatenate(features).astype(np.float32)
+
+
+def train_model(features_path=FEATURES_NAME, output=MODEL_NAME):
+    """
+    Trains the XGBoost activity classifier on the per-segment feature matrix written by features.py and saves
+    it together with its label classes.
+
+    Args:
+        features_path = path of the feature matrix parquet file
+        output = path of the pickled model to write
+    Returns:
+        None
+    """
+
+    sports_science_features = pd.read_parquet(features_path)
+    X = sports_science_features.drop(columns=LABEL_COLUMNS)
+    le = LabelEncoder()
+    y = le.fit_transform(sports_science_features["activity_name"])
+
+    model = xgb.XGBClassifier(objective="multi:softprob", random_state=RANDOM_SEED)
+    model.fit(X.to_numpy(), y)
+
+    with open(output, 'wb') as f:
+        pickle.dump({'model': model, 'classes': list(le.classes_), 'feature_names': list(X.columns)}, f)
+
+
+def socket_lines(port):
+    """
+    Accepts one connection on a local TCP port and yields its lines.
+    """
+
+    with socket.create_server(('127.0.0.1', port)) as server:
+        print(f"Listening on 127.0.0.1:{port}", file=sys.stderr)
+        connection, _ = server.accept()
+        with connection, connection.makefile('r') as lines:
+            yield from lines
+
+
+def serve(model_path, lines, hop=SAMPLING_RATE, latency_budget_ms=50.0, output=sys.stdout):
+    """
+    Classifies the activity of a live sample stream. A prediction is emitted every hop samples once a full
+    window has been buffered, and throughput and prediction latency percentiles are reported when the stream
+    ends.
+
+    Args:
+        model_path = path of the pickled model written by train_model
+        lines = iterable of comma-separated sample lines
+        hop = number of samples between predictions
+        latency_budget_ms = prediction latency budget, from the last sample to the emitted prediction
+        output = stream the predictions are written to
+    Returns:
+        report = dictionary of samples, predictions, samples per second and latency percentiles in ms
+    """
+
+    with open(model_path, 'rb') as f:
+        saved = pickle.load(f)
+    model, classes = saved['model'], saved['classes']
+    if saved['feature_names'] != feature_names():
+        raise ValueError("The model was trained on a different feature layout")
+
+    online = OnlineFeatures()
+    latencies = []
+    start = time.perf_counter()
+
+    for sample in read_samples(lines):
+        received = time.perf_counter()
+        online.push(sample)
+
+        if online.ready() and (online.count - online.window) % hop == 0:
+            probabilities = model.predict_proba(online.features()[None, :])[0]
+            latency_ms = (time.perf_counter() - received) * 1000
+            latencies.append(latency_ms)
+
+            best = int(np.argmax(probabilities))
+            flag = "" if latency_ms <= latency_budget_ms else " over_budget"
+            print(f"sample={online.count} activity={classes[best]} probability={probabilities[best]:.3f} "
+                  f"latency_ms={latency_ms:.2f}{flag}", file=output, flush=True)
+
+    elapsed = time.perf_counter() - start
+    latencies = np.array(latencies)
+    report = {
+        'samples': online.count,
+        'predictions': len(latencies),
+        'samples_per_second': online.count / elapsed if elapsed > 0 else 0.0,
+        'latency_budget_ms': latency_budget_ms,
+        'over_budget': int((latencies > latency_budget_ms).sum()),
+    }
+    if len(latencies):
+        report.update({f'latency_p{q}_ms': float(np.percentile(latencies, q)) for q in [50, 95, 99]})
+
+    return report
+
+
+def replay(subject, activity_names, dataset=DATASET_NAME, rate=None, output=sys.stdout):
+    """
+    Writes the ingested samples of one subject as comma-separated lines, to be piped into serve.
+
+    Args:
+        subject = subject code, e.g. p1
+        activity_names = activity names to replay, in order
+        dataset = root folder of the partitioned dataset
+        rate = samples per second to pace the replay at, or None to replay as fast as possible
+        output = stream the lines are written to
+    Returns:
+        None
+    """
+
+    for activity_name in activity_names:
+        values = load_selection(subject, activity_name, dataset=dataset)[DATA_COLUMNS].to_numpy()
+        for sample in values:
+            output.write(','.join(f'{value:.5f}' for value in sample) + '\n')
+            if rate:
+                time.sleep(1 / rate)
+        output.flush()
+
+
+def parse_args():
+
+    parser = argparse.ArgumentParser(description="Online activity inference over a 45-channel, 25 Hz sensor stream.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    train = commands.add_parser('train', help="Train the classifier on the feature matrix")
+    train.add_argument('--features', default=FEATURES_NAME, help="Path of the feature matrix written by features.py")
+    train.add_argument('--model', default=MODEL_NAME, help="Path of the model to write")
+
+    serve_parser = commands.add_parser('serve', help="Classify samples from stdin or a local socket")
+    serve_parser.add_argument('--model', default=MODEL_NAME, help="Path of the trained model")
+    serve_parser.add_argument('--port', type=int, default=None, help="Read samples from this local TCP port instead of stdin")
+    serve_parser.add_argument('--hop', type=int, default=SAMPLING_RATE, help="Samples between predictions")
+    serve_parser.add_argument('--latency-budget-ms', type=float, default=50.0, help="Prediction latency budget")
+
+    replay_parser = commands.add_parser('replay', help="Write the ingested samples of a subject to stdout")
+    replay_parser.add_argument('--dataset', default=DATASET_NAME, help="Root folder of the partitioned dataset")
+    replay_parser.add_argument('--subject', default='p1', help="Subject to replay")
+    replay_parser.add_argument('--activities', nargs='+', required=True, help="Activity names to replay, in order")
+    replay_parser.add_argument('--rate', type=float, default=None, help="Samples per second (default: as fast as possible)")
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+
+    args = parse_args()
+
+    if args.command == 'train':
+        train_model(args.features, args.model)
+        print("Completed!")
+    elif args.command == 'serve':
+        lines = sys.stdin if args.port is None else socket_lines(args.port)
+        report = serve(args.model, lines, args.hop, args.latency_budget_ms)
+        print(json.dumps(report, indent=1), file=sys.stderr)
+    else:
+        replay(args.subject, args.activities, args.dataset, args.rate)
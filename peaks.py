@@ -0,0 +1,263 @@
+import argparse
+import numpy as np
+import pandas as pd
+import scipy.signal as sig
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from data_cleaning import DATA_COLUMNS, DATASET_NAME, dataset_version, partition_path
+from data_loader import dataset_partitions
+from tensor_store import natural_key
+
+PEAK_INDEX_NAME = 'sports_science_peaks.npz'
+SAMPLING_RATE = 25
+
+
+def candidate_peaks(x):
+    """
+    Finds every local maximum of a signal together with its prominence. Filtering the result with
+    filter_peaks gives the same peaks as sig.find_peaks(x, prominence=threshold).
+
+    Args:
+        x = 1d signal
+    Returns:
+        peaks = sample positions of all local maxima
+        prominences = prominence of each peak
+    """
+
+    x = np.asarray(x, dtype=np.float64)
+    peaks = sig.find_peaks(x)[0]
+
+    return peaks, sig.peak_prominences(x, peaks)[0]
+
+
+def filter_peaks(peaks, prominences, prominence):
+    """
+    Keeps the candidate peaks whose prominence reaches the threshold.
+    """
+
+    return peaks[prominences >= prominence]
+
+
+def strongest_peaks(peaks, prominences, limit):
+    """
+    Keeps at most limit peaks, the most prominent ones, in their original order.
+
+    Args:
+        peaks = sample positions of the peaks
+        prominences = prominence of each peak
+        limit = maximum number of peaks to keep
+    Returns:
+        peaks = sorted sample positions of the kept peaks
+    """
+
+    peaks = np.asarray(peaks, dtype=np.int64)
+    if len(peaks) <= limit:
+        return peaks
+
+    return np.sort(peaks[np.argsort(-np.asarray(prominences), kind='stable')[:limit]])
+
+
+def block_peaks(values):
+    """
+    Finds the candidate peaks of every channel of one activity/subject block.
+
+    Args:
+        values = (rows, channels) array of sensor values
+    Returns:
+        peaks = list of (peaks, prominences) tuples, one per channel
+    """
+
+    return [candidate_peaks(values[:, c]) for c in range(values.shape[1])]
+
+
+class SignalCache:
+    """
+    Small LRU of results computed from one signal, keyed by the caller (e.g. subject, activity and column).
+    peak_cache keeps candidate peaks so that moving the prominence slider only re-filters cached prominences
+    instead of searching for peaks again. Safe to use from the dashboard's render threads.
+    """
+
+    def __init__(self, compute, maxsize=256):
+
+        self.compute = compute
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, values):
+        """
+        Returns the cached result for key, computing it from values() on a miss.
+
+        Args:
+            key = hashable cache key
+            values = callable returning the 1d signal, only called on a miss
+        Returns:
+            result = compute(values())
+        """
+
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+
+        result = self.compute(values())
+
+        with self.lock:
+            self.entries[key] = result
+            if len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+        return result
+
+
+peak_cache = SignalCache(candidate_peaks)
+
+
+def partition_peaks(task):
+    """
+    Process pool worker that reads one partition and finds the candidate peaks of all 45 channels.
+
+    Args:
+        task = tuple of (dataset, activity, subject)
+    Returns:
+        result = tuple of (activity, subject, number of rows, list of (peaks, prominences, heights) per channel)
+    """
+
+    dataset, activity, subject = task
+    values = pd.read_parquet(partition_path(dataset, activity, subject), columns=DATA_COLUMNS).to_numpy()
+
+    return activity, subject, len(values), [(peaks, prominences, values[peaks, c])
+                                            for c, (peaks, prominences) in enumerate(block_peaks(values))]
+
+
+def build_peak_index(dataset=DATASET_NAME, output=PEAK_INDEX_NAME, workers=None):
+    """
+    Finds the candidate peaks and prominences of every subject x activity x channel once and saves them as
+    flat arrays with (start, end) offsets per channel.
+
+    Args:
+        dataset = root folder of the partitioned dataset
+        output = path of the npz file to write
+        workers = number of worker processes (defaults to the cpu count)
+    Returns:
+        None
+    """
+
+    version = dataset_version(dataset)
+    partitions, codes = dataset_partitions(dataset)
+    activities = sorted({activity for activity, _ in partitions}, key=natural_key)
+    subjects = sorted({subject for _, subject in partitions}, key=natural_key)
+    names = {code: name for name, code in codes.items()}
+
+    offsets = np.zeros((len(activities), len(subjects), len(DATA_COLUMNS), 2), dtype=np.int64)
+    n_rows = np.zeros((len(activities), len(subjects)), dtype=np.int64)
+    positions, prominences, heights = [], [], []
+    end = 0
+
+    tasks = [(dataset, activity, subject) for activity, subject in partitions]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for activity, subject, rows, channels in pool.map(partition_peaks, tasks):
+            print(f"Activity: {activity}, Subject: {subject}, Peaks: {sum(len(peaks) for peaks, _, _ in channels)}")
+            a, s = activities.index(activity), subjects.index(subject)
+            n_rows[a, s] = rows
+            for c, (channel_peaks, channel_prominences, channel_heights) in enumerate(channels):
+                offsets[a, s, c] = end, end + len(channel_peaks)
+                end += len(channel_peaks)
+                positions.append(channel_peaks.astype(np.int32))
+                prominences.append(channel_prominences.astype(np.float32))
+                heights.append(channel_heights.astype(np.float32))
+
+    np.savez_compressed(output, activities=activities, activity_names=[names[activity] for activity in activities],
+                        subjects=subjects, columns=DATA_COLUMNS, dataset_version=version, offsets=offsets, n_rows=n_rows,
+                        positions=np.concatenate(positions) if positions else np.zeros(0, dtype=np.int32),
+                        prominences=np.concatenate(prominences) if prominences else np.zeros(0, dtype=np.float32),
+                        heights=np.concatenate(heights) if heights else np.zeros(0, dtype=np.float32))
+
+
+class PeakIndex:
+    """
+    Lookup over the candidate peaks written by build_peak_index, indexed by activity name, subject and column.
+    """
+
+    def __init__(self, path=PEAK_INDEX_NAME):
+
+        with np.load(path) as index:
+            self.arrays = {key: index[key] for key in index.files}
+
+        self.activity_names = list(self.arrays['activity_names'])
+        self.subjects = list(self.arrays['subjects'])
+        self.columns = list(self.arrays['columns'])
+        self.dataset_version = str(self.arrays['dataset_version']) if 'dataset_version' in self.arrays else None
+
+    def has_block(self, activity_name, subject):
+
+        if activity_name not in self.activity_names or subject not in self.subjects:
+            return False
+
+        return self.arrays['n_rows'][self.activity_names.index(activity_name), self.subjects.index(subject)] > 0
+
+    def peaks(self, activity_name, subject, column):
+        """
+        Candidate peaks of one channel.
+
+        Returns:
+            peaks = sample positions of all local maxima
+            prominences = prominence of each peak
+        """
+
+        a, s = self.activity_names.index(activity_name), self.subjects.index(subject)
+        start, end = self.arrays['offsets'][a, s, self.columns.index(column)]
+
+        return self.arrays['positions'][start:end], self.arrays['prominences'][start:end]
+
+    def statistics(self, prominence):
+        """
+        Peak statistics of every subject x activity x channel at a prominence threshold, computed from the
+        cached prominences without touching the raw signals.
+
+        Args:
+            prominence = minimum prominence of a peak
+        Returns:
+            df = dataframe with peak count, peaks per minute, mean prominence and mean height per
+                 activity_name, subject and sensor
+        """
+
+        offsets = self.arrays['offsets'].reshape(-1, 2)
+        keep = self.arrays['prominences'] >= prominence
+        # Cumulative sums turn every per-channel count and total into two lookups
+        counts = np.concatenate([[0], np.cumsum(keep)])
+        prominence_sums = np.concatenate([[0], np.cumsum(np.where(keep, self.arrays['prominences'], 0))])
+        height_sums = np.concatenate([[0], np.cumsum(np.where(keep, self.arrays['heights'], 0))])
+
+        n_peaks = counts[offsets[:, 1]] - counts[offsets[:, 0]]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean_prominence = (prominence_sums[offsets[:, 1]] - prominence_sums[offsets[:, 0]]) / n_peaks
+            mean_height = (height_sums[offsets[:, 1]] - height_sums[offsets[:, 0]]) / n_peaks
+            minutes = np.repeat(self.arrays['n_rows'].reshape(-1), len(self.columns)) / SAMPLING_RATE / 60
+            peaks_per_minute = n_peaks / minutes
+
+        index = pd.MultiIndex.from_product([self.activity_names, self.subjects, self.columns],
+                                           names=['activity_name', 'subject', 'sensor'])
+        df = pd.DataFrame({'n_peaks': n_peaks, 'peaks_per_minute': peaks_per_minute,
+                           'mean_prominence': mean_prominence, 'mean_height': mean_height}, index=index)
+
+        return df[np.repeat(self.arrays['n_rows'].reshape(-1), len(self.columns)) > 0].reset_index()
+
+
+def parse_args():
+
+    parser = argparse.ArgumentParser(description="Precompute the candidate peaks and prominences of every channel.")
+    parser.add_argument('--dataset', default=DATASET_NAME, help="Root folder of the partitioned dataset")
+    parser.add_argument('--output', default=PEAK_INDEX_NAME, help="Path of the npz file to write")
+    parser.add_argument('--workers', type=int, default=None, help="Number of worker processes (defaults to the cpu count)")
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+
+    args = parse_args()
+    build_peak_index(args.dataset, args.output, args.workers)
+    print("Completed!")
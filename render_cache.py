@@ -0,0 +1,118 @@
+import io
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from diagnostics import StageRecorder
+
+RENDER_CACHE_BYTES = 256 * 1024 ** 2
+RENDER_WORKERS = 4
+
+
+class RenderCache:
+    """
+    LRU of rendered dashboard panels, or of any other values of known size such as loaded partitions, that
+    evicts the least recently used entries once the payloads exceed a memory budget. Safe to share between
+    reruns and worker threads.
+    """
+
+    def __init__(self, max_bytes=RENDER_CACHE_BYTES):
+
+        self.max_bytes = max_bytes
+        self.n_bytes = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Returns the rendered panel for key, or None on a miss.
+        """
+
+        with self.lock:
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+
+            return self.entries[key][0]
+
+    def put(self, key, value, n_bytes):
+        """
+        Stores a rendered panel and evicts the least recently used panels until the cache fits its budget.
+
+        Args:
+            key = hashable cache key
+            value = rendered panel
+            n_bytes = memory taken by the rendered panel
+        Returns:
+            None
+        """
+
+        with self.lock:
+            if key in self.entries:
+                self.n_bytes -= self.entries.pop(key)[1]
+            self.entries[key] = (value, n_bytes)
+            self.n_bytes += n_bytes
+
+            while self.n_bytes > self.max_bytes and len(self.entries) > 1:
+                self.n_bytes -= self.entries.popitem(last=False)[1][1]
+
+
+def render_figure(title, fig):
+    """
+    Serializes a panel so that showing it again costs no plotting: plotly figures as json, matplotlib figures
+    as png bytes at the resolution st.pyplot would use.
+
+    Args:
+        title = panel title
+        fig = plotly or matplotlib figure
+    Returns:
+        rendered = tuple of (title, kind, payload) where kind is "plotly" or "image"
+    """
+
+    if hasattr(fig, "to_json"):
+        return title, "plotly", fig.to_json()
+
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", dpi=200, bbox_inches="tight")
+
+    return title, "image", buffer.getvalue()
+
+
+render_cache = RenderCache()
+render_pool = ThreadPoolExecutor(max_workers=RENDER_WORKERS)
+
+
+def render_panels(panels, cache=None, pool=None, recorder=None):
+    """
+    Renders dashboard panels, reusing cached ones and drawing every cache miss concurrently on the worker pool.
+    Panel builders must not call streamlit themselves, since they run off the script thread.
+
+    Args:
+        panels = dictionary of cache key to a function returning (title, figure)
+        cache = RenderCache to read from and fill (defaults to the shared render_cache)
+        pool = executor the cache misses are drawn on (defaults to the shared render_pool)
+        recorder = StageRecorder timing the drawing and serialization of each cache miss
+    Returns:
+        rendered = dictionary of cache key to (title, kind, payload), in the order of panels
+    """
+
+    cache = render_cache if cache is None else cache
+    pool = render_pool if pool is None else pool
+    recorder = StageRecorder() if recorder is None else recorder
+
+    def render(build):
+
+        with recorder.stage("draw") as record:
+            title, fig = build()
+            record["detail"] = title
+        with recorder.stage("serialize", detail=title):
+            return render_figure(title, fig)
+
+    rendered = {key: cache.get(key) for key in panels}
+    futures = {key: pool.submit(render, build) for key, build in panels.items() if rendered[key] is None}
+
+    for key, future in futures.items():
+        rendered[key] = future.result()
+        cache.put(key, rendered[key], len(rendered[key][2]))
+
+    return rendered
@@ -0,0 +1,197 @@
+import argparse
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+from data_cleaning import DATA_COLUMNS, DATASET_NAME, dataset_version, partition_path
+from data_loader import dataset_partitions
+from features import window_features
+from streaming_pca import StreamingPCA
+from tensor_store import SAMPLES_PER_SEGMENT
+
+SEGMENT_INDEX_NAME = 'sports_science_segments.npz'
+# Body units of the dashboard and the prefixes of their sensor columns
+SEARCH_UNITS = {'Torso': ['T_'], 'Arms': ['LA_', 'RA_'], 'Legs': ['LL_', 'RL_'], 'All': ['T_', 'LA_', 'RA_', 'LL_', 'RL_']}
+EMBEDDING_MODES = ['features', 'raw']
+EMBEDDING_DIMENSIONS = 32
+# Raw windows are compressed to this many averaged points per channel (5 Hz)
+RAW_POINTS = 25
+
+
+def unit_columns(unit):
+    """
+    Sensor columns of a body unit of SEARCH_UNITS.
+    """
+
+    return [column for column in DATA_COLUMNS if any(column.startswith(prefix) for prefix in SEARCH_UNITS[unit])]
+
+
+def segment_vectors(windows, mode):
+    """
+    Describes every segment by one vector, either its window features or its compressed raw signal.
+
+    Args:
+        windows = (segments, samples, channels) array
+        mode = "features" for the window features of features.py, or "raw" for the window averaged down to
+               RAW_POINTS points per channel
+    Returns:
+        vectors = (segments, dimensions) float32 array
+    """
+
+    if mode == 'features':
+        return window_features(windows)
+
+    n_segments, n_samples, n_channels = windows.shape
+    pooled = windows.reshape(n_segments, RAW_POINTS, n_samples // RAW_POINTS, n_channels).mean(axis=2)
+
+    return pooled.reshape(n_segments, -1).astype(np.float32)
+
+
+def partition_vectors(task):
+    """
+    Process pool worker that reads one partition and describes its segments for every body unit.
+
+    Args:
+        task = tuple of (dataset, activity, subject, mode)
+    Returns:
+        result = tuple of (activity, subject, segments, dictionary of unit to (segments, dimensions) array)
+    """
+
+    dataset, activity, subject, mode = task
+    block = pd.read_parquet(partition_path(dataset, activity, subject), columns=DATA_COLUMNS + ['segment'])
+    segments = block['segment'].drop_duplicates().astype(str).tolist()
+    windows = block[DATA_COLUMNS].to_numpy().reshape(len(segments), SAMPLES_PER_SEGMENT, len(DATA_COLUMNS))
+
+    vectors = {}
+    for unit in SEARCH_UNITS:
+        positions = [DATA_COLUMNS.index(column) for column in unit_columns(unit)]
+        vectors[unit] = segment_vectors(windows[:, :, positions], mode)
+
+    return activity, subject, segments, vectors
+
+
+def embed(vectors, dimensions=EMBEDDING_DIMENSIONS):
+    """
+    Standardizes the segment vectors, compresses them with PCA and scales them to unit length, so that the dot
+    product of two embeddings is their cosine similarity.
+
+    Args:
+        vectors = (segments, dimensions) array
+        dimensions = number of principal components to keep
+    Returns:
+        embeddings = (segments, dimensions) float32 array
+    """
+
+    pca = StreamingPCA(min(dimensions, vectors.shape[1], len(vectors))).partial_fit(vectors)
+    embeddings = pca.transform(vectors)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+    return (embeddings / np.where(norms > 0, norms, 1)).astype(np.float32)
+
+
+def build_segment_index(dataset=DATASET_NAME, output=SEGMENT_INDEX_NAME, mode='features', dimensions=EMBEDDING_DIMENSIONS, workers=None):
+    """
+    Embeds every 5 second segment of the dataset, once per body unit, and saves the embeddings with their labels.
+
+    Args:
+        dataset = root folder of the partitioned dataset
+        output = path of the npz file to write
+        mode = "features" or "raw", see segment_vectors
+        dimensions = embedding dimensions
+        workers = number of worker processes (defaults to the cpu count)
+    Returns:
+        None
+    """
+
+    version = dataset_version(dataset)
+    partitions, codes = dataset_partitions(dataset)
+    names = {code: name for name, code in codes.items()}
+
+    tasks = [(dataset, activity, subject, mode) for activity, subject in partitions]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(partition_vectors, tasks))
+
+    labels = {'activity': [], 'activity_name': [], 'subject': [], 'segment': []}
+    for activity, subject, segments, _ in results:
+        labels['activity'] += [activity] * len(segments)
+        labels['activity_name'] += [names[activity]] * len(segments)
+        labels['subject'] += [subject] * len(segments)
+        labels['segment'] += segments
+
+    embeddings = {unit: embed(np.concatenate([vectors[unit] for _, _, _, vectors in results]), dimensions) for unit in SEARCH_UNITS}
+
+    np.savez(output, mode=mode, dataset_version=version, units=list(SEARCH_UNITS), **labels, **embeddings)
+
+
+class SegmentIndex:
+    """
+    Exact cosine similarity search over the segment embeddings written by build_segment_index. A query is one
+    matrix-vector product over the unit's embeddings, a few milliseconds for the whole dataset.
+    """
+
+    def __init__(self, path=SEGMENT_INDEX_NAME):
+
+        with np.load(path) as index:
+            self.arrays = {key: index[key] for key in index.files}
+
+        self.mode = str(self.arrays['mode'])
+        self.dataset_version = str(self.arrays['dataset_version']) if 'dataset_version' in self.arrays else None
+        self.labels = pd.DataFrame({key: self.arrays[key].astype(str) for key in ['activity', 'activity_name', 'subject', 'segment']})
+        self.positions = {label: i for i, label in enumerate(zip(self.labels['activity_name'], self.labels['subject'], self.labels['segment']))}
+
+    def has_segment(self, activity_name, subject, segment):
+
+        return (activity_name, subject, segment) in self.positions
+
+    def query(self, unit, activity_name, subject, segment, k=10, exclude_block=False):
+        """
+        Finds the segments whose movement of a body unit is most similar to a given segment.
+
+        Args:
+            unit = body unit of SEARCH_UNITS, e.g. Arms
+            activity_name = activity name of the query segment
+            subject = subject of the query segment
+            segment = segment label of the query segment, e.g. s01
+            k = number of matches
+            exclude_block = skip the other segments of the query's own subject and activity
+        Returns:
+            matches = dataframe of activity_name, subject, segment and similarity, most similar first,
+                      without the query segment itself
+        """
+
+        embeddings = self.arrays[unit]
+        position = self.positions[(activity_name, subject, segment)]
+        similarity = embeddings @ embeddings[position]
+
+        similarity[position] = -np.inf
+        if exclude_block:
+            same_block = (self.labels['activity_name'].to_numpy() == activity_name) & (self.labels['subject'].to_numpy() == subject)
+            similarity[same_block] = -np.inf
+
+        k = min(k, int(np.isfinite(similarity).sum()))
+        top = np.argpartition(-similarity, k - 1)[:k] if k > 0 else np.array([], dtype=np.int64)
+        top = top[np.argsort(-similarity[top])]
+
+        matches = self.labels.iloc[top][['activity_name', 'subject', 'segment']].reset_index(drop=True)
+        matches['similarity'] = similarity[top]
+
+        return matches
+
+
+def parse_args():
+
+    parser = argparse.ArgumentParser(description="Build a similarity search index over the 5 second segments of every body unit.")
+    parser.add_argument('--dataset', default=DATASET_NAME, help="Root folder of the partitioned dataset")
+    parser.add_argument('--output', default=SEGMENT_INDEX_NAME, help="Path of the npz file to write")
+    parser.add_argument('--mode', choices=EMBEDDING_MODES, default='features', help="Embed window features or compressed raw windows")
+    parser.add_argument('--dimensions', type=int, default=EMBEDDING_DIMENSIONS, help="Embedding dimensions")
+    parser.add_argument('--workers', type=int, default=None, help="Number of worker processes (defaults to the cpu count)")
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+
+    args = parse_args()
+    build_segment_index(args.dataset, args.output, args.mode, args.dimensions, args.workers)
+    print("Completed!")
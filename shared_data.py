@@ -0,0 +1,286 @@
+import argparse
+import functools
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from os.path import join
+
+from data_cleaning import DATA_COLUMNS, DATASET_NAME, dataset_version, is_current, partition_path
+from data_loader import dataset_partitions, has_partitioned_dataset
+from tensor_store import INDEX_FILE, channel_selector, natural_key
+
+SHARED_DATASET_NAME = 'sports_science_shared'
+DATA_FILE = 'data.arrow'
+
+
+def iter_partition_blocks(dataset=DATASET_NAME):
+    """
+    Reads the partitioned dataset one activity/subject block at a time.
+
+    Returns:
+        blocks = generator of (activity, activity_name, subject, block dataframe) tuples
+    """
+
+    partitions, codes = dataset_partitions(dataset)
+    names = {code: name for name, code in codes.items()}
+
+    for activity, subject in partitions:
+        block = pd.read_parquet(partition_path(dataset, activity, subject), columns=DATA_COLUMNS + ['segment'])
+        yield activity, names[activity], subject, block
+
+
+def iter_csv_blocks(filename):
+    """
+    Reads the complete csv written by data_cleaning.py --format csv (or its 5% subset) and splits it into
+    activity/subject blocks, keeping the csv row order within each block.
+
+    Returns:
+        blocks = generator of (activity, activity_name, subject, block dataframe) tuples
+    """
+
+    dtypes = {column: np.float32 for column in DATA_COLUMNS}
+    dtypes.update({column: "category" for column in ["segment", "subject", "activity", "activity_name"]})
+
+    df = pd.read_csv(filename, dtype=dtypes)
+    groups = df.groupby(["activity", "subject"], observed=True, sort=False).indices
+    for activity, subject in sorted(groups, key=lambda block: (natural_key(block[0]), natural_key(block[1]))):
+        block = df.iloc[groups[(activity, subject)]]
+        yield activity, str(block["activity_name"].iloc[0]), subject, block
+
+
+def build_shared_dataset(blocks, output=SHARED_DATASET_NAME, source='parquet', version=None):
+    """
+    Writes the dataset as an uncompressed Arrow IPC file with one record batch per activity/subject block, so
+    that it can be memory-mapped and read without copying. Each batch holds the 45 sensor channels of a row as
+    one fixed size list, which keeps a block's values contiguous as a (rows, 45) float32 array, and the row's
+    segment code. The block labels and segment names are written to a small json index next to it.
+
+    The files are written to a temporary folder that is then renamed into place, so several processes can
+    race to build the same dataset and readers never see a partial one.
+
+    Args:
+        blocks = iterable of (activity, activity_name, subject, block dataframe) tuples
+        output = folder to write the shared dataset to
+        source = "parquet" or "csv", recorded in the index since only the parquet row order matches the
+                 precomputed peak and fatigue indexes
+        version = dataset_version of the source, recorded so that a stale copy can be detected
+    Returns:
+        index = dictionary of the written block labels
+    """
+
+    temporary = f'{output}.{os.getpid()}.tmp'
+    os.makedirs(temporary, exist_ok=True)
+
+    schema = pa.schema([('values', pa.list_(pa.float32(), len(DATA_COLUMNS))), ('segment', pa.int16())])
+    index = {'source': source, 'dataset_version': version, 'columns': DATA_COLUMNS, 'blocks': []}
+
+    with pa.OSFile(join(temporary, DATA_FILE), 'wb') as sink, pa.ipc.new_file(sink, schema) as writer:
+        for activity, activity_name, subject, block in blocks:
+            segment = pd.Categorical(block['segment'].astype(str))
+            values = np.ascontiguousarray(block[DATA_COLUMNS].to_numpy(np.float32)).reshape(-1)
+            writer.write_batch(pa.record_batch([
+                pa.FixedSizeListArray.from_arrays(pa.array(values), len(DATA_COLUMNS)),
+                pa.array(segment.codes.astype(np.int16)),
+            ], schema=schema))
+            index['blocks'].append({'activity': activity, 'activity_name': activity_name, 'subject': subject,
+                                    'segments': list(segment.categories), 'rows': len(block)})
+
+    with open(join(temporary, INDEX_FILE), 'w') as f:
+        json.dump(index, f, indent=1)
+
+    try:
+        os.replace(temporary, output)
+    except OSError:
+        # Another process finished first, and its copy is identical
+        shutil.rmtree(temporary, ignore_errors=True)
+
+    return index
+
+
+class SharedDataset:
+    """
+    Read-only view over a dataset written by build_shared_dataset. The Arrow file is memory-mapped, so every
+    session and every process on the host reads the same pages of the OS page cache, and a selection is a view
+    of one record batch rather than a copy.
+    """
+
+    def __init__(self, path=SHARED_DATASET_NAME):
+
+        with open(join(path, INDEX_FILE)) as f:
+            self.index = json.load(f)
+
+        self.path = path
+        self.source = self.index['source']
+        self.dataset_version = self.index.get('dataset_version')
+        self.columns = self.index['columns']
+        self.source_file = pa.memory_map(join(path, DATA_FILE))
+        self.reader = pa.ipc.open_file(self.source_file)
+
+        blocks = self.index['blocks']
+        self.block_positions = {(block['activity'], block['subject']): i for i, block in enumerate(blocks)}
+        self.block_positions.update({(block['activity_name'], block['subject']): i for i, block in enumerate(blocks)})
+        self.activities = sorted({block['activity'] for block in blocks}, key=natural_key)
+        self.activity_names = [next(block['activity_name'] for block in blocks if block['activity'] == activity) for activity in self.activities]
+        self.subjects = sorted({block['subject'] for block in blocks}, key=natural_key)
+        self.n_rows = sum(block['rows'] for block in blocks)
+
+    def has_block(self, activity, subject):
+
+        return (activity, subject) in self.block_positions
+
+    def select(self, activity, subject, columns=None):
+        """
+        Selects one activity/subject block.
+
+        Args:
+            activity = activity folder code or name
+            subject = subject code, e.g. p1
+            columns = sensor column names, or None for all 45
+        Returns:
+            values = read-only (rows, channels) array backed by the memory map (a copy only if columns are not contiguous)
+            segment_codes = (rows,) segment code of every row
+        """
+
+        batch = self.reader.get_batch(self.block_positions[(activity, subject)])
+        values = batch.column(0).flatten().to_numpy(zero_copy_only=True).reshape(-1, len(self.columns))
+
+        return values[:, channel_selector(self.columns, columns)], batch.column(1).to_numpy(zero_copy_only=True)
+
+    def frame(self, activity, subject, columns=None):
+        """
+        Selects one activity/subject block as a dataframe shaped like the rows of the complete dataset,
+        with the sensor values backed by the memory map.
+
+        Args:
+            activity = activity folder code or name
+            subject = subject code, e.g. p1
+            columns = sensor column names, or None for all 45
+        Returns:
+            df = dataframe of the selected sensor columns plus segment, subject, activity and activity_name
+        """
+
+        columns = self.columns if columns is None else list(columns)
+        if not self.has_block(activity, subject):
+            return pd.DataFrame(columns=columns + ['segment', 'subject', 'activity', 'activity_name'])
+
+        block = self.index['blocks'][self.block_positions[(activity, subject)]]
+        values, segment_codes = self.select(activity, subject, columns)
+
+        df = pd.DataFrame(values, columns=columns, copy=False)
+        df['segment'] = pd.Categorical.from_codes(segment_codes, categories=block['segments'])
+        df['subject'] = subject
+        df['activity'] = block['activity']
+        df['activity_name'] = block['activity_name']
+
+        return df
+
+    def frames(self, activities, subject, columns=None):
+        """
+        Selects several activities of one subject as a single dataframe.
+
+        Args:
+            activities = activity folder codes or names
+            subject = subject code, e.g. p1
+            columns = sensor column names, or None for all 45
+        Returns:
+            df = concatenated dataframe in the layout of frame()
+        """
+
+        frames = [self.frame(activity, subject, columns) for activity in activities if self.has_block(activity, subject)]
+        if not frames:
+            return self.frame(None, subject, columns)
+
+        return pd.concat(frames, ignore_index=True)
+
+    def memory_footprint(self):
+        """
+        Memory used by the shared dataset. The mapped file is shared by every process on the host through the
+        page cache. Arrow's heap (its default memory pool) holds any copies Arrow made in this process and
+        stays near zero as long as selections are zero-copy. It does not include the rest of the process's
+        memory, such as the dataframes built from a selection.
+
+        Returns:
+            footprint = dictionary of rows, mapped_mb and arrow_heap_mb
+        """
+
+        return {
+            'rows': self.n_rows,
+            'mapped_mb': self.source_file.size() / 1024 ** 2,
+            'arrow_heap_mb': pa.total_allocated_bytes() / 1024 ** 2,
+        }
+
+
+def has_shared_dataset(path=SHARED_DATASET_NAME):
+    """
+    Whether a shared dataset has been built at this location.
+    """
+
+    return os.path.exists(join(path, INDEX_FILE))
+
+
+@functools.lru_cache(maxsize=4)
+def load_shared_dataset(path, index_mtime):
+    """
+    Maps the shared dataset once per process and build, keyed on the mtime of its index so that a rebuilt
+    dataset is mapped again.
+    """
+
+    return SharedDataset(path)
+
+
+def open_shared_dataset(path=SHARED_DATASET_NAME, version=None, csv_filename=None):
+    """
+    Opens the shared dataset once per process, without hashing anything on later calls. When it is missing or
+    was built from an earlier version of the data and a csv is given, it is (re)built from the csv first, so
+    the csv is only parsed once per host and change.
+
+    Args:
+        path = folder of the shared dataset
+        version = dataset_version of the data it should have been built from, or None to accept any
+        csv_filename = csv to convert if the shared dataset is missing or stale
+    Returns:
+        shared = SharedDataset, or None if it is missing or stale and there is no csv to build it from
+    """
+
+    shared = load_shared_dataset(path, os.path.getmtime(join(path, INDEX_FILE))) if has_shared_dataset(path) else None
+    if shared is not None and is_current(shared.dataset_version, version):
+        return shared
+
+    if csv_filename is None:
+        return None
+
+    # Readers that already mapped the stale file keep it until they exit
+    shutil.rmtree(path, ignore_errors=True)
+    build_shared_dataset(iter_csv_blocks(csv_filename), path, source='csv', version=version)
+
+    return load_shared_dataset(path, os.path.getmtime(join(path, INDEX_FILE)))
+
+
+def parse_args():
+
+    parser = argparse.ArgumentParser(description="Write the dataset as one memory-mapped Arrow file shared by every dashboard process.")
+    parser.add_argument('--dataset', default=DATASET_NAME, help="Root folder of the partitioned dataset")
+    parser.add_argument('--csv', default=None, help="Convert this csv written by data_cleaning.py --format csv instead")
+    parser.add_argument('--output', default=SHARED_DATASET_NAME, help="Folder to write the shared dataset to")
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+
+    args = parse_args()
+
+    if args.csv is None and not has_partitioned_dataset(args.dataset):
+        raise SystemExit(f"No partitioned dataset found at {args.dataset}, pass --csv to convert a csv instead")
+
+    # Readers that already mapped the old file keep it until they exit, new readers map the rebuilt one
+    shutil.rmtree(args.output, ignore_errors=True)
+
+    if args.csv is None:
+        build_shared_dataset(iter_partition_blocks(args.dataset), args.output, source='parquet', version=dataset_version(args.dataset))
+    else:
+        build_shared_dataset(iter_csv_blocks(args.csv), args.output, source='csv', version=dataset_version(args.csv))
+    print("Completed!")
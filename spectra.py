@@ -0,0 +1,207 @@
+import argparse
+import numpy as np
+import pandas as pd
+import scipy.signal as sig
+from concurrent.futures import ProcessPoolExecutor
+
+from data_cleaning import DATA_COLUMNS, DATASET_NAME, dataset_version, partition_path
+from data_loader import dataset_partitions
+from tensor_store import natural_key
+
+SPECTRA_NAME = 'sports_science_spectra.npz'
+SAMPLING_RATE = 25
+# 10 second Welch windows, i.e. a 0.1 Hz resolution, with 50% overlap
+WELCH_SAMPLES = 10 * SAMPLING_RATE
+# Movement cadences, from slow rowing strokes to sprinting steps
+CADENCE_BAND = (0.3, 5.0)
+
+
+def block_spectra(values):
+    """
+    Welch power spectral densities of every channel of one block in a single vectorized call. Blocks shorter
+    than a Welch window are zero-padded, so every block shares the same frequency grid.
+
+    Args:
+        values = (samples, channels) array
+    Returns:
+        frequencies = (WELCH_SAMPLES // 2 + 1,) frequencies in Hz
+        psd = (frequencies, channels) float32 array
+    """
+
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) < 2:
+        frequencies = np.fft.rfftfreq(WELCH_SAMPLES, d=1 / SAMPLING_RATE)
+        return frequencies, np.full((len(frequencies), values.shape[1]), np.nan, dtype=np.float32)
+
+    frequencies, psd = sig.welch(values, fs=SAMPLING_RATE, nperseg=min(WELCH_SAMPLES, len(values)), nfft=WELCH_SAMPLES,
+                                 detrend='constant', axis=0)
+
+    return frequencies, psd.astype(np.float32)
+
+
+def dominant_frequency(frequencies, psd, band=CADENCE_BAND):
+    """
+    Strongest frequency of each spectrum within the cadence band, refined between bins by fitting a parabola
+    through the peak bin and its neighbours, together with the share of the band's power around that peak as a
+    measure of how periodic the movement is.
+
+    Args:
+        frequencies = (frequencies,) frequencies in Hz
+        psd = (frequencies, channels) power spectral densities
+        band = (low, high) frequency band in Hz to search
+    Returns:
+        dominant = (channels,) dominant frequencies in Hz
+        strength = (channels,) fraction of the band's power within one bin of the peak
+    """
+
+    in_band = np.flatnonzero((frequencies >= band[0]) & (frequencies <= band[1]))
+    power = np.asarray(psd, dtype=np.float64)[in_band]
+    power = np.where(np.isnan(power), 0, power)
+    channels = np.arange(power.shape[1])
+
+    peak = power.argmax(axis=0)
+    # A peak on the edge of the band has no neighbour on that side, which counts as zero power
+    left = np.where(peak > 0, power[np.maximum(peak - 1, 0), channels], 0)
+    center = power[peak, channels]
+    right = np.where(peak < len(in_band) - 1, power[np.minimum(peak + 1, len(in_band) - 1), channels], 0)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        curvature = left - 2 * center + right
+        shift = np.where((curvature < 0) & (peak > 0) & (peak < len(in_band) - 1), 0.5 * (left - right) / curvature, 0)
+        strength = (left + center + right) / power.sum(axis=0)
+
+    step = frequencies[1] - frequencies[0]
+    dominant = frequencies[in_band][peak] + shift * step
+
+    valid = center > 0
+    return np.where(valid, dominant, np.nan), np.where(valid, strength, np.nan)
+
+
+def partition_spectra(task):
+    """
+    Process pool worker that reads one partition and computes the spectra of all 45 channels.
+
+    Args:
+        task = tuple of (dataset, activity, subject)
+    Returns:
+        result = tuple of (activity, subject, number of rows, psd)
+    """
+
+    dataset, activity, subject = task
+    values = pd.read_parquet(partition_path(dataset, activity, subject), columns=DATA_COLUMNS).to_numpy()
+
+    return activity, subject, len(values), block_spectra(values)[1]
+
+
+def build_spectra(dataset=DATASET_NAME, output=SPECTRA_NAME, workers=None):
+    """
+    Computes the Welch spectra and dominant frequencies of every subject x activity x channel once and saves them.
+
+    Args:
+        dataset = root folder of the partitioned dataset
+        output = path of the npz file to write
+        workers = number of worker processes (defaults to the cpu count)
+    Returns:
+        None
+    """
+
+    version = dataset_version(dataset)
+    partitions, codes = dataset_partitions(dataset)
+    activities = sorted({activity for activity, _ in partitions}, key=natural_key)
+    subjects = sorted({subject for _, subject in partitions}, key=natural_key)
+    names = {code: name for name, code in codes.items()}
+
+    frequencies = np.fft.rfftfreq(WELCH_SAMPLES, d=1 / SAMPLING_RATE)
+    psd = np.full((len(activities), len(subjects), len(frequencies), len(DATA_COLUMNS)), np.nan, dtype=np.float32)
+    dominant = np.full((len(activities), len(subjects), len(DATA_COLUMNS)), np.nan, dtype=np.float32)
+    strength = np.full((len(activities), len(subjects), len(DATA_COLUMNS)), np.nan, dtype=np.float32)
+    n_rows = np.zeros((len(activities), len(subjects)), dtype=np.int64)
+
+    tasks = [(dataset, activity, subject) for activity, subject in partitions]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for activity, subject, rows, block_psd in pool.map(partition_spectra, tasks):
+            a, s = activities.index(activity), subjects.index(subject)
+            n_rows[a, s] = rows
+            psd[a, s] = block_psd
+            dominant[a, s], strength[a, s] = dominant_frequency(frequencies, block_psd)
+            print(f"Activity: {activity}, Subject: {subject}, Median dominant frequency: {np.nanmedian(dominant[a, s]):.2f} Hz")
+
+    np.savez_compressed(output, activities=activities, activity_names=[names[activity] for activity in activities],
+                        subjects=subjects, columns=DATA_COLUMNS, frequencies=frequencies, psd=psd,
+                        dominant=dominant, strength=strength, n_rows=n_rows, dataset_version=version)
+
+
+class SpectraIndex:
+    """
+    Lookup over the spectra written by build_spectra, indexed by activity name, subject and column.
+    """
+
+    def __init__(self, path=SPECTRA_NAME):
+
+        with np.load(path) as index:
+            self.arrays = {key: index[key] for key in index.files}
+
+        self.activity_names = list(self.arrays['activity_names'])
+        self.subjects = list(self.arrays['subjects'])
+        self.columns = list(self.arrays['columns'])
+        self.dataset_version = str(self.arrays['dataset_version']) if 'dataset_version' in self.arrays else None
+        self.frequencies = self.arrays['frequencies']
+
+    def has_block(self, activity_name, subject):
+
+        if activity_name not in self.activity_names or subject not in self.subjects:
+            return False
+
+        return self.arrays['n_rows'][self.activity_names.index(activity_name), self.subjects.index(subject)] > 0
+
+    def spectra(self, activity_name, subject, columns):
+        """
+        Spectra of some channels of one subject and activity.
+
+        Returns:
+            frequencies = (frequencies,) frequencies in Hz
+            psd = (frequencies, channels) power spectral densities
+        """
+
+        a, s = self.activity_names.index(activity_name), self.subjects.index(subject)
+
+        return self.frequencies, self.arrays['psd'][a, s][:, [self.columns.index(column) for column in columns]]
+
+    def cadences(self, subject, columns):
+        """
+        Cadence of a group of channels, e.g. the three accelerometer axes of one body unit, in every activity of
+        a subject, from the strongest frequency of their summed spectra. Only looks up and sums the cached spectra.
+
+        Args:
+            subject = subject code, e.g. p1
+            columns = sensor column names to combine
+        Returns:
+            df = dataframe of activity_name, dominant frequency in Hz, cadence in cycles per minute and strength
+        """
+
+        s = self.subjects.index(subject)
+        positions = [self.columns.index(column) for column in columns]
+        summed = self.arrays['psd'][:, s][..., positions].sum(axis=2).T
+        dominant, strength = dominant_frequency(self.frequencies, summed)
+
+        df = pd.DataFrame({'activity_name': self.activity_names, 'frequency': dominant,
+                           'cadence': dominant * 60, 'strength': strength})
+
+        return df[self.arrays['n_rows'][:, s] > 0].reset_index(drop=True)
+
+
+def parse_args():
+
+    parser = argparse.ArgumentParser(description="Precompute the Welch spectra and dominant frequencies of every channel.")
+    parser.add_argument('--dataset', default=DATASET_NAME, help="Root folder of the partitioned dataset")
+    parser.add_argument('--output', default=SPECTRA_NAME, help="Path of the npz file to write")
+    parser.add_argument('--workers', type=int, default=None, help="Number of worker processes (defaults to the cpu count)")
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+
+    args = parse_args()
+    build_spectra(args.dataset, args.output, args.workers)
+    print("Completed!")
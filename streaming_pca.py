@@ -0,0 +1,210 @@
+import argparse
+import pickle
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from data_cleaning import DATA_COLUMNS, DATASET_NAME, partition_path
+from data_loader import dataset_partitions
+
+PCA_NAME = 'sports_science_pca.pkl'
+PROJECTION_NAME = 'sports_science_pca.parquet'
+PCA_COMPONENTS = 3
+
+
+def iter_sample_chunks(dataset=DATASET_NAME, subjects=None, activity_names=None, chunk_partitions=16):
+    """
+    Streams the raw samples of the dataset a few activity/subject partitions at a time, so that memory stays
+    bounded by the chunk size rather than the number of subjects.
+
+    Args:
+        dataset = root folder of the partitioned dataset
+        subjects = subjects to include (defaults to all)
+        activity_names = activity names to include (defaults to all)
+        chunk_partitions = number of partitions per yielded chunk
+    Returns:
+        chunks = generator of dataframes of the 45 float32 sensor columns plus activity_name and subject
+    """
+
+    partitions, codes = dataset_partitions(dataset)
+    names = {code: name for name, code in codes.items()}
+    partitions = [(activity, subject) for activity, subject in partitions
+                  if (subjects is None or subject in subjects)
+                  and (activity_names is None or names[activity] in activity_names)]
+
+    for start in range(0, len(partitions), chunk_partitions):
+        yield pd.concat([pd.read_parquet(partition_path(dataset, activity, subject), columns=DATA_COLUMNS)
+                         .assign(activity_name=names[activity], subject=subject)
+                         for activity, subject in partitions[start:start + chunk_partitions]], ignore_index=True)
+
+
+class StreamingPCA:
+    """
+    PCA of standardized columns fitted in one pass over chunks of rows. Each chunk's mean and co-moment matrix
+    are merged into running totals (Chan et al.'s pairwise update), so memory is one columns x columns matrix
+    however many rows are seen, and the result is exactly StandardScaler followed by PCA on the concatenated
+    rows, up to floating point. Exposes the same fitted attributes as sklearn's PCA.
+    """
+
+    def __init__(self, n_components=PCA_COMPONENTS, standardize=True):
+
+        self.n_components = n_components
+        self.standardize = standardize
+        self.n_samples_seen_ = 0
+        self.mean_ = None
+        self.comoments = None
+
+    def partial_fit(self, X):
+        """
+        Adds a chunk of rows and refits the components.
+
+        Args:
+            X = (rows, columns) array
+        Returns:
+            self
+        """
+
+        X = np.asarray(X, dtype=np.float64)
+        n_chunk = len(X)
+        if n_chunk == 0:
+            return self
+
+        chunk_mean = X.mean(axis=0)
+        centered = X - chunk_mean
+        chunk_comoments = centered.T @ centered
+
+        if self.n_samples_seen_ == 0:
+            self.mean_, self.comoments = chunk_mean, chunk_comoments
+        else:
+            n_total = self.n_samples_seen_ + n_chunk
+            delta = chunk_mean - self.mean_
+            self.comoments = self.comoments + chunk_comoments + np.outer(delta, delta) * self.n_samples_seen_ * n_chunk / n_total
+            self.mean_ = self.mean_ + delta * n_chunk / n_total
+        self.n_samples_seen_ += n_chunk
+
+        self.refit()
+
+        return self
+
+    def refit(self):
+
+        n = self.n_samples_seen_
+        variance = np.diag(self.comoments) / n
+        self.var_ = variance
+        self.scale_ = np.where(variance > 0, np.sqrt(variance), 1.0) if self.standardize else np.ones_like(variance)
+
+        covariance = self.comoments / max(n - 1, 1) / np.outer(self.scale_, self.scale_)
+        eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+        order = np.argsort(eigenvalues)[::-1][:self.n_components]
+        components = eigenvectors[:, order].T
+
+        # Deterministic signs: the largest loading of every component is positive
+        signs = np.sign(components[np.arange(len(components)), np.abs(components).argmax(axis=1)])
+        self.components_ = components * signs[:, None]
+        self.n_components_ = len(components)
+        self.explained_variance_ = np.maximum(eigenvalues[order], 0)
+        # A single row, or constant columns, have no variance to explain
+        total_variance = np.trace(covariance)
+        self.explained_variance_ratio_ = self.explained_variance_ / total_variance if total_variance > 0 else np.zeros_like(self.explained_variance_)
+        self.singular_values_ = np.sqrt(self.explained_variance_ * max(n - 1, 1))
+
+    def transform(self, X):
+        """
+        Projects rows onto the principal components.
+        """
+
+        return ((np.asarray(X, dtype=np.float64) - self.mean_) / self.scale_) @ self.components_.T
+
+
+def fit_streaming_pca(dataset=DATASET_NAME, n_components=PCA_COMPONENTS, subjects=None, activity_names=None, chunk_partitions=16):
+    """
+    Fits the standardized PCA of the sensor columns over the whole cohort in one pass over the partitions,
+    without ever holding more than one chunk of rows.
+
+    Args:
+        dataset = root folder of the partitioned dataset
+        n_components = number of principal components
+        subjects = subjects to include (defaults to all)
+        activity_names = activity names to include (defaults to all)
+        chunk_partitions = number of partitions per chunk
+    Returns:
+        pca = fitted StreamingPCA, with components_ and explained_variance_ratio_ like PCA
+    """
+
+    pca = StreamingPCA(n_components)
+    for chunk in iter_sample_chunks(dataset, subjects, activity_names, chunk_partitions):
+        pca.partial_fit(chunk[DATA_COLUMNS].to_numpy())
+
+    return pca
+
+
+def iter_projection_chunks(pca, dataset=DATASET_NAME, subjects=None, activity_names=None, chunk_partitions=16):
+    """
+    Projects the samples onto the principal components chunk by chunk.
+
+    Returns:
+        chunks = generator of dataframes of activity_name, subject and one float32 column per component
+    """
+
+    pc_names = [f'PC{i + 1}' for i in range(pca.n_components_)]
+
+    for chunk in iter_sample_chunks(dataset, subjects, activity_names, chunk_partitions):
+        projection = pca.transform(chunk[DATA_COLUMNS].to_numpy()).astype(np.float32)
+        df = pd.DataFrame(projection, columns=pc_names)
+        df.insert(0, 'subject', chunk['subject'].to_numpy())
+        df.insert(0, 'activity_name', chunk['activity_name'].to_numpy())
+        yield df
+
+
+def build_pca(dataset=DATASET_NAME, output=PCA_NAME, projection_output=None, n_components=PCA_COMPONENTS, chunk_partitions=16):
+    """
+    Fits the cohort-wide standardized PCA, saves it, and optionally writes the projection of every sample to a
+    parquet file, chunk by chunk.
+
+    Args:
+        dataset = root folder of the partitioned dataset
+        output = path of the pickled PCA to write
+        projection_output = path of the projection parquet file to write, or None to skip it
+        n_components = number of principal components
+        chunk_partitions = number of partitions per chunk
+    Returns:
+        None
+    """
+
+    pca = fit_streaming_pca(dataset, n_components, chunk_partitions=chunk_partitions)
+    with open(output, 'wb') as f:
+        pickle.dump({'pca': pca, 'columns': DATA_COLUMNS}, f)
+
+    if projection_output is None:
+        return
+
+    writer = None
+    try:
+        for chunk in iter_projection_chunks(pca, dataset, chunk_partitions=chunk_partitions):
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(projection_output, table.schema, compression='snappy')
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def parse_args():
+
+    parser = argparse.ArgumentParser(description="Fit a standardized PCA over every subject, chunk by chunk.")
+    parser.add_argument('--dataset', default=DATASET_NAME, help="Root folder of the partitioned dataset")
+    parser.add_argument('--output', default=PCA_NAME, help="Path of the pickled PCA to write")
+    parser.add_argument('--projection', default=None, help=f"Also write the projected samples to this parquet file, e.g. {PROJECTION_NAME}")
+    parser.add_argument('--components', type=int, default=PCA_COMPONENTS, help="Number of principal components")
+    parser.add_argument('--chunk-partitions', type=int, default=16, help="Activity/subject partitions read per chunk")
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+
+    args = parse_args()
+    build_pca(args.dataset, args.output, args.projection, args.components, args.chunk_partitions)
+    print("Completed!")
@@ -1,12 +1,28 @@
+import os
+import uuid
 import pandas as pd
 import numpy as np
 import streamlit as st
 import streamlit.components.v1 as components
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 from mpl_toolkits.mplot3d import Axes3D
 import seaborn as sns
 import plotly.express as px
-import scipy.signal as sig
+import plotly.io as pio
+
+from aggregates import AggregateCube, AGGREGATES_NAME
+from data_cleaning import DATA_COLUMNS, DATASET_NAME, dataset_version, is_current
+from data_loader import dataset_activity_names, has_partitioned_dataset, load_selection
+from diagnostics import DIAGNOSTICS_LOG, StageRecorder, append_log, diagnostics_enabled_by_default
+from downsampling import LINECHART_POINT_BUDGET, SCATTER3D_POINT_BUDGET, downsample_indices, pyramid_cache
+from fatigue import FatigueIndex, FATIGUE_NAME, LIMB_COLUMNS, LIMB_UNITS, fatigue_series
+from peaks import PeakIndex, PEAK_INDEX_NAME, filter_peaks, peak_cache, strongest_peaks
+from render_cache import render_panels
+from segment_search import SegmentIndex, SEGMENT_INDEX_NAME
+from shared_data import SHARED_DATASET_NAME, open_shared_dataset
+from spectra import SpectraIndex, SPECTRA_NAME, block_spectra, dominant_frequency
+from tensor_store import TensorStore, TENSOR_STORE_NAME
 
 def main():
     # Use the full page instead of a narrow central column
@@ -18,23 +34,242 @@ def main():
     # Set random seed
     RANDOM_SEED = 179
 
-    @st.cache()
+    # Panels are drawn on worker threads, so the shared style is set once here rather than per figure
+    plt.rcParams.update({"font.size": 12, "font.weight": "normal"})
+
+    # Opt-in timing and memory diagnostics of each stage, also switched on with SPORTS_SCIENCE_DIAGNOSTICS=1
+    diagnostics_selected = st.sidebar.checkbox("Record stage diagnostics", value=diagnostics_enabled_by_default(), key="diagnostics")
+    session_id = st.session_state.get("diagnostics_session", uuid.uuid4().hex)
+    rerun = st.session_state.get("diagnostics_rerun", 0) + 1
+    st.session_state["diagnostics_session"], st.session_state["diagnostics_rerun"] = session_id, rerun
+    recorder = StageRecorder(diagnostics_selected, session_id, rerun)
+
     def load_data(filename):
         """
-        Loads in complete dataset after data_cleaning.py file.
+        Loads in complete dataset after data_cleaning.py file, as the shared memory-mapped copy of shared_data.py.
+        The csv is converted the first time and whenever it changes, and otherwise every session and server
+        process on the host maps the same file, opened once per process and not hashed on reruns.
 
         Args: 
-            None
+            filename = csv file name without extension
         Returns:
-            sports_science = outputted complete sports_science dataset 
+            sports_science = SharedDataset of the complete sports_science dataset 
         """
-        
+
+        csv_filename = f"{filename}.csv" if os.path.exists(f"{filename}.csv") else f"{filename}_subset.csv"
+
+        return open_shared_dataset(SHARED_DATASET_NAME, dataset_version(csv_filename), csv_filename)
+
+    @st.cache(allow_output_mutation=True)
+    def load_tensor_store(path, version):
+        """
+        Opens the memory-mapped tensor store built by tensor_store.py, if there is one.
+
+        Args: 
+            path = folder of the tensor store
+            version = dataset_version of the current ingest, see data_cleaning.py
+        Returns:
+            store = TensorStore over the complete dataset, or None if it has not been built or was built from an earlier ingest
+        """
+
+        try:
+            store = TensorStore(path)
+        except FileNotFoundError:
+            return None
+
+        return store if is_current(store.dataset_version, version) else None
+
+    @st.cache(allow_output_mutation=True)
+    def load_aggregates(path, version):
+        """
+        Loads the precomputed distribution, correlation and boxplot summaries built by aggregates.py, if any.
+
+        Args: 
+            path = path of the aggregates npz file
+            version = dataset_version of the current ingest, see data_cleaning.py
+        Returns:
+            cube = AggregateCube, or None if it has not been built or was built from an earlier ingest
+        """
+
+        try:
+            cube = AggregateCube(path)
+        except FileNotFoundError:
+            return None
+
+        return cube if is_current(cube.dataset_version, version) else None
+
+    @st.cache(allow_output_mutation=True)
+    def load_peak_index(path, version):
+        """
+        Loads the candidate peaks and prominences precomputed by peaks.py, if any.
+
+        Args: 
+            path = path of the peak index npz file
+            version = dataset_version of the current ingest, see data_cleaning.py
+        Returns:
+            peak_index = PeakIndex, or None if it has not been built or was built from an earlier ingest
+        """
+
+        try:
+            peak_index = PeakIndex(path)
+        except FileNotFoundError:
+            return None
+
+        return peak_index if is_current(peak_index.dataset_version, version) else None
+
+    @st.cache(allow_output_mutation=True)
+    def load_fatigue_index(path, version):
+        """
+        Loads the fatigue series precomputed by fatigue.py, if any.
+
+        Args: 
+            path = path of the fatigue npz file
+            version = dataset_version of the current ingest, see data_cleaning.py
+        Returns:
+            fatigue_index = FatigueIndex, or None if it has not been built or was built from an earlier ingest
+        """
+
         try:
-            sports_science = pd.read_csv(f"{filename}.csv")
-        except:
-            sports_science = pd.read_csv(f"{filename}_subset.csv")
+            fatigue_index = FatigueIndex(path)
+        except FileNotFoundError:
+            return None
+
+        return fatigue_index if is_current(fatigue_index.dataset_version, version) else None
+
+    @st.cache(allow_output_mutation=True)
+    def load_segment_index(path, version):
+        """
+        Loads the segment embeddings written by segment_search.py, if any.
 
-        return sports_science
+        Args: 
+            path = path of the segment index npz file
+            version = dataset_version of the current ingest, see data_cleaning.py
+        Returns:
+            segment_index = SegmentIndex, or None if it has not been built or was built from an earlier ingest
+        """
+
+        try:
+            segment_index = SegmentIndex(path)
+        except FileNotFoundError:
+            return None
+
+        return segment_index if is_current(segment_index.dataset_version, version) else None
+
+    @st.cache(allow_output_mutation=True)
+    def load_spectra(path, version):
+        """
+        Loads the Welch spectra and dominant frequencies precomputed by spectra.py, if any.
+
+        Args: 
+            path = path of the spectra npz file
+            version = dataset_version of the current ingest, see data_cleaning.py
+        Returns:
+            spectra_index = SpectraIndex, or None if it has not been built or was built from an earlier ingest
+        """
+
+        try:
+            spectra_index = SpectraIndex(path)
+        except FileNotFoundError:
+            return None
+
+        return spectra_index if is_current(spectra_index.dataset_version, version) else None
+
+    def sensor_peaks(df, column):
+        """
+        Candidate peaks and prominences of one channel for the selected subject and activity, from the peak index
+        when available or else computed once and kept in the peak cache, so the prominence slider only filters them.
+        The peak index follows the partition row order, so it is not used with the legacy csv.
+        """
+
+        with recorder.stage("find_peaks", detail=column, rows=len(df)):
+            if peak_index is not None and partition_rows and peak_index.has_block(activity_selected, person_selected):
+                return peak_index.peaks(activity_selected, person_selected, column)
+
+            return peak_cache.get((backend, version, person_selected, activity_selected, column), lambda: df[column].to_numpy())
+
+    def sensor_pyramid(df, column):
+        """
+        Min/max downsampling pyramid of one channel for the selected subject and activity, built once per selection.
+        """
+
+        return pyramid_cache.get((backend, version, person_selected, activity_selected, column), lambda: df[column].to_numpy())
+
+    def unit_panels(df, filtered_sensor_codes, filtered_sensor_labels, unit_code):
+        """
+        Builders of the line chart, spectrum, cadence, fatigue, 3D plot, distribution and correlation panels of one body unit, keyed on
+        only the selections each panel depends on, so that e.g. moving the prominence slider redraws just the line chart.
+        The keys also hold the data backend and dataset version, so that panels drawn before a re-ingest are not shown.
+
+        Args:
+            df = selected subject/activity rows of the unit's sensor columns
+            filtered_sensor_codes = sensor columns of the unit and sensor family
+            filtered_sensor_labels = axis labels of those columns
+            unit_code = body unit prefix, e.g. LA_
+        Returns:
+            panels = ordered dictionary of cache key to a function returning (title, figure)
+        """
+
+        key = (backend, version, person_selected, activity_selected, unit_code, sensor_selected)
+
+        return {
+            key + ("linechart", prominence_selected): lambda: sensor_linechart(df, filtered_sensor_codes, filtered_sensor_labels, unit_code),
+            key + ("spectrum",): lambda: sensor_spectrum(df, filtered_sensor_codes, filtered_sensor_labels, unit_code),
+            key + ("cadence",): lambda: sensor_cadence(filtered_sensor_codes, unit_code),
+            (backend, version, person_selected, activity_selected, unit_code, "fatigue"): lambda: fatigue_chart(unit_code),
+            key + ("3dplot",): lambda: sensor_3dplot(df, filtered_sensor_codes),
+            key + ("distribution",): lambda: sensor_distribution(df, filtered_sensor_codes, filtered_sensor_labels, unit_code),
+            key + ("correlation",): lambda: sensor_pearson_correlation(filtered_sensor_codes, unit_code),
+        }
+
+    def show_panels(rendered_panels):
+        """
+        Writes rendered panels into the current column, one below the other.
+        """
+
+        for i, (title, kind, payload) in enumerate(rendered_panels):
+            if i > 0:
+                st.write("")
+                st.write("")
+
+            with recorder.stage("show", detail=title):
+                st.subheader(title)
+                if kind == "plotly":
+                    st.plotly_chart(pio.from_json(payload, skip_invalid=True))
+                else:
+                    st.image(payload, use_column_width=True)
+
+    def subject_activity_data(person, activity, columns):
+        """
+        Selects one subject's rows for one activity and only the given sensor columns. Slices the tensor store
+        or the shared dataset when available, otherwise reads just that partition of the parquet dataset.
+        """
+
+        with recorder.stage("select_rows", detail=activity) as record:
+            if store is not None:
+                selection = store.frame(activity, person, columns)
+            elif data is None:
+                selection = load_selection(person, activity, columns)
+            else:
+                selection = data.frame(activity, person, columns)
+            record["rows"] = len(selection)
+
+        return selection
+
+    def subject_activities_data(person, activities, columns):
+        """
+        Selects one subject's rows for several activities and only the given sensor columns.
+        """
+
+        with recorder.stage("select_rows", detail=f"{len(activities)} activities") as record:
+            if store is not None:
+                selection = store.frames(activities, person, columns)
+            elif data is None:
+                selection = load_selection(person, activities, columns)
+            else:
+                selection = data.frames(activities, person, columns)
+            record["rows"] = len(selection)
+
+        return selection
 
     @st.cache()
     def sensor_codes_and_labels(sensors_codes, sensors_labels, unit_code):
@@ -63,17 +298,22 @@ def main():
             tick_stepsize = 2
             title = f"{sensor_selected} on {unit_selected} while {activity_selected}"
 
-        fig, axes = plt.subplots(3, 1, figsize=(12,12))
-        plt.rcParams.update({"font.size": 12, "font.weight": "normal"})
+        fig = Figure(figsize=(12,12))
+        axes = fig.subplots(3, 1)
 
         named_colors = ["tab:blue", "navy", "darkcyan"]
 
         for i, ax_i in enumerate(axes):
 
-            df_prom_idx = sig.find_peaks(df[filtered_sensor_codes[i]], prominence=prominence_selected)[0]
+            peaks, prominences = sensor_peaks(df, filtered_sensor_codes[i])
+            # Mark at most half the point budget of peaks, the most prominent ones, and always draw the line through them
+            df_prom_idx = strongest_peaks(filter_peaks(peaks, prominences, prominence_selected),
+                                          prominences[prominences >= prominence_selected], LINECHART_POINT_BUDGET // 2)
             df_prom = df.iloc[df_prom_idx]
 
-            ax_i = sns.lineplot(data=df, x=df.index, y=filtered_sensor_codes[i], 
+            df_lod = df.iloc[downsample_indices([sensor_pyramid(df, filtered_sensor_codes[i])], LINECHART_POINT_BUDGET, df_prom_idx)]
+
+            ax_i = sns.lineplot(data=df_lod, x=df_lod.index, y=filtered_sensor_codes[i], 
                                 color=named_colors[i], 
                                 ax=ax_i)
             ax_i = sns.scatterplot(data=df_prom, x=df_prom.index, y=filtered_sensor_codes[i], 
@@ -84,9 +324,132 @@ def main():
             ax_i.spines['top'].set_visible(False)
             ax_i.spines['right'].set_visible(False)
 
-        st.subheader(title)
+        return title, fig
 
-        st.pyplot(fig)
+    def sensor_spectrum(df, filtered_sensor_codes, sensors_labels, unit_code):
+        """
+        Welch power spectra of the unit's three channels with their dominant frequency, from the spectra index
+        when available and otherwise computed from the selected rows.
+        """
+
+        if ("LA" in unit_code) or ("LL" in unit_code):
+            title = f"Spectrum of Left {unit_selected} {sensor_selected}"
+        elif ("RA" in unit_code) or ("RL" in unit_code):
+            title = f"Spectrum of Right {unit_selected} {sensor_selected}"
+        else:        
+            title = f"Spectrum of {unit_selected} {sensor_selected}"
+
+        if spectra_index is not None and partition_rows and spectra_index.has_block(activity_selected, person_selected):
+            frequencies, psd = spectra_index.spectra(activity_selected, person_selected, filtered_sensor_codes)
+        else:
+            with recorder.stage("spectra", detail=unit_code, rows=len(df)):
+                frequencies, psd = block_spectra(df[filtered_sensor_codes].to_numpy())
+        dominant, _ = dominant_frequency(frequencies, psd)
+
+        fig = Figure(figsize=(12,12))
+        axes = fig.subplots(3, 1, sharex=True)
+
+        named_colors = ["tab:blue", "navy", "darkcyan"]
+
+        for i, ax_i in enumerate(axes):
+            ax_i.semilogy(frequencies[1:], psd[1:, i], color=named_colors[i])
+            if np.isfinite(dominant[i]):
+                ax_i.axvline(dominant[i], color="red", linestyle="--", linewidth=1)
+                ax_i.annotate(f"{dominant[i]:.2f} Hz ({dominant[i] * 60:.0f}/min)", xy=(dominant[i], 1), xycoords=("data", "axes fraction"),
+                              xytext=(4, -14), textcoords="offset points", color="red")
+
+            ax_i.set(ylabel=f"PSD of {sensors_labels[i]}")
+            ax_i.spines['top'].set_visible(False)
+            ax_i.spines['right'].set_visible(False)
+
+        axes[-1].set(xlabel="Frequency (Hz)")
+
+        return title, fig
+
+    def sensor_cadence(filtered_sensor_codes, unit_code):
+        """
+        Cadence of the unit in every activity of the selected subject, from the dominant frequency of the summed
+        spectra of its three channels, so that cyclic activities can be told apart by their rhythm. Only sums
+        cached spectra when the spectra index is available.
+        """
+
+        if ("LA" in unit_code) or ("LL" in unit_code):
+            title = f"Cadence of Left {unit_selected} {sensor_selected} Across Activities"
+        elif ("RA" in unit_code) or ("RL" in unit_code):
+            title = f"Cadence of Right {unit_selected} {sensor_selected} Across Activities"
+        else:        
+            title = f"Cadence of {unit_selected} {sensor_selected} Across Activities"
+
+        if spectra_index is not None and partition_rows and person_selected in spectra_index.subjects:
+            cadences = spectra_index.cadences(person_selected, filtered_sensor_codes)
+        else:
+            with recorder.stage("spectra", detail=f"{unit_code} {len(activity_names)} activities"):
+                df = subject_activities_data(person_selected, activity_names, filtered_sensor_codes)
+                rows = []
+                for activity, block in df.groupby("activity_name", observed=True, sort=False):
+                    frequencies, psd = block_spectra(block[filtered_sensor_codes].to_numpy())
+                    dominant, strength = dominant_frequency(frequencies, psd.sum(axis=1, keepdims=True))
+                    rows.append({"activity_name": activity, "frequency": dominant[0], "cadence": dominant[0] * 60, "strength": strength[0]})
+                cadences = pd.DataFrame(rows, columns=["activity_name", "frequency", "cadence", "strength"])
+
+        fig = Figure(figsize=(12,12))
+        ax = fig.subplots()
+
+        colors = ["red" if activity == activity_selected else "tab:blue" for activity in cadences["activity_name"]]
+        ax.barh(cadences["activity_name"], cadences["cadence"], color=colors)
+        for position, (cadence, strength) in enumerate(zip(cadences["cadence"], cadences["strength"])):
+            if np.isfinite(cadence):
+                ax.annotate(f"{cadence:.0f} ({strength:.0%})", xy=(cadence, position), xytext=(4, 0), textcoords="offset points", va="center", fontsize=10)
+
+        ax.invert_yaxis()
+        ax.set(xlabel="Cadence (cycles per minute, share of power at the peak)")
+        ax.spines['top'].set_visible(False)
+        ax.spines['right'].set_visible(False)
+
+        return title, fig
+
+    def fatigue_chart(unit_code):
+        """
+        Rolling peak amplitude, peak interval, variability and fatigue index over the session, for the limb of
+        the unit or every limb for the torso. Uses the fatigue index when available (it follows the partition row
+        order, so not with the legacy csv) and otherwise runs the fatigue engine over the limb channels.
+        """
+
+        if unit_code in LIMB_UNITS:
+            side = "Left" if unit_code in ["LA_", "LL_"] else "Right"
+            title = f"Fatigue of {side} {unit_selected} while {activity_selected}"
+            limbs = [LIMB_UNITS.index(unit_code)]
+        else:
+            title = f"Fatigue of the Limbs while {activity_selected}"
+            limbs = list(range(len(LIMB_UNITS)))
+
+        with recorder.stage("fatigue", detail=unit_code):
+            if fatigue_index is not None and partition_rows and fatigue_index.has_block(activity_selected, person_selected):
+                times, metrics = fatigue_index.series(activity_selected, person_selected)
+            else:
+                limb_data = subject_activity_data(person_selected, activity_selected, LIMB_COLUMNS)
+                times, metrics = fatigue_series(limb_data[LIMB_COLUMNS].to_numpy())
+
+        fig = Figure(figsize=(12,12))
+        axes = fig.subplots(4, 1, sharex=True)
+
+        named_colors = ["tab:blue", "navy", "darkcyan", "tab:purple"]
+        metric_labels = ["Peak Amplitude", "Peak Interval (s)", "Variability", "Fatigue Index"]
+
+        for i, ax_i in enumerate(axes):
+            for limb in limbs:
+                ax_i.plot(times, metrics[:, limb, i], color=named_colors[limb], label=LIMB_UNITS[limb].rstrip("_"))
+
+            ax_i.set(ylabel=metric_labels[i])
+            ax_i.spines['top'].set_visible(False)
+            ax_i.spines['right'].set_visible(False)
+
+        axes[-1].axhline(0, color="grey", linewidth=0.8, linestyle="--")
+        axes[-1].set(xlabel="Time (s)")
+        if len(limbs) > 1:
+            axes[0].legend(loc="upper right", frameon=False)
+
+        return title, fig
 
     def sensor_3dplot(df, filtered_sensor_codes):
 
@@ -94,15 +457,20 @@ def main():
         y = [x for x in filtered_sensor_codes if 'y' in x][0]
         z = [x for x in filtered_sensor_codes if 'z' in x][0]
 
-        fig = px.scatter_3d(df, x=x, y=y, z=z, 
-                            color=df.index, color_continuous_scale="Magma",
-                            width=900, height=800)
+        df_lod = df.iloc[downsample_indices([sensor_pyramid(df, code) for code in (x, y, z)], SCATTER3D_POINT_BUDGET)]
 
-        st.subheader(f"{sensor_selected} in 3D Space Over Time")
+        # scatter_3d renders through WebGL, so the browser cost scales with the point budget rather than the session length
+        fig = px.scatter_3d(df_lod, x=x, y=y, z=z, 
+                            color=df_lod.index, color_continuous_scale="Magma",
+                            width=900, height=800)
 
-        st.plotly_chart(fig)
+        return f"{sensor_selected} in 3D Space Over Time", fig
 
-    def sensor_pearson_correlation(df, filtered_sensor_codes, unit_code):
+    def sensor_pearson_correlation(filtered_sensor_codes, unit_code):
+        """
+        Correlation of the unit's sensor columns against all 45 channels, from the aggregate cube when it covers
+        the selection, otherwise from the selected rows of every channel, so that both paths draw a 45 x 3 heatmap.
+        """
         
         if ("LA" in unit_code) or ("LL" in unit_code):
             title = f"Pearson Correlation of Left {unit_selected} {sensor_selected}"
@@ -111,17 +479,23 @@ def main():
         else:        
             title = f"Pearson Correlation of {unit_selected} {sensor_selected}"
 
-        fig, ax = plt.subplots(figsize=(12,16))
-        plt.rcParams.update({"font.size": 12, "font.weight": "normal"})
+        fig = Figure(figsize=(12,16))
+        ax = fig.subplots()
 
         colormap = sns.diverging_palette(220, 10, as_cmap = True)
 
-        ax = sns.heatmap(df.corr()[filtered_sensor_codes], 
+        with recorder.stage("correlation", detail=unit_code) as record:
+            if cube is not None and cube.has_block(activity_selected, person_selected):
+                correlation = cube.correlation(activity_selected, person_selected, filtered_sensor_codes)
+            else:
+                df = subject_activity_data(person_selected, activity_selected, DATA_COLUMNS)
+                correlation = df[DATA_COLUMNS].corr()[filtered_sensor_codes]
+                record["rows"] = len(df)
+
+        ax = sns.heatmap(correlation, ax=ax,
                         cmap=colormap, cbar_kws={"shrink":.65}, annot=True, vmin=-1, vmax=1, linecolor="white", annot_kws={"fontsize":10})
 
-        st.subheader(title)
-        
-        st.pyplot(fig)
+        return title, fig
 
     def sensor_distribution(df, filtered_sensor_codes, sensors_labels, unit_code):
 
@@ -132,43 +506,194 @@ def main():
         else:        
             title = f"Distribution of {unit_selected} {sensor_selected}"
 
-        fig, axes = plt.subplots(3, 1, figsize=(12,12))
-        plt.rcParams.update({"font.size": 12, "font.weight": "normal"})
+        fig = Figure(figsize=(12,12))
+        axes = fig.subplots(3, 1)
 
         named_colors = ["tab:blue", "navy", "darkcyan"]
 
         for i, ax_i in enumerate(axes):
 
-            ax_i = sns.histplot(data=df, x=filtered_sensor_codes[i],
-                                stat="density", kde=True, color=named_colors[i], 
-                                ax=ax_i)
+            if cube is not None and cube.has_block(activity_selected, person_selected):
+                bin_edges, density, grid, kde = cube.distribution(activity_selected, person_selected, filtered_sensor_codes[i])
+                ax_i.bar(bin_edges[:-1], density, width=np.diff(bin_edges), align="edge", 
+                         color=named_colors[i], alpha=0.75, edgecolor="white")
+                ax_i.plot(grid, kde, color=named_colors[i])
+                ax_i.set(ylabel="Density")
+            else:
+                ax_i = sns.histplot(data=df, x=filtered_sensor_codes[i],
+                                    stat="density", kde=True, color=named_colors[i], 
+                                    ax=ax_i)
 
             ax_i.set(xlabel=sensors_labels[i])
             ax_i.spines['top'].set_visible(False)
             ax_i.spines['right'].set_visible(False)
 
-        st.subheader(title)
+        return title, fig
 
-        st.pyplot(fig)
+    def motion_boxplots(person, activities, filtered_sensor_code, filtered_sensor_label):
+        """
+        Boxplots of the selected sensors across activities, from the aggregate cube when it covers every activity.
+        The cube keeps quartiles and whiskers but not individual outliers, so neither path draws fliers.
+        """
 
-    def motion_boxplots(df, filtered_sensor_code, filtered_sensor_label):
+        fig = Figure(figsize=(30, 10))
+        ax = fig.subplots()
 
-        fig, ax = plt.subplots(figsize=(30, 10))
+        if isinstance(filtered_sensor_code, str):
+            filtered_sensor_code = [filtered_sensor_code]
 
-        if len(filtered_sensor_code) > 1:            
-            df = df.drop(columns=["segment", "subject", "activity"]).set_index("activity_name").stack().reset_index().rename(columns={"level_1": "sensor", 0: "value"})
-            df = df[df["sensor"].isin(filtered_sensor_code)]
-            ax = sns.boxplot(data=df, x="activity_name", y="value", hue="sensor")
+        if cube is not None and all(cube.has_block(activity, person) for activity in activities):
+            # Draw the boxes straight from the precomputed quartiles and whiskers, dodged by sensor like seaborn's hue
+            width = 0.8 / len(filtered_sensor_code)
+            box_stats = [cube.box_stats(activity, person, code) for activity in activities for code in filtered_sensor_code]
+            positions = [i - 0.4 + width * (j + 0.5) for i in range(len(activities)) for j in range(len(filtered_sensor_code))]
+
+            boxes = ax.bxp(box_stats, positions=positions, widths=width * 0.9, patch_artist=True, showfliers=False)
+            colors = sns.color_palette(n_colors=len(filtered_sensor_code))
+            for k, box in enumerate(boxes["boxes"]):
+                box.set_facecolor(colors[k % len(filtered_sensor_code)])
+
+            if len(filtered_sensor_code) > 1:
+                ax.legend(boxes["boxes"][:len(filtered_sensor_code)], filtered_sensor_code, title="sensor")
+            ax.set_xticks(range(len(activities)))
+            ax.set_xticklabels(activities, rotation=90)
         else:
-            ax = sns.boxplot(data=df, x="activity_name", y=filtered_sensor_code)
+            df = subject_activities_data(person, activities, filtered_sensor_code)
+
+            if len(filtered_sensor_code) > 1:            
+                with recorder.stage("boxplot_reshape", rows=len(df)) as record:
+                    df = df.drop(columns=["segment", "subject", "activity"]).set_index("activity_name").stack().reset_index().rename(columns={"level_1": "sensor", 0: "value"})
+                    df = df[df["sensor"].isin(filtered_sensor_code)]
+                    record["rows"] = len(df)
+                ax = sns.boxplot(data=df, x="activity_name", y="value", hue="sensor", showfliers=False, ax=ax)
+            else:
+                ax = sns.boxplot(data=df, x="activity_name", y=filtered_sensor_code[0], showfliers=False, ax=ax)
         
-        ax.set_xticklabels(list(df.activity_name.unique()), rotation=90)
+            ax.set_xticklabels(list(df.activity_name.unique()), rotation=90)
         ax.set(ylabel=filtered_sensor_label)
         
-        st.subheader(f"Boxplot Analysis of {filtered_sensor_label} Across Multiple Activities")
-        st.pyplot(fig)
+        with recorder.stage("show", detail="Boxplot Analysis"):
+            st.subheader(f"Boxplot Analysis of {filtered_sensor_label} Across Multiple Activities")
+            st.pyplot(fig)
+
+    def similar_segments(df, filtered_sensor_codes):
+        """
+        Finds the 5 second segments of any subject and activity whose movement of the selected body unit is most
+        similar to a chosen segment of the selected subject and activity, and overlays a chosen match on it.
+
+        Args:
+            df = selected subject/activity rows, including the segment column
+            filtered_sensor_codes = sensor columns to overlay
+        """
+
+        st.subheader(f"Segments With Similar {unit_selected} Movement")
+
+        if segment_index is None:
+            st.info("Build the segment index with segment_search.py to search for similar segments.")
+            return
+
+        segments = [segment for segment in df["segment"].astype(str).unique() if segment_index.has_segment(activity_selected, person_selected, segment)]
+        if not segments:
+            st.info(f"The segment index has no segments of {person_selected} while {activity_selected}.")
+            return
+
+        row4_1, row4_2, row4_3 = st.columns((1.25, 1.25, 2.5))
+
+        with row4_1:
+            segment_selected = st.selectbox(
+                "Which segment would you like to match?",
+                segments,
+                index=0,
+                key="segment"
+            )
+
+        with row4_2:
+            matches_selected = st.slider(
+                "How many similar segments to list:",
+                min_value=1,
+                max_value=50,
+                value=10,
+                key="matches"
+            )
+            exclude_selected = st.checkbox(f"Exclude other segments of {person_selected} while {activity_selected}", value=True, key="exclude")
+
+        with recorder.stage("segment_search", detail=unit_selected) as record:
+            matches = segment_index.query(unit_selected, activity_selected, person_selected, segment_selected,
+                                          matches_selected, exclude_selected)
+            record["rows"] = len(segment_index.labels)
+
+        with row4_3:
+            st.dataframe(matches)
+
+        if matches.empty:
+            return
+
+        match_labels = [f"{i + 1}. {match.subject} {match.segment} while {match.activity_name} ({match.similarity:.2f})" for i, match in enumerate(matches.itertuples())]
+        match_selected = st.selectbox("Which similar segment would you like to compare?", match_labels, index=0, key="match")
+        match = matches.iloc[match_labels.index(match_selected)]
+
+        query_rows = df[df["segment"].astype(str) == segment_selected]
+        match_rows = subject_activity_data(match["subject"], match["activity_name"], filtered_sensor_codes)
+        match_rows = match_rows[match_rows["segment"].astype(str) == match["segment"]]
+
+        fig = Figure(figsize=(30, 3 * len(filtered_sensor_codes)))
+        axes = fig.subplots(len(filtered_sensor_codes), 1, sharex=True, squeeze=False)[:, 0]
+
+        for ax_i, code in zip(axes, filtered_sensor_codes):
+            ax_i.plot(np.arange(len(query_rows)) / 25, query_rows[code].to_numpy(), color="tab:blue", label=f"{person_selected} {segment_selected} while {activity_selected}")
+            ax_i.plot(np.arange(len(match_rows)) / 25, match_rows[code].to_numpy(), color="tab:orange", label=f"{match['subject']} {match['segment']} while {match['activity_name']}")
+            ax_i.set(ylabel=code)
+            ax_i.spines['top'].set_visible(False)
+            ax_i.spines['right'].set_visible(False)
+
+        axes[0].legend(loc="upper right", frameon=False)
+        axes[-1].set(xlabel="Time (s)")
+
+        with recorder.stage("show", detail="Similar Segments"):
+            st.pyplot(fig)
+
+    with recorder.stage("load_artifacts"):
+        # Artifacts built from an earlier ingest of the parquet dataset are skipped until they are rebuilt
+        version = dataset_version(DATASET_NAME)
+        store = load_tensor_store(TENSOR_STORE_NAME, version)
+        cube = load_aggregates(AGGREGATES_NAME, version)
+        peak_index = load_peak_index(PEAK_INDEX_NAME, version)
+        fatigue_index = load_fatigue_index(FATIGUE_NAME, version)
+        segment_index = load_segment_index(SEGMENT_INDEX_NAME, version)
+        spectra_index = load_spectra(SPECTRA_NAME, version)
+        shared = open_shared_dataset(SHARED_DATASET_NAME, version) if has_partitioned_dataset(DATASET_NAME) else None
+
+    # The backend and the version of the data it serves key every in-process cache of derived arrays
+    with recorder.stage("load_data") as record:
+        if store is not None:
+            data = None
+            activity_names = store.activity_names
+            backend = "store"
+            record["detail"] = "tensor store"
+        elif shared is not None:
+            data = shared
+            activity_names = data.activity_names
+            backend = "shared"
+            record.update({"detail": "shared dataset from parquet", "rows": data.n_rows})
+        elif has_partitioned_dataset(DATASET_NAME):
+            data = None
+            activity_names = dataset_activity_names(DATASET_NAME)
+            backend = "parquet"
+            record["detail"] = "parquet dataset"
+        else:
+            data = load_data(DATASET_NAME)
+            activity_names = data.activity_names
+            backend = "csv"
+            version = data.dataset_version
+            record.update({"detail": f"shared dataset from {data.source}", "rows": data.n_rows})
+
+        # The peak and fatigue indexes follow the row order of the parquet partitions, not of the csv
+        partition_rows = data is None or data.source == "parquet"
 
-    data = load_data("sports_science_dataset")
+    if data is not None:
+        footprint = data.memory_footprint()
+        st.sidebar.caption(f"Shared dataset: {footprint['rows']:,} rows, {footprint['mapped_mb']:.0f} MB memory-mapped "
+                           f"and shared by every session, {footprint['arrow_heap_mb']:.1f} MB Arrow heap in this process")
 
     xyz = ["X", "Y", "Z"]
     motion = ["Acc", "Gyro", "Mag"]
@@ -188,7 +713,7 @@ def main():
         )
         dashboard_type = st.radio(
             "Select a desired dashboard type:",
-            ("Exploratory Data Analysis"),
+            ("Exploratory Data Analysis",),
             index=0,
             key="dashboard"
         )
@@ -235,7 +760,7 @@ def main():
             sensor_selected = st.selectbox(
                 "Which sensors would you like to focus on?",
                 ("Accelerometers", "Gyroscopes", "Magnetometers"),
-                key="unit"
+                key="sensor"
             )
         
         with row2_4:
@@ -250,32 +775,30 @@ def main():
         if unit_selected == "Torso":
             row3_1, row3_2 = st.columns((2.5, 2.5))
 
-            filtered_subject_and_activity = data[(data["subject"]==person_selected) & (data["activity_name"]==activity_selected)]
-
             unit_code = "T_"
             filtered_sensor_codes, filtered_sensor_labels = sensor_codes_and_labels(sensors_codes, sensors_labels, unit_code)
 
+            filtered_subject_and_activity = subject_activity_data(person_selected, activity_selected, filtered_sensor_codes)
+
             filtered_data = filtered_subject_and_activity[filtered_sensor_codes+["segment"]]
 
+            panels = unit_panels(filtered_data, filtered_sensor_codes, filtered_sensor_labels, unit_code)
+            rendered = render_panels(panels, recorder=recorder)
+            linechart, spectrum, cadence, fatigue, plot3d, distribution, correlation = [rendered[key] for key in panels]
+
             with row3_1:
-                sensor_linechart(filtered_data, filtered_sensor_codes, filtered_sensor_labels, unit_code)
-                st.write("")
-                st.write("")
-                sensor_distribution(filtered_data, filtered_sensor_codes, filtered_sensor_labels, unit_code)
+                show_panels([linechart, spectrum, fatigue, distribution])
             
             with row3_2:
-                sensor_3dplot(filtered_data, filtered_sensor_codes)
-                st.write("")
-                st.write("")
-                sensor_pearson_correlation(filtered_subject_and_activity, filtered_sensor_codes, unit_code)
+                show_panels([plot3d, cadence, correlation])
 
             row3_3, row3_4 = st.columns((2.5, 2.5))
 
             with row3_3:
                 activity_multi = st.multiselect(
                     "Select what kinds of activities to measure together:",
-                    list(data.activity_name.unique()),
-                    default=list(data.activity_name.unique()),
+                    activity_names,
+                    default=activity_names,
                     key="activities"
                 )
 
@@ -287,141 +810,70 @@ def main():
                     key="sensor_selected2"
                 )            
 
-            filtered_subject_multi_activities = data[(data["subject"]==person_selected) & (data["activity_name"].isin(activity_multi))]
-
             filtered_sensor_code = [x for x in filtered_sensor_codes if sensor_selected2[0].lower() in x][0]
 
-            motion_boxplots(filtered_subject_multi_activities, filtered_sensor_code, sensor_selected2)
+            with recorder.stage("motion_boxplots", detail=f"{len(activity_multi)} activities"):
+                motion_boxplots(person_selected, activity_multi, filtered_sensor_code, sensor_selected2)
 
         else:
             row3_1, row3_2 = st.columns((2.5, 2.5))
 
-            filtered_subject_and_activity = data[(data["subject"]==person_selected) & (data["activity_name"]==activity_selected)]
-
-            if unit_selected == "Arms":
-                with row3_1:            
-
-                    unit_code = "LA_"
-                    left_filtered_sensor_codes, left_filtered_sensor_labels = sensor_codes_and_labels(sensors_codes, sensors_labels, unit_code)
-                    
-                    filtered_data_left = filtered_subject_and_activity[left_filtered_sensor_codes+["segment"]]
-
-                    sensor_linechart(filtered_data_left, left_filtered_sensor_codes, left_filtered_sensor_labels, unit_code)
-                    st.write("")
-                    st.write("")                    
-                    sensor_3dplot(filtered_data_left, left_filtered_sensor_codes)
-                    st.write("")
-                    st.write("")
-                    sensor_distribution(filtered_data_left, left_filtered_sensor_codes, left_filtered_sensor_labels, unit_code)
-                    st.write("")
-                    st.write("")
-                    sensor_pearson_correlation(filtered_subject_and_activity, left_filtered_sensor_codes, unit_code)
-
-                with row3_2:        
-
-                    unit_code = "RA_"
-                    right_filtered_sensor_codes, right_filtered_sensor_labels = sensor_codes_and_labels(sensors_codes, sensors_labels, unit_code)
-
-                    filtered_data_right = filtered_subject_and_activity[right_filtered_sensor_codes+["segment"]]
-
-                    sensor_linechart(filtered_data_right, right_filtered_sensor_codes, right_filtered_sensor_labels, unit_code)
-                    st.write("")
-                    st.write("")                    
-                    sensor_3dplot(filtered_data_right, filtered_data_right)
-                    st.write("")
-                    st.write("")                    
-                    sensor_distribution(filtered_data_right, right_filtered_sensor_codes, right_filtered_sensor_labels, unit_code)
-                    st.write("")
-                    st.write("")                    
-                    sensor_pearson_correlation(filtered_subject_and_activity, right_filtered_sensor_codes, unit_code)
-                
-                row3_3, row3_4 = st.columns((2.5, 2.5))
-
-                with row3_3:
-                    activity_multi = st.multiselect(
-                        "Select what kinds of activities to measure together:",
-                        list(data.activity_name.unique()),
-                        default=list(data.activity_name.unique()),
-                        key="activities"
-                    )
-
-                with row3_4:
-                    sensor_selected2 = st.selectbox(
-                        f"Select type of {sensor_selected} to analyze activities by:",
-                        (f"X {sensor_selected}", f"Y {sensor_selected}", f"Z {sensor_selected}"),
-                        index=0,
-                        key="sensor_selected2"
-                    )            
-
-                filtered_subject_multi_activities = data[(data["subject"]==person_selected) & (data["activity_name"].isin(activity_multi))]
-                filtered_sensor_codes = left_filtered_sensor_codes + right_filtered_sensor_codes
-                filtered_sensor_code = [x for x in filtered_sensor_codes if sensor_selected2[0].lower() in x]
-                
-                motion_boxplots(filtered_subject_multi_activities, filtered_sensor_code, sensor_selected2)
-
-            elif unit_selected == "Legs":
-                with row3_1:            
-
-                    unit_code = "LL_"
-                    left_filtered_sensor_codes, left_filtered_sensor_labels = sensor_codes_and_labels(sensors_codes, sensors_labels, unit_code)
-
-                    filtered_data_left = filtered_subject_and_activity[left_filtered_sensor_codes+["segment"]]  
-
-                    sensor_linechart(filtered_data_left, left_filtered_sensor_codes, left_filtered_sensor_labels, unit_code)
-                    st.write("")
-                    st.write("")                    
-                    sensor_3dplot(filtered_data_left, left_filtered_sensor_codes)
-                    st.write("")
-                    st.write("")                    
-                    sensor_distribution(filtered_data_left, left_filtered_sensor_codes, left_filtered_sensor_labels, unit_code)
-                    st.write("")
-                    st.write("")                    
-                    sensor_pearson_correlation(filtered_subject_and_activity, left_filtered_sensor_codes, unit_code)
-
-                with row3_2:            
-
-                    unit_code = "RL_"
-                    right_filtered_sensor_codes, right_filtered_sensor_labels = sensor_codes_and_labels(sensors_codes, sensors_labels, unit_code)
-
-                    filtered_data_right = filtered_subject_and_activity[right_filtered_sensor_codes+["segment"]]       
-
-                    sensor_linechart(filtered_data_right, right_filtered_sensor_codes, right_filtered_sensor_labels, unit_code)
-                    st.write("")
-                    st.write("")                    
-                    sensor_3dplot(filtered_data_right, filtered_data_right)
-                    st.write("")
-                    st.write("")                    
-                    sensor_distribution(filtered_data_right, right_filtered_sensor_codes, right_filtered_sensor_labels, unit_code)
-                    st.write("")
-                    st.write("")                    
-                    sensor_pearson_correlation(filtered_subject_and_activity, right_filtered_sensor_codes, unit_code)
-
-                row3_3, row3_4 = st.columns((2.5, 2.5))
-
-                with row3_3:
-                    activity_multi = st.multiselect(
-                        "Select what kinds of activities to measure together:",
-                        list(data.activity_name.unique()),
-                        default=list(data.activity_name.unique()),
-                        key="activities"
-                    )
-
-                with row3_4:
-                    sensor_selected2 = st.selectbox(
-                        f"Select type of {sensor_selected} to analyze activities by:",
-                        (f"X {sensor_selected}", f"Y {sensor_selected}", f"Z {sensor_selected}"),
-                        index=0,
-                        key="sensor_selected2"
-                    )            
-
-                filtered_subject_multi_activities = data[(data["subject"]==person_selected) & (data["activity_name"].isin(activity_multi))]
-                filtered_sensor_codes = left_filtered_sensor_codes + right_filtered_sensor_codes
-                filtered_sensor_code = [x for x in filtered_sensor_codes if sensor_selected2[0].lower() in x]
-
-                motion_boxplots(filtered_subject_multi_activities, filtered_sensor_code, sensor_selected2)            
+            left_unit_code, right_unit_code = ("LA_", "RA_") if unit_selected == "Arms" else ("LL_", "RL_")
+            left_filtered_sensor_codes, left_filtered_sensor_labels = sensor_codes_and_labels(sensors_codes, sensors_labels, left_unit_code)
+            right_filtered_sensor_codes, right_filtered_sensor_labels = sensor_codes_and_labels(sensors_codes, sensors_labels, right_unit_code)
+
+            filtered_subject_and_activity = subject_activity_data(person_selected, activity_selected, 
+                                                                  left_filtered_sensor_codes + right_filtered_sensor_codes)
+
+            filtered_data_left = filtered_subject_and_activity[left_filtered_sensor_codes+["segment"]]
+            filtered_data_right = filtered_subject_and_activity[right_filtered_sensor_codes+["segment"]]
+
+            # Left and right panels are rendered together so that every cache miss is drawn concurrently
+            left_panels = unit_panels(filtered_data_left, left_filtered_sensor_codes, left_filtered_sensor_labels, left_unit_code)
+            right_panels = unit_panels(filtered_data_right, right_filtered_sensor_codes, right_filtered_sensor_labels, right_unit_code)
+            rendered = render_panels({**left_panels, **right_panels}, recorder=recorder)
+
+            with row3_1:
+                show_panels([rendered[key] for key in left_panels])
+
+            with row3_2:
+                show_panels([rendered[key] for key in right_panels])
+
+            row3_3, row3_4 = st.columns((2.5, 2.5))
+
+            with row3_3:
+                activity_multi = st.multiselect(
+                    "Select what kinds of activities to measure together:",
+                    activity_names,
+                    default=activity_names,
+                    key="activities"
+                )
+
+            with row3_4:
+                sensor_selected2 = st.selectbox(
+                    f"Select type of {sensor_selected} to analyze activities by:",
+                    (f"X {sensor_selected}", f"Y {sensor_selected}", f"Z {sensor_selected}"),
+                    index=0,
+                    key="sensor_selected2"
+                )            
+
+            filtered_sensor_codes = left_filtered_sensor_codes + right_filtered_sensor_codes
+            filtered_sensor_code = [x for x in filtered_sensor_codes if sensor_selected2[0].lower() in x]
+
+            with recorder.stage("motion_boxplots", detail=f"{len(activity_multi)} activities"):
+                motion_boxplots(person_selected, activity_multi, filtered_sensor_code, sensor_selected2)
+
+        similar_segments(filtered_subject_and_activity, filtered_sensor_codes)
 
     # elif dashboard_type == 'Machine Learning':
     #     st.write("In Progress...")
 
+    records = recorder.finish()
+    if records:
+        append_log(records)
+        with st.expander("Diagnostics", expanded=False):
+            st.caption(f"Stage timings and peak traced memory of this rerun, also appended to {DIAGNOSTICS_LOG}")
+            st.dataframe(pd.DataFrame(records)[["stage", "detail", "rows", "seconds", "peak_mb", "thread"]])
+
 if __name__ == '__main__':
     main()
\ No newline at end of file
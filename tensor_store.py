@@ -0,0 +1,273 @@
+import argparse
+import glob
+import json
+import os
+import re
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+from os.path import join
+
+from data_cleaning import DATA_COLUMNS, DATASET_NAME, dataset_version, partition_path
+
+TENSOR_STORE_NAME = 'sports_science_tensor'
+TENSOR_FILE = 'tensor.npy'
+INDEX_FILE = 'index.json'
+SAMPLES_PER_SEGMENT = 125
+
+
+def natural_key(label):
+    """
+    Sort key that orders labels like p2 before p10.
+
+    Args:
+        label = label to sort
+    Returns:
+        key = tuple of text and integer parts
+    """
+
+    return tuple(int(part) if part.isdigit() else part for part in re.split(r'(\d+)', label))
+
+
+def channel_selector(all_columns, columns=None):
+    """
+    Positions of the selected columns among all the sensor columns, as a slice when they are contiguous so that
+    indexing with it gives a view, or an index array otherwise.
+
+    Args:
+        all_columns = sensor column names in storage order
+        columns = selected sensor column names, or None for all of them
+    Returns:
+        selector = slice or integer array over the channel axis
+    """
+
+    if columns is None:
+        return slice(None)
+
+    positions = [all_columns.index(column) for column in columns]
+    if positions == list(range(positions[0], positions[0] + len(positions))):
+        return slice(positions[0], positions[0] + len(positions))
+
+    return np.array(positions)
+
+
+def list_partitions(dataset):
+    """
+    Lists the activity/subject partitions written by data_cleaning.py.
+
+    Args:
+        dataset = root folder of the partitioned dataset
+    Returns:
+        partitions = list of (activity, subject) tuples
+    """
+
+    pattern = join(dataset, 'activity=*', 'subject=*')
+    partitions = []
+    for folder in glob.glob(pattern):
+        activity = os.path.basename(os.path.dirname(folder)).split('=', 1)[1]
+        subject = os.path.basename(folder).split('=', 1)[1]
+        partitions.append((activity, subject))
+
+    return sorted(partitions, key=lambda partition: (natural_key(partition[0]), natural_key(partition[1])))
+
+
+def build_tensor_store(dataset, output):
+    """
+    Builds a dense activity x subject x segment x sample x channel float32 array from the partitioned dataset
+    and saves it as a memory-mappable .npy file with a small json label index. Blocks with fewer segments than
+    the largest block are padded with NaN. Every segment must hold exactly SAMPLES_PER_SEGMENT rows.
+
+    Args:
+        dataset = root folder of the partitioned dataset
+        output = folder to write the tensor store to
+    Returns:
+        index = label index of the store
+    """
+
+    version = dataset_version(dataset)
+    partitions = list_partitions(dataset)
+    if not partitions:
+        raise ValueError(f"No activity/subject partitions found in {dataset}, run data_cleaning.py --format parquet first")
+
+    activities = sorted({activity for activity, _ in partitions}, key=natural_key)
+    subjects = sorted({subject for _, subject in partitions}, key=natural_key)
+
+    n_rows = {partition: pq.ParquetFile(partition_path(dataset, *partition)).metadata.num_rows
+              for partition in partitions}
+    n_segments = max(n_rows.values()) // SAMPLES_PER_SEGMENT
+
+    os.makedirs(output, exist_ok=True)
+    # Drop the old index first, so that a build that fails halfway never leaves a readable store behind
+    if os.path.exists(join(output, INDEX_FILE)):
+        os.remove(join(output, INDEX_FILE))
+
+    tensor = np.lib.format.open_memmap(join(output, TENSOR_FILE), mode='w+', dtype=np.float32,
+                                       shape=(len(activities), len(subjects), n_segments,
+                                              SAMPLES_PER_SEGMENT, len(DATA_COLUMNS)))
+    tensor[:] = np.nan
+
+    activity_names = {}
+    segments = {}
+    for activity, subject in partitions:
+        block = pd.read_parquet(partition_path(dataset, activity, subject), columns=DATA_COLUMNS + ['segment', 'activity_name'])
+        segment_rows = block.groupby('segment', sort=False, observed=True).size()
+        invalid = segment_rows[segment_rows != SAMPLES_PER_SEGMENT]
+        if len(invalid):
+            raise ValueError(f"Activity: {activity}, Subject: {subject}, Segment: {invalid.index[0]} has {invalid.iloc[0]} rows, "
+                             f"expected {SAMPLES_PER_SEGMENT}")
+        block_segments = segment_rows.index.astype(str).tolist()
+
+        a, s = activities.index(activity), subjects.index(subject)
+        tensor[a, s, :len(block_segments)] = block[DATA_COLUMNS].to_numpy().reshape(
+            len(block_segments), SAMPLES_PER_SEGMENT, len(DATA_COLUMNS))
+
+        if len(block):
+            activity_names[activity] = str(block['activity_name'].iloc[0])
+        segments[f'{activity}/{subject}'] = block_segments
+        print(f"Activity: {activity}, Subject: {subject}, Segments: {len(block_segments)}")
+
+    tensor.flush()
+
+    index = {
+        'activities': activities,
+        'activity_names': [activity_names.get(activity, activity) for activity in activities],
+        'subjects': subjects,
+        'columns': DATA_COLUMNS,
+        'samples_per_segment': SAMPLES_PER_SEGMENT,
+        'segments': segments,
+        'dataset_version': version,
+    }
+    with open(join(output, INDEX_FILE), 'w') as f:
+        json.dump(index, f, indent=1)
+
+    return index
+
+
+class TensorStore:
+    """
+    Read-only view over a tensor store built by build_tensor_store. Selections by activity, subject and
+    channels are slices of the memory-mapped array, so nothing is read from disk until it is used.
+    """
+
+    def __init__(self, path=TENSOR_STORE_NAME):
+
+        with open(join(path, INDEX_FILE)) as f:
+            self.index = json.load(f)
+
+        self.tensor = np.load(join(path, TENSOR_FILE), mmap_mode='r')
+        self.activities = self.index['activities']
+        self.activity_names = self.index['activity_names']
+        self.subjects = self.index['subjects']
+        self.columns = self.index['columns']
+        self.dataset_version = self.index.get('dataset_version')
+
+    def activity_position(self, activity):
+        """
+        Position of an activity in the store, given either its folder code (a01) or its name (Sitting).
+        """
+
+        if activity in self.activities:
+            return self.activities.index(activity)
+
+        return self.activity_names.index(activity)
+
+    def channel_selector(self, columns=None):
+        """
+        Converts a list of sensor columns into a slice when they are contiguous (e.g. LA_xacc, LA_yacc, LA_zacc)
+        so that selecting them stays zero-copy, or an index array otherwise.
+
+        Args:
+            columns = sensor column names, or None for all 45
+        Returns:
+            selector = slice or integer array over the channel axis
+        """
+
+        return channel_selector(self.columns, columns)
+
+    def segments(self, activity, subject):
+        """
+        Segment labels recorded for one activity/subject block.
+        """
+
+        code = self.activities[self.activity_position(activity)]
+
+        return self.index['segments'].get(f'{code}/{subject}', [])
+
+    def select(self, activity, subject, columns=None):
+        """
+        Selects one activity/subject block as a (segment, sample, channel) array.
+
+        Args:
+            activity = activity folder code or name
+            subject = subject code, e.g. p1
+            columns = sensor column names, or None for all 45
+        Returns:
+            block = memory-mapped view (a copy only if columns are not contiguous)
+        """
+
+        a = self.activity_position(activity)
+        s = self.subjects.index(subject)
+        n_segments = len(self.segments(activity, subject))
+
+        # Index the channels separately: combined with the integer a and s, an index array would be moved to the front
+        return self.tensor[a, s, :n_segments][..., self.channel_selector(columns)]
+
+    def frame(self, activity, subject, columns=None):
+        """
+        Selects one activity/subject block as a dataframe shaped like the rows of the complete dataset,
+        with the sensor values backed by the memory-mapped array.
+
+        Args:
+            activity = activity folder code or name
+            subject = subject code, e.g. p1
+            columns = sensor column names, or None for all 45
+        Returns:
+            df = dataframe of the selected sensor columns plus segment, subject, activity and activity_name
+        """
+
+        a = self.activity_position(activity)
+        columns = self.columns if columns is None else list(columns)
+        block = self.select(activity, subject, columns)
+        values = block.reshape(-1, block.shape[-1])
+
+        df = pd.DataFrame(values, columns=columns, copy=False)
+        df['segment'] = pd.Categorical(np.repeat(self.segments(activity, subject), block.shape[1]))
+        df['subject'] = subject
+        df['activity'] = self.activities[a]
+        df['activity_name'] = self.activity_names[a]
+
+        return df
+
+    def frames(self, activities, subject, columns=None):
+        """
+        Selects several activities of one subject as a single dataframe.
+
+        Args:
+            activities = activity folder codes or names
+            subject = subject code, e.g. p1
+            columns = sensor column names, or None for all 45
+        Returns:
+            df = concatenated dataframe in the layout of frame()
+        """
+
+        frames = [self.frame(activity, subject, columns) for activity in activities]
+        if not frames:
+            return self.frame(self.activities[0], subject, columns).iloc[:0]
+
+        return pd.concat(frames, ignore_index=True)
+
+
+def parse_args():
+
+    parser = argparse.ArgumentParser(description="Build a memory-mapped tensor store from the partitioned dataset.")
+    parser.add_argument('--dataset', default=DATASET_NAME, help="Root folder of the partitioned dataset")
+    parser.add_argument('--output', default=TENSOR_STORE_NAME, help="Folder to write the tensor store to")
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+
+    args = parse_args()
+    build_tensor_store(args.dataset, args.output)
+    print("Completed!")
@@ -0,0 +1,60 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+# The modules live at the top of the repository rather than in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_cleaning import DATA_COLUMNS
+
+# A few activities out of the 19, so that the folder to activity name mapping is exercised on a partial dataset
+ACTIVITIES = ['a02', 'a05', 'a12']
+SUBJECTS = ['p1', 'p2']
+SEGMENTS = ['s01', 's02', 's03']
+SAMPLES_PER_SEGMENT = 125
+
+
+def write_segment(path, activity, subject, segment, values):
+    """
+    Writes one segment file in the layout of the UCI download: one comma-separated line of 45 values per sample.
+    """
+
+    folder = os.path.join(path, activity, subject)
+    os.makedirs(folder, exist_ok=True)
+    np.savetxt(os.path.join(folder, f'{segment}.txt'), values, delimiter=',', fmt='%.5f')
+
+
+def random_segment(rng, rows=SAMPLES_PER_SEGMENT):
+
+    return rng.normal(scale=5, size=(rows, len(DATA_COLUMNS))).astype(np.float32)
+
+
+@pytest.fixture
+def raw_data(tmp_path):
+    """
+    Downloaded data folder with every segment of ACTIVITIES x SUBJECTS x SEGMENTS.
+    """
+
+    rng = np.random.default_rng(0)
+    path = str(tmp_path / 'data')
+    for activity in ACTIVITIES:
+        for subject in SUBJECTS:
+            for segment in SEGMENTS:
+                write_segment(path, activity, subject, segment, random_segment(rng))
+
+    return path
+
+
+@pytest.fixture
+def dataset(raw_data, tmp_path):
+    """
+    Partitioned parquet dataset ingested from raw_data.
+    """
+
+    from data_cleaning import ingest_parquet
+
+    output = str(tmp_path / 'dataset')
+    ingest_parquet(raw_data, output, workers=2)
+
+    return output
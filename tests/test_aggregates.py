@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+from matplotlib import cbook
+
+from conftest import ACTIVITIES, SUBJECTS
+from data_cleaning import DATA_COLUMNS, dataset_version, partition_path
+from aggregates import AggregateCube, block_aggregates, build_aggregates
+
+
+def test_box_stats_match_matplotlib():
+
+    rng = np.random.default_rng(0)
+    # Heavy tails, so that the whiskers stop short of the extremes
+    values = rng.standard_t(df=2, size=(500, 4))
+    box = block_aggregates(values)['box']
+
+    for c, expected in enumerate(cbook.boxplot_stats(values)):
+        np.testing.assert_allclose(box[c], [expected['whislo'], expected['q1'], expected['med'], expected['q3'], expected['whishi']])
+        assert len(expected['fliers']) > 0
+
+
+def test_cube_matches_the_partitions(dataset, tmp_path):
+
+    output = str(tmp_path / 'aggregates.npz')
+    build_aggregates(dataset, output, workers=2)
+    cube = AggregateCube(output)
+
+    assert cube.dataset_version == dataset_version(dataset)
+    assert cube.subjects == SUBJECTS
+    for activity in ACTIVITIES:
+        for subject in SUBJECTS:
+            df = pd.read_parquet(partition_path(dataset, activity, subject))
+            name = str(df['activity_name'].iloc[0])
+            assert cube.has_block(name, subject)
+
+            columns = ['LA_xacc', 'LA_yacc', 'LA_zacc']
+            correlation = cube.correlation(name, subject, columns)
+            expected = df[DATA_COLUMNS].astype(np.float64).corr()[columns]
+            assert correlation.shape == (len(DATA_COLUMNS), 3)
+            np.testing.assert_allclose(correlation.to_numpy(), expected.to_numpy(), atol=1e-6)
+
+            bin_edges, density, grid, kde = cube.distribution(name, subject, 'T_ymag')
+            values = df['T_ymag'].to_numpy(np.float64)
+            expected_density, expected_edges = np.histogram(values, bins=len(density), density=True)
+            np.testing.assert_allclose(bin_edges, expected_edges, rtol=1e-5)
+            np.testing.assert_allclose(density, expected_density, rtol=1e-4)
+            assert np.trapz(kde, grid) > 0.9
+
+            stats = cube.box_stats(name, subject, 'RL_xgyro')
+            assert stats['q1'] <= stats['med'] <= stats['q3']
+
+    assert not cube.has_block('Sitting', 'p1')
+    assert not cube.has_block('Standing', 'p9')
@@ -0,0 +1,52 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+# The benchmark scripts import each other as top-level modules
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+from data_cleaning import DATA_COLUMNS, ingest_parquet, partition_path
+from run_benchmarks import compare
+from synthetic_data import N_ACTIVITIES, N_SUBJECTS, generate
+
+
+def test_synthetic_data_has_the_uci_layout(tmp_path):
+
+    data = str(tmp_path / 'data')
+
+    assert generate(data, scale=1, n_segments=2) == N_ACTIVITIES * N_SUBJECTS * 2
+    assert sorted(os.listdir(data))[::18] == ['a01', 'a19']
+    assert sorted(os.listdir(os.path.join(data, 'a07'))) == [f'p{subject}' for subject in range(1, N_SUBJECTS + 1)]
+    values = np.loadtxt(os.path.join(data, 'a07', 'p3', 's02.txt'), delimiter=',')
+    assert values.shape == (125, len(DATA_COLUMNS))
+
+    dataset = str(tmp_path / 'dataset')
+    ingest_parquet(data, dataset, workers=2)
+    block = pd.read_parquet(partition_path(dataset, 'a19', 'p8'))
+    assert len(block) == 2 * 125
+    # Accelerometer x channels carry the gravity offset
+    assert abs(block['T_xacc'].mean() - 9.8) < 1
+
+
+def test_synthetic_data_is_reproducible(tmp_path):
+
+    generate(str(tmp_path / 'first'), n_segments=1, seed=3)
+    generate(str(tmp_path / 'second'), n_segments=1, seed=3)
+
+    for name in ['a01/p1/s01.txt', 'a19/p8/s01.txt']:
+        with open(tmp_path / 'first' / name) as first, open(tmp_path / 'second' / name) as second:
+            assert first.read() == second.read()
+
+
+def test_compare_flags_slower_timings(capsys):
+
+    def results(ingest, linechart):
+        return {'stages': {'ingest_parquet': ingest},
+                'dashboard': {'parquet': {'Arms': [{'rerun': 0, 'wall_seconds': 1.0, 'stages': {'sensor_linechart': linechart}}]}}}
+
+    regressions = compare(results(10.0, 0.5), results(12.0, 0.5))
+
+    assert regressions == ['stages/ingest_parquet']
+    assert 'dashboard/parquet/Arms/cold/sensor_linechart' in capsys.readouterr().out
+    assert compare(results(10.0, 0.5), results(10.5, 0.001)) == []
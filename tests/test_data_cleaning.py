@@ -0,0 +1,125 @@
+import os
+import shutil
+import numpy as np
+import pandas as pd
+
+from conftest import ACTIVITIES, SAMPLES_PER_SEGMENT, SEGMENTS, SUBJECTS, random_segment, write_segment
+from data_cleaning import ACTIVITIES_CODES, DATA_COLUMNS, activities_mapping, ingest_csv, ingest_parquet, load_manifest, \
+    partition_path, plan_tasks
+
+
+def read_segment(path, activity, subject, segment):
+
+    return np.loadtxt(os.path.join(path, activity, subject, f'{segment}.txt'), delimiter=',', dtype=np.float32)
+
+
+def test_activities_are_named_by_folder_number():
+
+    assert activities_mapping(['a12', 'a02']) == {'a02': 'Standing', 'a12': 'Running on a Treadmill'}
+    assert activities_mapping([f'a{i:02d}' for i in range(1, 20)])['a19'] == ACTIVITIES_CODES[-1]
+
+
+def test_parquet_partitions_hold_every_segment(raw_data, tmp_path):
+
+    output = str(tmp_path / 'dataset')
+    ingest_parquet(raw_data, output, workers=2)
+
+    for activity in ACTIVITIES:
+        for subject in SUBJECTS:
+            block = pd.read_parquet(partition_path(output, activity, subject))
+
+            assert len(block) == len(SEGMENTS) * SAMPLES_PER_SEGMENT
+            assert list(block['segment'].cat.categories) == SEGMENTS
+            assert (block['activity_name'] == activities_mapping([activity])[activity]).all()
+            assert (block[DATA_COLUMNS].dtypes == np.float32).all()
+            expected = np.concatenate([read_segment(raw_data, activity, subject, segment) for segment in SEGMENTS])
+            np.testing.assert_array_equal(block[DATA_COLUMNS].to_numpy(), expected)
+
+
+def test_csv_matches_parquet(raw_data, tmp_path):
+
+    output = str(tmp_path / 'dataset')
+    csv = str(tmp_path / 'dataset.csv')
+    ingest_parquet(raw_data, output, workers=2)
+    ingest_csv(raw_data, csv, workers=2)
+
+    df = pd.read_csv(csv)
+    for (activity, subject), block in df.groupby(['activity', 'subject']):
+        partition = pd.read_parquet(partition_path(output, activity, subject))
+
+        np.testing.assert_allclose(block[DATA_COLUMNS].to_numpy(), partition[DATA_COLUMNS].to_numpy(), rtol=1e-6)
+        assert list(block['segment']) == list(partition['segment'].astype(str))
+        assert list(block['activity_name'].unique()) == [activities_mapping([activity])[activity]]
+    assert len(df) == len(ACTIVITIES) * len(SUBJECTS) * len(SEGMENTS) * SAMPLES_PER_SEGMENT
+
+
+def touch(file_path, seconds=10):
+    """
+    Moves a file's mtime forward, since a rewrite within the same clock tick would keep it.
+    """
+
+    stat = os.stat(file_path)
+    os.utime(file_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + seconds * 10 ** 9))
+
+
+def test_reingest_parses_only_changed_blocks(raw_data, tmp_path):
+
+    output = str(tmp_path / 'dataset')
+    ingest_parquet(raw_data, output, workers=2)
+    untouched = partition_path(output, 'a12', 'p1')
+    untouched_mtime = os.stat(untouched).st_mtime_ns
+
+    rng = np.random.default_rng(1)
+    changed, added = random_segment(rng), random_segment(rng)
+    write_segment(raw_data, 'a02', 'p1', 's02', changed)
+    touch(os.path.join(raw_data, 'a02', 'p1', 's02.txt'))
+    write_segment(raw_data, 'a05', 'p2', 's04', added)
+    os.remove(os.path.join(raw_data, 'a12', 'p2', 's03.txt'))
+
+    tasks, _, removed_blocks = plan_tasks(raw_data, output, load_manifest(output))
+    planned = {(task[2], task[3]): task[-1] for task in tasks}
+
+    assert planned == {('a02', 'p1'): ['s02.txt'], ('a05', 'p2'): ['s04.txt'], ('a12', 'p2'): []}
+    assert removed_blocks == []
+
+    ingest_parquet(raw_data, output, workers=2)
+
+    block = pd.read_parquet(partition_path(output, 'a02', 'p1'))
+    assert list(block['segment'].cat.categories) == SEGMENTS
+    np.testing.assert_allclose(block[block['segment'] == 's02'][DATA_COLUMNS].to_numpy(), changed, atol=1e-5)
+
+    block = pd.read_parquet(partition_path(output, 'a05', 'p2'))
+    assert list(block['segment'].unique()) == SEGMENTS + ['s04']
+    np.testing.assert_allclose(block[DATA_COLUMNS].to_numpy()[-SAMPLES_PER_SEGMENT:], added, atol=1e-5)
+
+    assert list(pd.read_parquet(partition_path(output, 'a12', 'p2'))['segment'].unique()) == SEGMENTS[:2]
+    assert os.stat(untouched).st_mtime_ns == untouched_mtime
+    assert plan_tasks(raw_data, output, load_manifest(output))[0] == []
+
+
+def test_content_hash_ignores_touched_files(raw_data, tmp_path):
+
+    output = str(tmp_path / 'dataset')
+    ingest_parquet(raw_data, output, workers=2, use_hash=True)
+    touch(os.path.join(raw_data, 'a02', 'p1', 's01.txt'))
+
+    assert plan_tasks(raw_data, output, load_manifest(output), use_hash=True)[0] == []
+    assert len(plan_tasks(raw_data, output, load_manifest(output))[0]) == 1
+
+
+def test_removed_blocks_are_deleted(raw_data, tmp_path):
+
+    output = str(tmp_path / 'dataset')
+    ingest_parquet(raw_data, output, workers=2)
+    shutil.rmtree(os.path.join(raw_data, 'a05', 'p2'))
+    shutil.rmtree(os.path.join(raw_data, 'a12', 'p1'))
+
+    assert plan_tasks(raw_data, output, load_manifest(output))[2] == [('a05', 'p2'), ('a12', 'p1')]
+
+    # A full rebuild rewrites every block but still drops the removed ones
+    ingest_parquet(raw_data, output, workers=2, full=True)
+
+    assert not os.path.exists(os.path.dirname(partition_path(output, 'a05', 'p2')))
+    assert not os.path.exists(os.path.dirname(partition_path(output, 'a12', 'p1')))
+    assert not any(key.startswith(('a05/p2/', 'a12/p1/')) for key in load_manifest(output))
+    assert len(load_manifest(output)) == (len(ACTIVITIES) * len(SUBJECTS) - 2) * len(SEGMENTS)
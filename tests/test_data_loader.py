@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+
+from conftest import SEGMENTS, random_segment, write_segment
+from data_cleaning import DATA_COLUMNS, ingest_parquet, partition_path
+from data_loader import dataset_activity_names, has_partitioned_dataset, load_selection
+
+
+def test_selection_matches_the_partitions(dataset):
+
+    columns = ['T_xacc', 'RL_zmag']
+    df = load_selection('p2', ['Standing', 'Running on a Treadmill'], columns, dataset)
+
+    assert list(df.columns) == columns + ['segment', 'subject', 'activity', 'activity_name']
+    assert list(df['activity'].unique()) == ['a02', 'a12']
+    assert (df['subject'] == 'p2').all()
+    expected = pd.concat([pd.read_parquet(partition_path(dataset, activity, 'p2')) for activity in ['a02', 'a12']])
+    np.testing.assert_array_equal(df[columns].to_numpy(), expected[columns].to_numpy())
+
+    assert dataset_activity_names(dataset) == ['Standing', 'Ascending Stairs', 'Running on a Treadmill']
+    assert load_selection('p9', 'Standing', columns, dataset).empty
+    assert not has_partitioned_dataset(dataset + '_missing')
+
+
+def test_reingested_partitions_are_read_again(raw_data, dataset):
+
+    assert 'Sitting' not in dataset_activity_names(dataset)
+    assert len(load_selection('p1', 'Standing', DATA_COLUMNS, dataset)) == len(SEGMENTS) * 125
+
+    rng = np.random.default_rng(1)
+    write_segment(raw_data, 'a01', 'p1', 's01', random_segment(rng))
+    write_segment(raw_data, 'a02', 'p1', 's04', random_segment(rng))
+    ingest_parquet(raw_data, dataset, workers=2)
+
+    assert dataset_activity_names(dataset)[0] == 'Sitting'
+    assert len(load_selection('p1', 'Standing', DATA_COLUMNS, dataset)) == (len(SEGMENTS) + 1) * 125
+
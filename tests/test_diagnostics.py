@@ -0,0 +1,56 @@
+import gc
+import threading
+import tracemalloc
+import numpy as np
+
+from diagnostics import StageRecorder
+
+
+def test_tracing_stops_after_the_last_recorder():
+
+    first, second = StageRecorder(True), StageRecorder(True)
+    first.finish()
+    assert tracemalloc.is_tracing()
+
+    second.finish()
+    assert not tracemalloc.is_tracing()
+
+
+def test_interrupted_recorder_stops_tracing():
+
+    recorder = StageRecorder(True)
+    with recorder.stage("interrupted"):
+        assert tracemalloc.is_tracing()
+    del recorder
+    gc.collect()
+
+    assert not tracemalloc.is_tracing()
+
+
+def test_concurrent_recorder_keeps_stage_peak():
+
+    allocated, done = threading.Event(), threading.Event()
+    first, second = StageRecorder(True), StageRecorder(True)
+
+    def other_session():
+
+        allocated.wait()
+        # Opening and closing stages resets the shared tracer's peak while the first stage is still open
+        for _ in range(3):
+            with second.stage("other"):
+                pass
+        done.set()
+
+    thread = threading.Thread(target=other_session)
+    thread.start()
+    with first.stage("allocate") as record:
+        block = np.ones(8 * 1024 ** 2 // 8)
+        del block
+        allocated.set()
+        done.wait()
+    thread.join()
+
+    second.finish()
+    first.finish()
+    assert record['peak_mb'] >= 7.5
+    assert not tracemalloc.is_tracing()
@@ -0,0 +1,48 @@
+import numpy as np
+
+from downsampling import MinMaxPyramid, downsample_indices
+from peaks import candidate_peaks, filter_peaks, strongest_peaks
+
+
+def test_kept_peaks_count_against_the_budget():
+
+    x = np.random.default_rng(0).normal(size=100000)
+    peaks, prominences = candidate_peaks(x)
+    keep = filter_peaks(peaks, prominences, 0.01)
+    budget = 2000
+
+    priority = prominences[prominences >= 0.01]
+    indices = downsample_indices([MinMaxPyramid(x)], budget, keep, priority)
+    strongest = strongest_peaks(keep, priority, budget // 2)
+
+    assert len(keep) > budget
+    assert len(indices) <= budget
+    assert np.isin(strongest, indices).all()
+    assert priority[np.isin(keep, strongest)].min() >= np.sort(priority)[-budget // 2]
+
+
+def test_few_peaks_are_all_kept():
+
+    x = np.sin(np.linspace(0, 20 * np.pi, 50000))
+    keep = np.array([10, 20000, 49999])
+
+    indices = downsample_indices([MinMaxPyramid(x)], 2000, keep)
+
+    assert np.isin(keep, indices).all()
+    assert len(indices) <= 2000
+
+
+def test_pyramid_keeps_the_extremes_of_every_bucket():
+
+    x = np.random.default_rng(1).normal(size=10000)
+    x[1234], x[8765] = 50, -50
+    pyramid = MinMaxPyramid(x)
+
+    for budget in [10, 100, 1000, 5000]:
+        indices = pyramid.indices(budget)
+
+        assert len(indices) <= budget
+        assert {0, 1234, 8765, len(x) - 1} <= set(indices)
+        assert np.all(np.diff(indices) > 0)
+
+    np.testing.assert_array_equal(pyramid.indices(len(x)), np.arange(len(x)))
@@ -0,0 +1,105 @@
+import io
+
+import numpy as np
+import pandas as pd
+
+from data_cleaning import DATA_COLUMNS, dataset_version, partition_path
+from fatigue import FATIGUE_METRICS, LIMB_COLUMNS, LIMB_UNITS, SAMPLING_RATE, WINDOW_SECONDS, FatigueEngine, \
+    FatigueIndex, build_fatigue_index, fatigue_series, limb_magnitudes, stream
+
+
+def drifting_session(seconds=240, seed=0):
+    """
+    Limb channels of a session that tires: the stride frequency drops from 2 Hz to 1.2 Hz, the acceleration
+    amplitude halves and the angular speed gets noisier.
+    """
+
+    rng = np.random.default_rng(seed)
+    t = np.arange(seconds * SAMPLING_RATE) / SAMPLING_RATE
+    progress = t / t[-1]
+    phase = 2 * np.pi * np.cumsum(2 - 0.8 * progress) / SAMPLING_RATE
+    amplitude = 3 - 1.5 * progress
+
+    values = np.zeros((len(t), len(LIMB_UNITS), 2, 3))
+    values[:, :, 0, 0] = (9.8 + amplitude * np.sin(phase))[:, None]
+    values[:, :, 1, 0] = 2 + rng.normal(size=(len(t), len(LIMB_UNITS))) * (0.1 + 0.5 * progress)[:, None]
+
+    return values.reshape(len(t), len(LIMB_COLUMNS))
+
+
+def test_metrics_follow_a_drifting_signal():
+
+    times, metrics = fatigue_series(drifting_session())
+    assert metrics.shape == (len(times), len(LIMB_UNITS), len(FATIGUE_METRICS))
+    assert np.isnan(metrics[times < WINDOW_SECONDS, :, 3]).all()
+
+    after_baseline = times >= WINDOW_SECONDS
+    for limb in range(len(LIMB_UNITS)):
+        amplitude, interval, variability, fatigue_index = [np.polyfit(times[after_baseline], metrics[after_baseline, limb, i], 1)[0]
+                                                           for i in range(len(FATIGUE_METRICS))]
+        assert amplitude < 0
+        assert interval > 0
+        assert variability > 0
+        assert fatigue_index > 0
+
+    # At the end the stride interval has grown from 0.5 s to about 0.8 s
+    np.testing.assert_allclose(metrics[-1, :, 1], 1 / 1.2, rtol=0.1)
+    assert (metrics[-1, :, 3] > 0.2).all()
+
+
+def test_steady_signal_has_no_fatigue():
+
+    values = drifting_session()
+    t = np.arange(len(values)) / SAMPLING_RATE
+    values[:, LIMB_COLUMNS.index('LA_xacc')] = 9.8 + 3 * np.sin(2 * np.pi * 2 * t)
+    values[:, LIMB_COLUMNS.index('LA_xgyro')] = 2 + np.random.default_rng(1).normal(size=len(t)) * 0.3
+    _, metrics = fatigue_series(values)
+
+    np.testing.assert_allclose(metrics[-1, 0, 0:2], metrics[WINDOW_SECONDS, 0, 0:2], rtol=0.05)
+    assert abs(np.nanmean(metrics[WINDOW_SECONDS:, 0, 3])) < 0.1
+
+
+def test_running_sums_match_the_window():
+
+    acc_magnitude, gyro_magnitude = limb_magnitudes(drifting_session(seconds=100))
+    engine = FatigueEngine(window=10 * SAMPLING_RATE)
+    for t in range(len(acc_magnitude)):
+        engine.push(acc_magnitude[t], gyro_magnitude[t])
+
+    window = gyro_magnitude[-10 * SAMPLING_RATE:]
+    np.testing.assert_allclose(engine.current()[:, 2], window.std(axis=0) / window.mean(axis=0), rtol=1e-6)
+
+
+def test_fatigue_index_matches_the_engine(dataset, tmp_path):
+
+    output = str(tmp_path / 'fatigue.npz')
+    build_fatigue_index(dataset, output, workers=2)
+    index = FatigueIndex(output)
+
+    assert index.dataset_version == dataset_version(dataset)
+    for activity in index.arrays['activities']:
+        for subject in index.subjects:
+            values = pd.read_parquet(partition_path(dataset, activity, subject), columns=LIMB_COLUMNS).to_numpy()
+            name = index.activity_names[list(index.arrays['activities']).index(activity)]
+            assert index.has_block(name, subject)
+            times, metrics = index.series(name, subject)
+            expected_times, expected_metrics = fatigue_series(values)
+            np.testing.assert_array_equal(times, expected_times)
+            np.testing.assert_array_equal(metrics, expected_metrics)
+
+
+def test_stream_skips_malformed_lines():
+
+    values = np.zeros((3 * SAMPLING_RATE, len(DATA_COLUMNS)))
+    values[:, [DATA_COLUMNS.index(column) for column in LIMB_COLUMNS]] = drifting_session(seconds=3)
+    lines = [",".join(map(str, row)) for row in values]
+    lines.insert(10, "1.0,2.0")
+    lines.insert(20, ",".join(["x"] * len(DATA_COLUMNS)))
+
+    output, errors = io.StringIO(), io.StringIO()
+    stream(lines + [""], output=output, errors=errors)
+
+    assert errors.getvalue().count("Skipping line") == 2
+    reports = output.getvalue().splitlines()
+    assert len(reports) == 3 * len(LIMB_UNITS)
+    assert reports[-1].startswith("t=3s limb=RL")
@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+
+from conftest import ACTIVITIES, SEGMENTS, SUBJECTS
+from data_cleaning import DATA_COLUMNS, partition_path
+from features import FFT_BANDS, PERCENTILES, SAMPLING_RATE, build_feature_matrix, feature_names, iter_feature_chunks, \
+    window_features
+
+
+def naive_features(x):
+    """
+    Features of one channel of one window, computed one at a time.
+    """
+
+    centered = x - x.mean()
+    crossings = sum(1 for a, b in zip(centered[:-1], centered[1:]) if (a < 0) != (b < 0))
+    power = np.abs(np.fft.rfft(centered)) ** 2 / len(x)
+    frequencies = np.fft.rfftfreq(len(x), d=1 / SAMPLING_RATE)
+    bands = [power[(frequencies >= low) & ((frequencies < high) if high < FFT_BANDS[-1][1] else (frequencies <= high))].sum()
+             for low, high in FFT_BANDS]
+
+    return [x.mean(), x.std(), x.min(), x.max()] + [np.percentile(x, q) for q in PERCENTILES] + [crossings] + bands
+
+
+def test_batched_features_match_a_naive_computation():
+
+    rng = np.random.default_rng(0)
+    t = np.arange(125) / SAMPLING_RATE
+    windows = rng.normal(size=(4, 125, 3))
+    windows[:, :, 0] += 9.8 + np.sin(2 * np.pi * 2 * t)
+
+    features = window_features(windows)
+    names = feature_names(['a', 'b', 'c'])
+
+    assert features.shape == (4, len(names))
+    for w in range(4):
+        for c, column in enumerate(['a', 'b', 'c']):
+            positions = [names.index(name) for name in names if name.startswith(f'{column}_')]
+            np.testing.assert_allclose(features[w, positions], naive_features(windows[w, :, c]), rtol=1e-4, atol=1e-4)
+
+    # The 2 Hz sine of the first channel puts most of its energy into the 1.5-3 Hz band
+    bands = [names.index(f'a_fft_{low:g}_{high:g}hz') for low, high in FFT_BANDS]
+    assert np.argmax(features[0, bands]) == 2
+
+
+def test_feature_matrix_has_one_row_per_segment(dataset, tmp_path):
+
+    chunks = list(iter_feature_chunks(dataset, chunk_partitions=4))
+    assert [len(chunk) for chunk in chunks] == [4 * len(SEGMENTS), 2 * len(SEGMENTS)]
+
+    output = str(tmp_path / 'features.parquet')
+    build_feature_matrix(dataset, output, chunk_partitions=4)
+    df = pd.read_parquet(output)
+
+    assert len(df) == len(ACTIVITIES) * len(SUBJECTS) * len(SEGMENTS)
+    assert list(df.columns[:4]) == ['activity', 'activity_name', 'subject', 'segment']
+    assert list(df.columns[4:]) == feature_names()
+
+    block = pd.read_parquet(partition_path(dataset, 'a12', 'p2'))
+    row = df[(df['activity'] == 'a12') & (df['subject'] == 'p2') & (df['segment'] == 's03')]
+    segment = block[block['segment'] == 's03'][DATA_COLUMNS].to_numpy(np.float64)
+    np.testing.assert_allclose(row[[f'{column}_mean' for column in DATA_COLUMNS]].to_numpy()[0], segment.mean(axis=0), rtol=1e-5, atol=1e-5)
+
+    only = pd.concat(iter_feature_chunks(dataset, subjects=['p1'], activity_names=['Standing']))
+    assert set(only['subject']) == {'p1'} and set(only['activity']) == {'a02'}
@@ -0,0 +1,59 @@
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip('mlflow')
+pytest.importorskip('xgboost')
+
+from hyperparameter_sweep import parse_grid, run_sweep, split_once, sweep_configs
+
+
+def classification_data(rows=300, n_classes=3):
+
+    rng = np.random.default_rng(0)
+    y = np.repeat(np.arange(n_classes), rows // n_classes)
+    X = rng.normal(size=(len(y), 4)).astype(np.float32)
+    X[:, 0] += 3 * y
+
+    return X, y
+
+
+def test_parse_grid_reads_numbers_and_strings():
+
+    assert parse_grid(['eta=0.2,0.3', 'tree_method=hist,approx']) == {'eta': [0.2, 0.3], 'tree_method': ['hist', 'approx']}
+
+
+def test_config_ids_are_stable_and_depend_on_the_data(tmp_path):
+
+    X, y = classification_data()
+    _, data_hash = split_once(X, y, str(tmp_path))
+    _, same_hash = split_once(X, y, str(tmp_path))
+    _, other_hash = split_once(X[::-1].copy(), y[::-1].copy(), str(tmp_path))
+    assert data_hash == same_hash != other_hash
+
+    grid = {'eta': [0.2, 0.3], 'max_depth': [2, 3]}
+    configs = sweep_configs(grid, {'num_class': 3}, data_hash, str(tmp_path), 10, 2, 'xgb')
+    assert len(configs) == 4
+    assert len({config['config_id'] for config in configs}) == 4
+    assert [config['config_id'] for config in configs] == \
+        [config['config_id'] for config in sweep_configs(grid, {'num_class': 3}, data_hash, str(tmp_path), 10, 2, 'xgb')]
+    assert {config['config_id'] for config in configs}.isdisjoint(
+        config['config_id'] for config in sweep_configs(grid, {'num_class': 3}, other_hash, str(tmp_path), 10, 2, 'xgb'))
+
+
+def test_sweep_resumes_without_retraining_finished_configs(tmp_path):
+
+    X, y = classification_data()
+    grid = {'eta': [0.3, 0.5]}
+    output = str(tmp_path / 'sweep')
+
+    results = run_sweep(X, y, ['a', 'b', 'c'], grid, output=output, workers=2, threads_per_worker=1, num_boost_round=20)
+    assert list(results['status']) == ['FINISHED', 'FINISHED']
+    assert (results['accuracy'] > 0.9).all()
+    models = sorted(os.listdir(os.path.join(output, 'models')))
+    mtimes = [os.path.getmtime(os.path.join(output, 'models', model)) for model in models]
+
+    resumed = run_sweep(X, y, ['a', 'b', 'c'], grid, output=output, workers=2, threads_per_worker=1, num_boost_round=20)
+    assert list(resumed['config_id']) == list(results['config_id'])
+    assert [os.path.getmtime(os.path.join(output, 'models', model)) for model in models] == mtimes
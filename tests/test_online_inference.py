@@ -0,0 +1,56 @@
+import io
+import numpy as np
+
+from data_cleaning import read_samples
+from features import build_feature_matrix, window_features
+from online_inference import OnlineFeatures, replay, serve, train_model
+
+
+def test_online_features_match_window_features():
+
+    rng = np.random.default_rng(0)
+    window, n_channels = 125, 6
+    # Offsets like the gravity component of the accelerometers, plus a periodic movement and noise
+    t = np.arange(4 * window + 37)[:, None]
+    samples = 9.8 * rng.uniform(-1, 1, n_channels) + np.sin(2 * np.pi * t * rng.uniform(0.01, 0.2, n_channels)) \
+        + rng.normal(scale=0.3, size=(len(t), n_channels))
+
+    online = OnlineFeatures(n_channels, window)
+    for end, sample in enumerate(samples, 1):
+        online.push(sample)
+        if not online.ready():
+            continue
+
+        expected = window_features(samples[None, end - window:end])[0]
+        np.testing.assert_allclose(online.features(), expected, rtol=1e-4, atol=1e-4, err_msg=f"after {end} samples")
+
+
+def test_malformed_lines_are_skipped():
+
+    lines = ["1,2,3\n", "\n", "1,2\n", "1,x,3\n", "4, 5, 6\n", "1,2,3,4\n"]
+    errors = io.StringIO()
+
+    samples = list(read_samples(lines, n_channels=3, errors=errors))
+
+    np.testing.assert_array_equal(samples, [[1, 2, 3], [4, 5, 6]])
+    assert errors.getvalue().count("Skipping line") == 3
+
+
+def test_replayed_stream_is_classified_every_hop(dataset, tmp_path):
+
+    features_path, model_path = str(tmp_path / 'features.parquet'), str(tmp_path / 'model.pkl')
+    build_feature_matrix(dataset, features_path)
+    train_model(features_path, model_path)
+
+    lines = io.StringIO()
+    replay('p1', ['Standing', 'Running on a Treadmill'], dataset, output=lines)
+    lines.seek(0)
+    predictions = io.StringIO()
+    report = serve(model_path, lines, hop=25, output=predictions)
+
+    n_samples = 2 * 3 * 125
+    assert report['samples'] == n_samples
+    assert report['predictions'] == (n_samples - 125) // 25 + 1
+    assert len(predictions.getvalue().splitlines()) == report['predictions']
+    assert report['latency_p50_ms'] <= report['latency_p99_ms']
+    assert predictions.getvalue().splitlines()[0].startswith('sample=125 activity=')
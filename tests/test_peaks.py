@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+import pytest
+import scipy.signal as sig
+
+from conftest import ACTIVITIES, SUBJECTS
+from data_cleaning import DATA_COLUMNS, dataset_version, partition_path
+from peaks import PeakIndex, build_peak_index, candidate_peaks, filter_peaks, peak_cache
+
+
+def random_signals(seed):
+    """
+    Random walks, quantized walks with long plateaus, signals that peak at either edge and flat signals.
+    """
+
+    rng = np.random.default_rng(seed)
+    walk = rng.normal(size=500).cumsum()
+
+    return {
+        'walk': walk,
+        'noise': rng.normal(size=300),
+        'plateaus': np.round(walk / 2) * 2,
+        'repeated': np.repeat(rng.integers(0, 5, size=60), rng.integers(1, 6, size=60)).astype(float),
+        'rising_edge': np.linspace(0, 10, 200) + rng.normal(scale=0.5, size=200),
+        'falling_edge': np.linspace(10, 0, 200) + rng.normal(scale=0.5, size=200),
+        'flat': np.zeros(50),
+        'short': rng.normal(size=2),
+    }
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('prominence', [0, 0.01, 0.5, 1, 2, 5, 20])
+def test_filtered_candidates_match_find_peaks(seed, prominence):
+
+    for name, x in random_signals(seed).items():
+        peaks, prominences = candidate_peaks(x)
+        expected = sig.find_peaks(x, prominence=prominence)[0]
+
+        np.testing.assert_array_equal(filter_peaks(peaks, prominences, prominence), expected, err_msg=name)
+
+
+def test_candidate_prominences_match_find_peaks():
+
+    x = random_signals(0)['plateaus']
+    peaks, prominences = candidate_peaks(x)
+    expected_peaks, properties = sig.find_peaks(x, prominence=0)
+
+    np.testing.assert_array_equal(peaks, expected_peaks)
+    np.testing.assert_allclose(prominences, properties['prominences'])
+
+
+def test_index_matches_find_peaks_on_the_partitions(dataset, tmp_path):
+
+    output = str(tmp_path / 'peaks.npz')
+    build_peak_index(dataset, output, workers=2)
+    index = PeakIndex(output)
+
+    assert index.dataset_version == dataset_version(dataset)
+    df = pd.read_parquet(partition_path(dataset, 'a05', 'p2'))
+    name = str(df['activity_name'].iloc[0])
+    for column in ['T_xacc', 'RL_zmag']:
+        peaks, prominences = index.peaks(name, 'p2', column)
+        expected = sig.find_peaks(df[column].to_numpy(), prominence=2)[0]
+
+        np.testing.assert_array_equal(filter_peaks(peaks, prominences, 2), expected)
+
+    statistics = index.statistics(2).set_index(['activity_name', 'subject', 'sensor'])
+    assert len(statistics) == len(ACTIVITIES) * len(SUBJECTS) * len(DATA_COLUMNS)
+    assert statistics.loc[(name, 'p2', 'T_xacc'), 'n_peaks'] == len(sig.find_peaks(df['T_xacc'].to_numpy(), prominence=2)[0])
+    assert not index.has_block('Sitting', 'p1')
+
+
+def test_peak_cache_searches_each_key_once():
+
+    calls = []
+    x = random_signals(0)['walk']
+
+    def values():
+        calls.append(1)
+        return x
+
+    first = peak_cache.get(('test', 'p1', 'a01', 'T_xacc'), values)
+    second = peak_cache.get(('test', 'p1', 'a01', 'T_xacc'), values)
+
+    assert len(calls) == 1
+    assert first is second
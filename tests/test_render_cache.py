@@ -0,0 +1,61 @@
+import plotly.graph_objects as go
+from concurrent.futures import ThreadPoolExecutor
+from matplotlib.figure import Figure
+
+from render_cache import RenderCache, render_panels
+
+
+def test_cache_evicts_by_bytes():
+
+    cache = RenderCache(max_bytes=100)
+    cache.put('a', 'A', 40)
+    cache.put('b', 'B', 40)
+    cache.get('a')
+    cache.put('c', 'C', 40)
+
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c')) == ('A', 'C')
+    assert cache.n_bytes == 80
+
+    # Replacing a value releases its old size
+    cache.put('a', 'A', 10)
+    assert cache.n_bytes == 50
+
+    # A single value larger than the budget is still kept until something replaces it
+    cache.put('d', 'D', 500)
+    assert cache.get('d') == 'D' and len(cache.entries) == 1
+
+
+def line_figure():
+
+    fig = Figure(figsize=(2, 2))
+    fig.subplots().plot([0, 1, 0])
+
+    return "Line", fig
+
+
+def test_only_cache_misses_are_drawn():
+
+    calls = []
+
+    def counted(build):
+        def counted_build():
+            calls.append(build)
+            return build()
+        return counted_build
+
+    panels = {
+        'line': counted(line_figure),
+        'scatter': counted(lambda: ("Scatter", go.Figure(go.Scatter(x=[0, 1], y=[1, 0])))),
+    }
+    cache = RenderCache()
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        rendered = render_panels(panels, cache, pool)
+        again = render_panels(panels, cache, pool)
+
+    assert list(rendered) == ['line', 'scatter']
+    assert rendered['line'][:2] == ("Line", "image") and rendered['line'][2].startswith(b'\x89PNG')
+    assert rendered['scatter'][:2] == ("Scatter", "plotly")
+    assert again == rendered
+    assert len(calls) == 2
+    assert cache.n_bytes == sum(len(payload) for _, _, payload in rendered.values())
@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+from conftest import ACTIVITIES, SAMPLES_PER_SEGMENT, SEGMENTS, SUBJECTS, random_segment, write_segment
+from data_cleaning import DATA_COLUMNS, dataset_version, ingest_parquet
+from segment_search import SEARCH_UNITS, SegmentIndex, build_segment_index, segment_vectors, unit_columns
+
+# Arm swing frequency of each activity, so that segments of one activity move alike
+FREQUENCIES = {'a02': 0.6, 'a05': 2.0, 'a12': 4.0}
+
+
+@pytest.fixture
+def moving_dataset(tmp_path):
+    """
+    Partitioned dataset whose arm channels swing at a frequency that depends only on the activity.
+    """
+
+    rng = np.random.default_rng(0)
+    t = np.arange(SAMPLES_PER_SEGMENT) / 25
+    arms = [DATA_COLUMNS.index(column) for column in unit_columns('Arms')]
+    path = str(tmp_path / 'data')
+    for activity in ACTIVITIES:
+        for subject in SUBJECTS:
+            for segment in SEGMENTS:
+                values = random_segment(rng) * 0.1
+                values[:, arms] += 5 * np.sin(2 * np.pi * FREQUENCIES[activity] * t + rng.uniform(0, 2 * np.pi, size=(len(arms), 1))).T
+                write_segment(path, activity, subject, segment, values)
+
+    output = str(tmp_path / 'dataset')
+    ingest_parquet(path, output, workers=2)
+
+    return output
+
+
+@pytest.mark.parametrize('mode', ['features', 'raw'])
+def test_index_embeds_every_segment_of_every_unit(dataset, tmp_path, mode):
+
+    output = str(tmp_path / 'segments.npz')
+    build_segment_index(dataset, output, mode, dimensions=8, workers=2)
+    index = SegmentIndex(output)
+
+    n_segments = len(ACTIVITIES) * len(SUBJECTS) * len(SEGMENTS)
+    assert index.mode == mode
+    assert index.dataset_version == dataset_version(dataset)
+    assert len(index.labels) == n_segments
+    for unit in SEARCH_UNITS:
+        assert index.arrays[unit].shape == (n_segments, 8)
+        np.testing.assert_allclose(np.linalg.norm(index.arrays[unit], axis=1), 1, rtol=1e-5)
+
+
+def test_raw_vectors_average_the_window_down_to_5_hz():
+
+    windows = np.arange(2 * SAMPLES_PER_SEGMENT * 3, dtype=np.float64).reshape(2, SAMPLES_PER_SEGMENT, 3)
+    vectors = segment_vectors(windows, 'raw')
+
+    assert vectors.shape == (2, 25 * 3)
+    np.testing.assert_allclose(vectors[0, :3], windows[0, :5].mean(axis=0))
+
+
+def test_query_finds_segments_of_the_same_movement(moving_dataset, tmp_path):
+
+    output = str(tmp_path / 'segments.npz')
+    build_segment_index(moving_dataset, output, 'features', workers=2)
+    index = SegmentIndex(output)
+    activity_name = index.labels['activity_name'][index.labels['activity'] == 'a05'].iloc[0]
+
+    matches = index.query('Arms', activity_name, 'p1', 's01', k=5)
+    assert len(matches) == 5
+    assert ('p1', 's01') not in set(zip(matches['subject'], matches['segment']))
+    assert (matches['activity_name'] == activity_name).all()
+    assert np.all(np.diff(matches['similarity']) <= 0)
+
+    excluded = index.query('Arms', activity_name, 'p1', 's01', k=3, exclude_block=True)
+    assert list(excluded['subject']) == ['p2'] * 3
+    assert (excluded['activity_name'] == activity_name).all()
+
+    everything = index.query('Arms', activity_name, 'p1', 's01', k=100)
+    assert len(everything) == len(index.labels) - 1
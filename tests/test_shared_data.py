@@ -0,0 +1,84 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from conftest import ACTIVITIES, SAMPLES_PER_SEGMENT, SEGMENTS, SUBJECTS
+from data_cleaning import DATA_COLUMNS, dataset_version, ingest_csv
+from data_loader import load_selection
+from shared_data import SharedDataset, build_shared_dataset, iter_partition_blocks, open_shared_dataset
+from tensor_store import TensorStore, build_tensor_store
+
+SELECTED_COLUMNS = ['T_xacc', 'LA_zgyro', 'LA_xmag', 'RL_ymag']
+
+
+def test_store_shared_and_parquet_frames_are_identical(dataset, tmp_path):
+
+    build_tensor_store(dataset, str(tmp_path / 'tensor'))
+    store = TensorStore(str(tmp_path / 'tensor'))
+    build_shared_dataset(iter_partition_blocks(dataset), str(tmp_path / 'shared'), 'parquet', dataset_version(dataset))
+    shared = SharedDataset(str(tmp_path / 'shared'))
+
+    assert shared.source == 'parquet'
+    assert shared.n_rows == len(ACTIVITIES) * len(SUBJECTS) * len(SEGMENTS) * SAMPLES_PER_SEGMENT
+    for activity_name in store.activity_names:
+        for subject in SUBJECTS:
+            parquet = load_selection(subject, activity_name, SELECTED_COLUMNS, dataset=dataset).reset_index(drop=True)
+            for df in [store.frame(activity_name, subject, SELECTED_COLUMNS), shared.frame(activity_name, subject, SELECTED_COLUMNS)]:
+                np.testing.assert_array_equal(df[SELECTED_COLUMNS].to_numpy(), parquet[SELECTED_COLUMNS].to_numpy())
+                assert list(df['segment'].astype(str)) == list(parquet['segment'].astype(str))
+                assert list(df['activity'].astype(str)) == list(parquet['activity'].astype(str))
+                assert (df['activity_name'].astype(str) == activity_name).all()
+
+    activity_names = store.activity_names[:2]
+    pd.testing.assert_frame_equal(shared.frames(activity_names, 'p2', SELECTED_COLUMNS)[SELECTED_COLUMNS],
+                                  store.frames(activity_names, 'p2', SELECTED_COLUMNS)[SELECTED_COLUMNS])
+
+
+def test_selections_are_views_of_the_memory_map(dataset, tmp_path):
+
+    build_shared_dataset(iter_partition_blocks(dataset), str(tmp_path / 'shared'))
+    shared = SharedDataset(str(tmp_path / 'shared'))
+
+    values, segment_codes = shared.select('a05', 'p1', ['LA_xacc', 'LA_yacc', 'LA_zacc'])
+    assert values.shape == (len(SEGMENTS) * SAMPLES_PER_SEGMENT, 3)
+    assert not values.flags.writeable
+    assert len(np.unique(segment_codes)) == len(SEGMENTS)
+
+    footprint = shared.memory_footprint()
+    assert footprint['rows'] == shared.n_rows
+    assert footprint['mapped_mb'] * 1024 ** 2 >= shared.n_rows * len(DATA_COLUMNS) * 4
+    assert set(footprint) == {'rows', 'mapped_mb', 'arrow_heap_mb'}
+
+
+def test_csv_copy_is_rebuilt_when_the_csv_changes(raw_data, tmp_path):
+
+    csv_filename = str(tmp_path / 'sports_science_dataset.csv')
+    path = str(tmp_path / 'shared')
+    ingest_csv(raw_data, csv_filename, workers=2)
+
+    shared = open_shared_dataset(path, dataset_version(csv_filename), csv_filename)
+    assert shared.source == 'csv'
+    assert shared.dataset_version == dataset_version(csv_filename)
+    assert shared.n_rows == len(pd.read_csv(csv_filename))
+    assert open_shared_dataset(path, dataset_version(csv_filename), csv_filename) is shared
+
+    # Drop one subject from the csv, as a new export would
+    df = pd.read_csv(csv_filename)
+    df[df['subject'] != 'p2'].to_csv(csv_filename, index=False)
+    os.utime(csv_filename, ns=(os.stat(csv_filename).st_atime_ns, os.stat(csv_filename).st_mtime_ns + 10 ** 9))
+
+    rebuilt = open_shared_dataset(path, dataset_version(csv_filename), csv_filename)
+    assert rebuilt.dataset_version == dataset_version(csv_filename)
+    assert rebuilt.subjects == ['p1']
+    assert rebuilt.n_rows == shared.n_rows // 2
+
+
+def test_stale_copy_is_not_served_without_a_csv(dataset, tmp_path):
+
+    path = str(tmp_path / 'shared')
+    build_shared_dataset(iter_partition_blocks(dataset), path, 'parquet', dataset_version(dataset))
+
+    assert open_shared_dataset(path, dataset_version(dataset)).n_rows > 0
+    assert open_shared_dataset(path, 'an earlier ingest') is None
+    assert open_shared_dataset(str(tmp_path / 'missing'), dataset_version(dataset)) is None
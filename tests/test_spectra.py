@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import ACTIVITIES, SUBJECTS
+from data_cleaning import DATA_COLUMNS, dataset_version, partition_path
+from spectra import CADENCE_BAND, SAMPLING_RATE, WELCH_SAMPLES, SpectraIndex, block_spectra, build_spectra, \
+    dominant_frequency
+
+
+@pytest.mark.parametrize('edge', CADENCE_BAND)
+def test_peak_on_a_band_edge_keeps_strength_within_bounds(edge):
+
+    frequencies = np.fft.rfftfreq(WELCH_SAMPLES, d=1 / SAMPLING_RATE)
+    psd = np.full((len(frequencies), 3), 1e-6)
+    position = np.argmin(np.abs(frequencies - edge))
+    # A lone spike, a spike with power just outside the band, and a spike with power just inside it
+    psd[position, :] = 1
+    psd[position - 1, 1] = psd[position + 1, 1] = 0.8
+    psd[position + (1 if edge == CADENCE_BAND[0] else -1), 2] = 0.5
+
+    dominant, strength = dominant_frequency(frequencies, psd)
+
+    np.testing.assert_allclose(dominant, edge)
+    assert np.all((strength >= 0) & (strength <= 1))
+    assert strength[0] == pytest.approx(1, abs=1e-3)
+
+
+def test_cadence_of_a_sine():
+
+    rng = np.random.default_rng(0)
+    t = np.arange(60 * SAMPLING_RATE) / SAMPLING_RATE
+    values = np.column_stack([np.sin(2 * np.pi * 1.73 * t), 0.5 * np.sin(2 * np.pi * 0.85 * t)]) + rng.normal(scale=0.1, size=(len(t), 2))
+
+    frequencies, psd = block_spectra(values)
+    dominant, strength = dominant_frequency(frequencies, psd)
+
+    assert psd.shape == (WELCH_SAMPLES // 2 + 1, 2)
+    np.testing.assert_allclose(dominant, [1.73, 0.85], atol=0.02)
+    assert np.all((strength > 0.5) & (strength <= 1))
+
+
+def test_flat_or_short_signals_have_no_cadence():
+
+    frequencies, psd = block_spectra(np.zeros((SAMPLING_RATE, 2)))
+    dominant, strength = dominant_frequency(frequencies, psd)
+    assert np.isnan(dominant).all() and np.isnan(strength).all()
+
+    frequencies, psd = block_spectra(np.zeros((1, 2)))
+    assert np.isnan(dominant_frequency(frequencies, psd)[0]).all()
+
+
+def test_index_matches_the_partition_spectra(dataset, tmp_path):
+
+    output = str(tmp_path / 'spectra.npz')
+    build_spectra(dataset, output, workers=2)
+    index = SpectraIndex(output)
+    columns = ['LA_xacc', 'LA_yacc', 'LA_zacc']
+
+    assert index.dataset_version == dataset_version(dataset)
+    for activity, activity_name in zip(ACTIVITIES, index.activity_names):
+        values = pd.read_parquet(partition_path(dataset, activity, 'p2'), columns=columns).to_numpy()
+        frequencies, psd = index.spectra(activity_name, 'p2', columns)
+        np.testing.assert_allclose(psd, block_spectra(values)[1], rtol=1e-5)
+
+    cadences = index.cadences('p1', columns)
+    assert list(cadences['activity_name']) == index.activity_names
+    np.testing.assert_allclose(cadences['cadence'], cadences['frequency'] * 60)
+    assert cadences['strength'].between(0, 1).all()
+    assert len(index.subjects) == len(SUBJECTS) and index.columns == DATA_COLUMNS
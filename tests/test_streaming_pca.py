@@ -0,0 +1,84 @@
+import pickle
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.decomposition import PCA
+from sklearn.preprocessing import StandardScaler
+
+from conftest import ACTIVITIES, SAMPLES_PER_SEGMENT, SEGMENTS, SUBJECTS
+from data_cleaning import DATA_COLUMNS, partition_path
+from streaming_pca import StreamingPCA, build_pca, iter_sample_chunks
+
+
+def correlated_rows(seed, n_rows=2000, n_columns=8):
+    """
+    Rows with correlated columns of very different scales and offsets, like accelerometer, gyroscope and
+    magnetometer channels.
+    """
+
+    rng = np.random.default_rng(seed)
+    mixing = rng.normal(size=(n_columns, n_columns))
+    scales = 10.0 ** rng.uniform(-2, 2, n_columns)
+
+    return (rng.normal(size=(n_rows, n_columns)) @ mixing) * scales + rng.normal(scale=50, size=n_columns)
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_merged_chunks_match_sklearn(seed):
+
+    X = correlated_rows(seed)
+    # Uneven chunks, including a single row, so every merge path of the pairwise update is used
+    bounds = [0, 1, 150, 151, 900, 1400, len(X)]
+
+    pca = StreamingPCA(n_components=3)
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        pca.partial_fit(X[start:end])
+
+    scaler = StandardScaler().fit(X)
+    expected = PCA(n_components=3, svd_solver='full').fit(scaler.transform(X))
+
+    assert pca.n_samples_seen_ == len(X)
+    np.testing.assert_allclose(pca.mean_, scaler.mean_, rtol=1e-9)
+    np.testing.assert_allclose(pca.scale_, scaler.scale_, rtol=1e-9)
+    np.testing.assert_allclose(pca.explained_variance_ratio_, expected.explained_variance_ratio_, rtol=1e-8)
+    np.testing.assert_allclose(pca.explained_variance_, expected.explained_variance_, rtol=1e-8)
+
+    # Components are only defined up to their sign
+    signs = np.sign((pca.components_ * expected.components_).sum(axis=1))
+    np.testing.assert_allclose(pca.components_ * signs[:, None], expected.components_, atol=1e-8)
+    np.testing.assert_allclose(pca.transform(X) * signs, expected.transform(scaler.transform(X)), atol=1e-6)
+
+
+def test_chunking_does_not_change_the_fit():
+
+    X = correlated_rows(0)
+
+    whole = StreamingPCA(n_components=3).partial_fit(X)
+    chunked = StreamingPCA(n_components=3)
+    for chunk in np.array_split(X, 7):
+        chunked.partial_fit(chunk)
+
+    np.testing.assert_allclose(chunked.components_, whole.components_, atol=1e-10)
+    np.testing.assert_allclose(chunked.explained_variance_ratio_, whole.explained_variance_ratio_, rtol=1e-10)
+
+
+def test_cohort_pca_streams_every_partition(dataset, tmp_path):
+
+    chunks = list(iter_sample_chunks(dataset, chunk_partitions=4))
+    assert [len(chunk) for chunk in chunks] == [n * len(SEGMENTS) * SAMPLES_PER_SEGMENT for n in (4, 2)]
+    assert set(pd.concat(chunks)['subject']) == set(SUBJECTS)
+
+    output, projection_output = str(tmp_path / 'pca.pkl'), str(tmp_path / 'pca.parquet')
+    build_pca(dataset, output, projection_output, n_components=3, chunk_partitions=4)
+    with open(output, 'rb') as f:
+        pca = pickle.load(f)['pca']
+
+    X = np.concatenate([pd.read_parquet(partition_path(dataset, activity, subject), columns=DATA_COLUMNS).to_numpy()
+                        for activity in ACTIVITIES for subject in SUBJECTS]).astype(np.float64)
+    expected = PCA(n_components=3).fit(StandardScaler().fit_transform(X))
+    np.testing.assert_allclose(pca.explained_variance_ratio_, expected.explained_variance_ratio_, rtol=1e-5)
+
+    projection = pd.read_parquet(projection_output)
+    assert list(projection.columns) == ['activity_name', 'subject', 'PC1', 'PC2', 'PC3']
+    assert len(projection) == len(X)
@@ -0,0 +1,77 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import ACTIVITIES, SEGMENTS, SUBJECTS, random_segment, write_segment
+from data_cleaning import DATA_COLUMNS, dataset_version, ingest_parquet, is_current, partition_path
+from tensor_store import TensorStore, build_tensor_store
+
+
+def test_frames_match_the_parquet_partitions(dataset, tmp_path):
+
+    output = str(tmp_path / 'tensor')
+    build_tensor_store(dataset, output)
+    store = TensorStore(output)
+
+    assert store.activities == ACTIVITIES
+    assert store.subjects == SUBJECTS
+    for activity in ACTIVITIES:
+        for subject in SUBJECTS:
+            partition = pd.read_parquet(partition_path(dataset, activity, subject))
+            df = store.frame(activity, subject)
+
+            np.testing.assert_array_equal(df[DATA_COLUMNS].to_numpy(), partition[DATA_COLUMNS].to_numpy())
+            assert list(df['segment']) == list(partition['segment'].astype(str))
+            assert (df['activity_name'] == partition['activity_name'].astype(str)).all()
+            assert store.segments(activity, subject) == SEGMENTS
+
+
+def test_contiguous_columns_are_sliced_without_copying(dataset, tmp_path):
+
+    output = str(tmp_path / 'tensor')
+    build_tensor_store(dataset, output)
+    store = TensorStore(output)
+
+    block = store.select('a05', 'p2', ['LA_xacc', 'LA_yacc', 'LA_zacc'])
+    assert block.shape == (len(SEGMENTS), 125, 3)
+    assert np.shares_memory(block, store.tensor)
+
+    df = store.frames([store.activity_names[0], 'a12'], 'p1', ['T_xacc', 'RA_xacc'])
+    assert list(df['activity'].unique()) == ['a02', 'a12']
+    assert len(df) == 2 * len(SEGMENTS) * 125
+
+
+def test_empty_dataset_is_rejected(tmp_path):
+
+    os.makedirs(tmp_path / 'dataset')
+
+    with pytest.raises(ValueError, match='No activity/subject partitions'):
+        build_tensor_store(str(tmp_path / 'dataset'), str(tmp_path / 'tensor'))
+
+
+def test_truncated_segment_is_rejected(raw_data, tmp_path):
+
+    write_segment(raw_data, 'a05', 'p1', 's02', random_segment(np.random.default_rng(1), rows=100))
+    ingest_parquet(raw_data, str(tmp_path / 'dataset'), workers=2)
+
+    with pytest.raises(ValueError, match='Activity: a05, Subject: p1, Segment: s02 has 100 rows'):
+        build_tensor_store(str(tmp_path / 'dataset'), str(tmp_path / 'tensor'))
+    with pytest.raises(FileNotFoundError):
+        TensorStore(str(tmp_path / 'tensor'))
+
+
+def test_store_goes_stale_after_a_reingest(raw_data, dataset, tmp_path):
+
+    output = str(tmp_path / 'tensor')
+    build_tensor_store(dataset, output)
+    store = TensorStore(output)
+
+    assert store.dataset_version == dataset_version(dataset)
+    assert is_current(store.dataset_version, dataset_version(dataset))
+
+    write_segment(raw_data, 'a02', 'p1', 's04', random_segment(np.random.default_rng(1)))
+    ingest_parquet(raw_data, dataset, workers=2)
+
+    assert not is_current(store.dataset_version, dataset_version(dataset))
+    assert is_current(store.dataset_version, None)
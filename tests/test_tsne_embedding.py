@@ -0,0 +1,54 @@
+import os
+
+import numpy as np
+from sklearn.manifold import TSNE
+
+from tsne_embedding import iterations_parameter, pca_init, stratified_subsample, tsne_embeddings
+
+
+def labelled_blobs(rows_per_label=40):
+
+    rng = np.random.default_rng(0)
+    y = np.repeat(['a', 'b', 'c'], rows_per_label)
+    X = rng.normal(size=(len(y), 5)).astype(np.float32)
+    X[:, 0] += 4 * np.repeat(np.arange(3), rows_per_label)
+
+    return X, y
+
+
+def test_stratified_subsample_keeps_the_label_proportions():
+
+    y = np.repeat(['a', 'b'], [300, 100])
+    rows = stratified_subsample(y, 100)
+
+    assert len(rows) == 100
+    assert np.all(np.diff(rows) > 0)
+    assert (y[rows] == 'a').sum() == 75
+    assert len(stratified_subsample(y, None)) == 400
+
+
+def test_shared_graph_matches_a_from_scratch_fit(tmp_path):
+
+    X, y = labelled_blobs()
+    embeddings = tsne_embeddings(X, y, [5, 10], n_iter=250, cache=str(tmp_path))
+
+    for perplexity in [5, 10]:
+        tsne = TSNE(n_components=2, perplexity=perplexity, learning_rate="auto", init=pca_init(X), random_state=0,
+                    **{iterations_parameter(): 250})
+        expected = tsne.fit_transform(X)
+        np.testing.assert_allclose(embeddings[perplexity][["x", "y"]].to_numpy(), expected, rtol=1e-3, atol=1e-3)
+        assert list(embeddings[perplexity]["activity"]) == list(y)
+
+
+def test_embeddings_are_read_back_from_the_cache(tmp_path):
+
+    X, y = labelled_blobs()
+    first = tsne_embeddings(X, y, [5], n_iter=250, cache=str(tmp_path))
+    [folder] = os.listdir(tmp_path)
+    cached = sorted(os.listdir(tmp_path / folder))
+    assert cached == ['embedding_perplexity_5_iter_250.npy', 'knn_16.npz', 'pca_init.npy']
+
+    mtime = os.path.getmtime(tmp_path / folder / 'embedding_perplexity_5_iter_250.npy')
+    second = tsne_embeddings(X, y, [5], n_iter=250, cache=str(tmp_path))
+    assert os.path.getmtime(tmp_path / folder / 'embedding_perplexity_5_iter_250.npy') == mtime
+    np.testing.assert_array_equal(first[5].to_numpy(), second[5].to_numpy())
@@ -0,0 +1,191 @@
+import argparse
+import hashlib
+import os
+from os.path import join
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.decomposition import PCA
+from sklearn.manifold import TSNE
+from sklearn.model_selection import train_test_split
+from sklearn.neighbors import NearestNeighbors
+
+from data_cleaning import DATA_COLUMNS, DATASET_NAME
+from data_loader import dataset_activity_names, load_selection
+from features import LABEL_COLUMNS
+
+TSNE_CACHE_NAME = 'sports_science_tsne'
+RANDOM_SEED = 0
+
+
+def load_tsne_data(subject, activity_names, dataset=DATASET_NAME, features_path=None):
+    """
+    Rows to embed for one subject and its activities: the raw 25 Hz samples, or one row of window features per
+    5 second segment from the feature matrix written by features.py.
+
+    Returns:
+        X = (rows, features) float32 array
+        y = activity name of each row
+    """
+
+    if features_path is None:
+        df = load_selection(subject, activity_names, dataset=dataset)
+        X = df[DATA_COLUMNS]
+    else:
+        df = pd.read_parquet(features_path)
+        df = df[(df["subject"].astype(str) == subject) & (df["activity_name"].isin(activity_names))]
+        X = df.drop(columns=LABEL_COLUMNS)
+
+    return X.to_numpy(np.float32), df["activity_name"].astype(str).to_numpy()
+
+
+def array_hash(*arrays):
+    """
+    Short hash of the contents of several arrays, used to key the on-disk cache.
+    """
+
+    digest = hashlib.sha1()
+    for values in arrays:
+        values = np.ascontiguousarray(values)
+        digest.update(str((values.dtype, values.shape)).encode())
+        digest.update(values.tobytes() if values.dtype != object else values.astype(str).tobytes())
+
+    return digest.hexdigest()[:16]
+
+
+def stratified_subsample(y, max_rows, seed=RANDOM_SEED):
+    """
+    Row positions of a sample of at most max_rows rows that keeps the activity proportions.
+
+    Args:
+        y = activity labels
+        max_rows = number of rows to keep, or None to keep every row
+        seed = random seed
+    Returns:
+        rows = sorted row positions
+    """
+
+    rows = np.arange(len(y))
+    if max_rows is None or max_rows >= len(y):
+        return rows
+
+    rows, _ = train_test_split(rows, train_size=max_rows, stratify=y, random_state=seed)
+
+    return np.sort(rows)
+
+
+def neighbor_graph(X, n_neighbors):
+    """
+    Sparse kNN graph of euclidean distances, the same graph TSNE builds internally for metric="euclidean".
+    A graph built for the largest perplexity serves every smaller one, since TSNE only reads the nearest
+    3 x perplexity + 1 neighbors of each row from it.
+    """
+
+    # TSNE drops the first neighbor of each row of a precomputed graph as the row itself, so it is kept in
+    return NearestNeighbors(n_neighbors=n_neighbors + 1).fit(X).kneighbors_graph(X, mode='distance')
+
+
+def pca_init(X, seed=RANDOM_SEED):
+    """
+    PCA initialization of the embedding, rescaled the same way as TSNE(init="pca").
+    """
+
+    embedding = PCA(n_components=2, random_state=seed).fit_transform(X).astype(np.float32)
+
+    return embedding / np.std(embedding[:, 0]) * 1e-4
+
+
+def iterations_parameter():
+    """
+    Name of the TSNE iteration count parameter, which newer scikit-learn versions renamed to max_iter.
+    """
+
+    return 'max_iter' if 'max_iter' in TSNE().get_params() else 'n_iter'
+
+
+def tsne_embeddings(X, y, perplexities, n_iter=1000, max_rows=None, cache=TSNE_CACHE_NAME, seed=RANDOM_SEED):
+    """
+    Embeds the rows with t-SNE at several perplexities. The kNN graph (for the largest perplexity) and the PCA
+    initialization are computed once and shared by every perplexity, and the graph, initialization and each
+    embedding are cached on disk keyed by a hash of the data and parameters, so that replotting or rerunning
+    the sweep does not refit.
+
+    Args:
+        X = (rows, features) array, e.g. raw samples or per-segment window features
+        y = activity label of each row
+        perplexities = list of perplexities
+        n_iter = optimization iterations
+        max_rows = optional number of rows to subsample, stratified by activity
+        cache = cache folder
+        seed = random seed of the subsample, PCA and t-SNE
+    Returns:
+        embeddings = dictionary of perplexity to a dataframe of x, y and activity, in the order of perplexities
+    """
+
+    X = np.asarray(X, dtype=np.float32)
+    y = np.asarray(y)
+    rows = stratified_subsample(y, max_rows, seed)
+    X, y = X[rows], y[rows]
+
+    folder = join(cache, array_hash(X, y, np.array([seed])))
+    os.makedirs(folder, exist_ok=True)
+
+    n_neighbors = min(len(X) - 1, int(3 * max(perplexities) + 1))
+    graph_path = join(folder, f'knn_{n_neighbors}.npz')
+    graph = None
+    init_path = join(folder, 'pca_init.npy')
+    if os.path.exists(init_path):
+        init = np.load(init_path)
+    else:
+        init = pca_init(X, seed)
+        np.save(init_path, init)
+
+    embeddings = {}
+    for perplexity in perplexities:
+        path = join(folder, f'embedding_perplexity_{perplexity}_iter_{n_iter}.npy')
+
+        if os.path.exists(path):
+            embedding = np.load(path)
+        else:
+            if graph is None:
+                if os.path.exists(graph_path):
+                    graph = sparse.load_npz(graph_path)
+                else:
+                    graph = neighbor_graph(X, n_neighbors)
+                    sparse.save_npz(graph_path, graph)
+
+            tsne = TSNE(n_components=2, perplexity=perplexity, learning_rate="auto", metric="precomputed", init=init,
+                        verbose=1, random_state=seed, **{iterations_parameter(): n_iter})
+            embedding = tsne.fit_transform(graph)
+            np.save(path, embedding)
+
+        embeddings[perplexity] = pd.DataFrame({"x": embedding[:, 0], "y": embedding[:, 1], "activity": y})
+
+    return embeddings
+
+
+def parse_args():
+
+    parser = argparse.ArgumentParser(description="t-SNE perplexity sweep with a shared kNN graph and cached embeddings.")
+    parser.add_argument('--dataset', default=DATASET_NAME, help="Root folder of the partitioned dataset")
+    parser.add_argument('--features', default=None, help="Embed the per-segment feature matrix written by features.py instead of raw samples")
+    parser.add_argument('--subject', default='p1', help="Subject to embed")
+    parser.add_argument('--activities', nargs='+', default=None, help="Activity names to embed (default: all)")
+    parser.add_argument('--perplexities', nargs='+', type=float, default=[5, 15, 30, 40, 45, 50], help="Perplexities to sweep")
+    parser.add_argument('--n-iter', type=int, default=1000, help="Optimization iterations")
+    parser.add_argument('--max-rows', type=int, default=None, help="Stratified subsample size")
+    parser.add_argument('--cache', default=TSNE_CACHE_NAME, help="Cache folder")
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+
+    args = parse_args()
+    activities = args.activities or dataset_activity_names(args.dataset)
+    X, y = load_tsne_data(args.subject, activities, args.dataset, args.features)
+
+    perplexities = [int(p) if p.is_integer() else p for p in args.perplexities]
+    tsne_embeddings(X, y, perplexities, args.n_iter, args.max_rows, args.cache)
+    print("Completed!")